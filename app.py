@@ -1,21 +1,34 @@
-import requests
 from flask import Flask, request, make_response, render_template, redirect, url_for, jsonify
 import hashlib
+import math
 import time
 import mysql.connector
 import random
 import re
 import os
+import queue
 import xml.etree.ElementTree as ET
-from collections import defaultdict
+from array import array
+from bisect import bisect_left
+from collections import defaultdict, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
+from mysql.connector.pooling import MySQLConnectionPool
 from dotenv import load_dotenv
-from get_reading_history import get_reading_history
+from get_reading_history import LatencyStats, get_client
+from content_index import ContentIndex
+from cooccurrence_index import CoBorrowIndex
+import queries
+from wechat_client import WeChatClient
+from session_store import open_reply_store, open_session_store
 import threading
 from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime, timedelta
 import json
-from flask import session
+from flask import session, g, has_app_context
 
 # 加载环境变量
 load_dotenv()
@@ -28,6 +41,8 @@ WECHAT_TOKEN = os.getenv('WECHAT_TOKEN', '')
 # 微信公众号凭证
 WECHAT_APPID = os.getenv('WECHAT_APPID', '')
 WECHAT_SECRET = os.getenv('WECHAT_SECRET', '')
+# 微信接口客户端（access_token 跨进程缓存，连接复用）
+wechat = WeChatClient(WECHAT_APPID, WECHAT_SECRET)
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
     'user': os.getenv('DB_USER', ''),
@@ -36,12 +51,186 @@ DB_CONFIG = {
 }
 REDIRECT_URI = os.getenv('REDIRECT_URI', 'https://yourdomain.com/wechat_redirect')
 CREATE_MENU = True
+# 批量 IN 查询 / 多行插入的分块大小
+BULK_CHUNK_SIZE = 1000
+# 定时推送每批处理的读者数
+PUSH_BATCH_SIZE = int(os.getenv('PUSH_BATCH_SIZE', 500))
+# 交互式推荐中访问汇文接口的时间预算（秒）
+HISTORY_FETCH_BUDGET = float(os.getenv('HISTORY_FETCH_BUDGET', 3))
+# 慢指令（推荐）先回复确认消息，由后台线程计算后通过客服消息发送
+ASYNC_REPLY = os.getenv('ASYNC_REPLY', 'False') == 'True'
+# 定时推送的并发线程数，以及发送客服消息的全局限速（条/秒，多个分片平分）
+PUSH_WORKERS = int(os.getenv('PUSH_WORKERS', 8))
+PUSH_RATE_LIMIT = float(os.getenv('PUSH_RATE_LIMIT', 20))
+# 定时推送按读者证号哈希分片，每台主机设置不同的 PUSH_SHARD_INDEX，各分片由各自的推送主节点同时处理
+PUSH_SHARD_COUNT = int(os.getenv('PUSH_SHARD_COUNT', 1))
+PUSH_SHARD_INDEX = int(os.getenv('PUSH_SHARD_INDEX', 0))
+# 主节点当选时及之后每隔一段时间（分钟），继续最近几天内未完成（中途出错或进程退出）的推送批次
+PUSH_RESUME_DAYS = int(os.getenv('PUSH_RESUME_DAYS', 3))
+PUSH_RESUME_INTERVAL = int(os.getenv('PUSH_RESUME_INTERVAL', 60))
+# 定时推送时跳过画像无变化的读者
+SKIP_UNCHANGED_PROFILES = os.getenv('SKIP_UNCHANGED_PROFILES', 'True') == 'True'
 DEBUG = True
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'a_default_very_secret_key_that_should_be_changed')
+# ====================== 缓存 ======================
+class TTLCache:
+    """带过期时间的有界 LRU 缓存（线程安全），记录命中/未命中次数"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()  # {key: (过期时间, value)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def get_or_set(self, key, factory):
+        """原子地读取或写入，返回 (value, 是否新写入)"""
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.data.move_to_end(key)
+                self.hits += 1
+                return entry[1], False
+            self.misses += 1
+            value = factory()
+            self.data[key] = (time.monotonic() + self.ttl, value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+            return value, True
+
+    def pop(self, key):
+        with self.lock:
+            entry = self.data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses}
+
+
+# ====================== 异步回复 ======================
+class ReplyWorkerPool:
+    """
+    慢指令的后台回复队列
+    被动回复先返回确认消息，固定数量的工作线程计算结果后调用 deliver(openid, content) 发送；
+    同一任务排队或执行中时不重复入队；队列满时拒绝入队，由调用方回复稍后重试。
+    """
+
+    def __init__(self, deliver, workers=4, maxsize=1000):
+        self.deliver = deliver
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.wait_stats = LatencyStats()  # 入队到开始执行
+        self.run_stats = LatencyStats()  # 计算并发送
+
+    def submit(self, key, openid, task):
+        """
+        提交任务，task() 返回要发送的回复内容
+        :return: 是否已在队列中（新入队或重复提交），False 表示队列已满
+        """
+        with self.lock:
+            if key in self.pending:
+                return True
+            if not self.threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self.run, name=f'reply-worker-{i}', daemon=True)
+                    thread.start()
+                    self.threads.append(thread)
+            try:
+                self.queue.put_nowait((key, openid, task, time.monotonic()))
+            except queue.Full:
+                self.rejected += 1
+                return False
+            self.pending.add(key)
+            return True
+
+    def run(self):
+        while True:
+            key, openid, task, enqueued_at = self.queue.get()
+            start = time.monotonic()
+            self.wait_stats.record(start - enqueued_at)
+            with self.lock:
+                self.active += 1
+
+            ok = False
+            try:
+                content = task()
+                if content:
+                    self.deliver(openid, content)
+                ok = True
+            except Exception as e:
+                app.logger.error(f"后台回复任务 {key} 出错: {str(e)}")
+            finally:
+                self.run_stats.record(time.monotonic() - start, ok)
+                with self.lock:
+                    self.active -= 1
+                    self.completed += 1 if ok else 0
+                    self.failed += 0 if ok else 1
+                    self.pending.discard(key)
+                self.queue.task_done()
+
+    def stats(self):
+        with self.lock:
+            counters = {
+                'queued': self.queue.qsize(),
+                'active': self.active,
+                'workers': len(self.threads),
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
+        counters['wait'] = self.wait_stats.snapshot()
+        counters['run'] = self.run_stats.snapshot()
+        return counters
+
+
 # ====================== 图书推荐系统核心 ======================
+def chunked(items, size):
+    """把列表按 size 切块"""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
 class CallNumberParser:
-    def __init__(self):
+    def __init__(self, cache_size=65536):
         self.class_set = self.build_class_set()
+        # 馆藏索书号的预计算分类 {索书号: (大类, 子类)}，由 precompute 填充
+        self.catalog_classes = {}
+        # 其余索书号（如借阅记录）走有界 LRU 缓存
+        self.cached_classify = lru_cache(maxsize=cache_size)(self.classify)
 
     def build_class_set(self):
         class_set = set()
@@ -60,6 +249,26 @@ class CallNumberParser:
         if not callno or not isinstance(callno, str):
             return None, None
 
+        result = self.catalog_classes.get(callno)
+        if result is None:
+            result = self.cached_classify(callno)
+        return result
+
+    def parse_many(self, callnos):
+        """批量解析，相同索书号只解析一次，按输入顺序返回 [(大类, 子类), ...]"""
+        results = {}
+        for callno in callnos:
+            if callno not in results:
+                results[callno] = self.parse_callno(callno)
+        return [results[callno] for callno in callnos]
+
+    def precompute(self, callnos):
+        """预先计算一批馆藏索书号的分类并常驻内存，不占用 LRU 缓存"""
+        for callno in set(callnos):
+            if callno and isinstance(callno, str) and callno not in self.catalog_classes:
+                self.catalog_classes[callno] = self.classify(callno)
+
+    def classify(self, callno):
         parts = callno.split('\\')
         class_part = parts[0].strip() if parts else callno
         clean_class = ''.join(c for c in class_part if c.isalnum())
@@ -91,14 +300,15 @@ class ReadingHistoryProcessor:
         subclass_freq = defaultdict(int)
         reader_id = None
 
-        for item in history_items:
-            callno = item.get("callNo", "")
+        callnos = [item.get("callNo", "") for item in history_items]
+        parsed = self.parser.parse_many(callnos)
+
+        for item, callno, (main_class, subclass) in zip(history_items, callnos, parsed):
             seen_books.add(callno)
 
             if reader_id is None:
                 reader_id = item.get("readerId", "")
 
-            main_class, subclass = self.parser.parse_callno(callno)
             if not main_class:
                 continue
 
@@ -107,230 +317,1223 @@ class ReadingHistoryProcessor:
 
         return reader_id, seen_books, dict(class_freq), dict(subclass_freq)
 
+    def loan_key(self, item):
+        """借阅记录的水位标识"""
+        return f"{item.get('callNo', '')}|{item.get('loanDate', '')}"
+
+
+class ReaderProfileStore:
+    """
+    读者兴趣画像（reader_profiles 表）
+    持久化 class_freq / subclass_freq 频次向量，以及最后一条已折入借阅记录的水位。
+    借阅历史按时间倒序返回，新历史到来时只折入水位之前的新记录。
+    水位为 索书号|借阅日期（同一本书再次借阅时借阅日期不同）。
+    """
+
+    def __init__(self, history_processor):
+        self.history_processor = history_processor
+
+    def empty_profile(self):
+        return {
+            'class_freq': {},
+            'subclass_freq': {},
+            'last_loan_key': None,
+            'loan_count': 0,
+            'changed_at': None,
+            'pushed_at': None,
+        }
+
+    def load(self, cursor, reader_id):
+        return self.load_many(cursor, [reader_id]).get(reader_id)
+
+    def load_many(self, cursor, reader_ids):
+        """批量加载画像，返回 {reader_id: 画像}，没有画像的读者不在结果中"""
+        profiles = {}
+        for chunk in chunked(reader_ids, BULK_CHUNK_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(queries.READER_PROFILES_BY_READERS.format(placeholders=placeholders), tuple(chunk))
+            for row in cursor.fetchall():
+                profiles[row['reader_id']] = {
+                    'class_freq': json.loads(row['class_freq']),
+                    'subclass_freq': {(m, s): n for m, s, n in json.loads(row['subclass_freq'])},
+                    'last_loan_key': row['last_loan_key'],
+                    'loan_count': row['loan_count'],
+                    'changed_at': row['changed_at'],
+                    'pushed_at': row['pushed_at'],
+                }
+        return profiles
+
+    def save(self, cursor, reader_id, profile):
+        self.save_many(cursor, [(reader_id, profile)])
+
+    def save_many(self, cursor, items):
+        """批量写回有变化的画像 [(reader_id, 画像), ...]，changed_at 记为数据库当前时间"""
+        for chunk in chunked(items, BULK_CHUNK_SIZE):
+            cursor.executemany("""
+                INSERT INTO reader_profiles
+                (reader_id, class_freq, subclass_freq, last_loan_key, loan_count, changed_at)
+                VALUES (%s, %s, %s, %s, %s, NOW())
+                ON DUPLICATE KEY UPDATE
+                class_freq = VALUES(class_freq),
+                subclass_freq = VALUES(subclass_freq),
+                last_loan_key = VALUES(last_loan_key),
+                loan_count = VALUES(loan_count),
+                changed_at = VALUES(changed_at)
+            """, [(
+                reader_id,
+                json.dumps(profile['class_freq'], ensure_ascii=False),
+                json.dumps([[m, s, n] for (m, s), n in profile['subclass_freq'].items()], ensure_ascii=False),
+                profile['last_loan_key'],
+                profile['loan_count']
+            ) for reader_id, profile in chunk])
+
+    def mark_pushed(self, cursor, reader_ids):
+        for chunk in chunked(reader_ids, BULK_CHUNK_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(
+                f"UPDATE reader_profiles SET pushed_at = NOW() WHERE reader_id IN ({placeholders})",
+                tuple(chunk)
+            )
+
+    def watermark(self, item):
+        return self.history_processor.loan_key(item)
+
+    def fold(self, profile, history_items):
+        """把水位之后的新借阅折入画像，返回是否有变化"""
+        last_key = profile['last_loan_key']
+        new_items = []
+        for item in history_items:
+            if self.watermark(item) == last_key:
+                break
+            new_items.append(item)
+
+        if not new_items:
+            return False
+
+        _, _, class_delta, subclass_delta = self.history_processor.process_history(new_items)
+        for main_class, n in class_delta.items():
+            profile['class_freq'][main_class] = profile['class_freq'].get(main_class, 0) + n
+        for key, n in subclass_delta.items():
+            profile['subclass_freq'][key] = profile['subclass_freq'].get(key, 0) + n
+
+        profile['last_loan_key'] = self.watermark(new_items[0])
+        profile['loan_count'] += len(new_items)
+        # 变化时间在写回时由数据库记为 NOW()，与 pushed_at 使用同一时钟
+        profile['changed_at'] = None
+        return True
+
+    def is_unchanged_since_push(self, profile):
+        """画像非空且上次推送后没有新的借阅"""
+        return bool(
+            profile['loan_count']
+            and profile['pushed_at']
+            and profile['changed_at']
+            and profile['changed_at'] <= profile['pushed_at']
+        )
+
+
+class LoanHistoryStore:
+    """
+    本地借阅历史（loan_history 表），按 (读者, 借阅记录) 去重
+    汇文接口按时间倒序分页返回借阅记录，同步时只取最新的几页，遇到已保存的记录即停止；
+    新记录按从旧到新的顺序插入，自增 id 与借阅先后一致，读取时按 id 倒序即为最新在前。
+    loan_history_sync 表记录每位读者最新一条记录的水位和同步时间，间隔内不再访问汇文接口。
+    """
+
+    def __init__(self, history_processor, sync_interval=600, page_size=20, max_pages=20, limit=500):
+        self.history_processor = history_processor
+        self.sync_interval = sync_interval  # 两次同步的最小间隔（秒）
+        self.page_size = page_size
+        self.max_pages = max_pages  # 首次同步最多获取的页数
+        self.limit = limit  # 每位读者读取的最近借阅数
+
+    def sync_states(self, cursor, reader_ids):
+        """返回 {reader_id: (最新记录水位, 同步时间)}"""
+        states = {}
+        for chunk in chunked(reader_ids, BULK_CHUNK_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(queries.LOAN_SYNC_STATES.format(placeholders=placeholders), tuple(chunk))
+            for row in cursor.fetchall():
+                states[row['reader_id']] = (row['newest_key'], row['synced_at'])
+        return states
+
+    def is_due(self, state):
+        if state is None or state[1] is None:
+            return True
+        return state[1] <= datetime.now() - timedelta(seconds=self.sync_interval)
+
+    def fetch_new(self, reader_id, newest_key, deadline=None):
+        """
+        从汇文接口获取水位之后的新借阅（最新在前）
+        先取第一页：增量同步通常在第一页就遇到水位；否则（首次同步或积压较多）按 total 并发获取其余页。
+        中途请求失败、超出截止时间或接口熔断时返回 None，避免留下缺口
+        """
+        client = get_client()
+        first = client.fetch_loan_page(reader_id, 0, 1, self.page_size, deadline)
+        if first is None:
+            return None
+
+        new_items = []
+        if self.collect_new(client, reader_id, first, newest_key, new_items):
+            return new_items
+
+        last_page = min(self.max_pages, math.ceil(first.get('total', 0) / self.page_size))
+        pages = client.fetch_loan_pages(reader_id, 0, range(2, last_page + 1), self.page_size, deadline)
+        for page_no in range(2, last_page + 1):
+            page = pages.get(page_no)
+            if page is None:
+                return None
+            if self.collect_new(client, reader_id, page, newest_key, new_items):
+                break
+        return new_items
+
+    def collect_new(self, client, reader_id, page, newest_key, new_items):
+        """把一页中水位之前的记录加入 new_items，遇到水位或空页时返回 True"""
+        loans = page.get('items', [])
+        for item in client.to_loans(reader_id, loans):
+            if self.history_processor.loan_key(item) == newest_key:
+                return True
+            new_items.append(item)
+        return not loans
+
+    def save_new(self, cursor, reader_id, new_items, newest_key):
+        """保存新借阅并更新同步水位"""
+        if new_items:
+            cursor.executemany("""
+                INSERT IGNORE INTO loan_history (reader_id, loan_key, call_no, loan_date)
+                VALUES (%s, %s, %s, %s)
+            """, [(
+                reader_id,
+                self.history_processor.loan_key(item),
+                item.get('callNo', ''),
+                item.get('loanDate', '')
+            ) for item in reversed(new_items)])
+            newest_key = self.history_processor.loan_key(new_items[0])
+
+        cursor.execute("""
+            INSERT INTO loan_history_sync (reader_id, newest_key, synced_at)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+            newest_key = VALUES(newest_key),
+            synced_at = VALUES(synced_at)
+        """, (reader_id, newest_key, datetime.now()))
+
+    def load_many(self, cursor, reader_ids):
+        """批量读取本地借阅历史 {reader_id: [历史记录项, ...]}，最新在前"""
+        histories = {reader_id: [] for reader_id in reader_ids}
+        for chunk in chunked(reader_ids, BULK_CHUNK_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(queries.LOAN_HISTORY_BY_READERS.format(placeholders=placeholders), tuple(chunk))
+            for row in cursor.fetchall():
+                items = histories[row['reader_id']]
+                if len(items) < self.limit:
+                    items.append({
+                        "callNo": row['call_no'],
+                        "readerId": row['reader_id'],
+                        "loanDate": row['loan_date']
+                    })
+        return histories
+
+
+class CallNumberIndex:
+    """
+    进程级索书号分类索引
+    按 CallNumberParser.parse_callno 得到的 (大类, 子类) 对书籍序号分桶，
+    进程启动时由后台任务预热构建，之后按 序号 增量刷新新书；
+    删除的书和修改过的索书号只有全量重建才能反映，由 BookRecommender.rebuild_index 定期执行。
+    """
+
+    def __init__(self, parser, refresh_interval=600):
+        self.parser = parser
+        self.refresh_interval = refresh_interval  # 增量刷新间隔（秒）
+        self.buckets = defaultdict(list)  # {(大类, 子类): [序号, ...]}
+        self.callnos = {}  # {序号: 索书号}
+        self.ids_by_callno = defaultdict(list)  # {索书号: [序号, ...]}
+        self.book_ids = []  # 全部书籍序号（稠密数组，用于均匀随机抽样）
+        self.max_id = 0
+        self.built = False
+        self.last_refresh = 0
+        self.lock = threading.Lock()
+
+    def add_books(self, rows):
+        """加入 (序号, 索书号) 记录，已存在的序号会被忽略"""
+        rows = [(book_id, callno) for book_id, callno in rows if book_id not in self.callnos]
+        self.parser.precompute(callno for _, callno in rows)
+
+        for book_id, callno in rows:
+            if book_id in self.callnos:
+                continue
+            self.callnos[book_id] = callno or ''
+            self.ids_by_callno[callno or ''].append(book_id)
+            self.book_ids.append(book_id)
+            if book_id > self.max_id:
+                self.max_id = book_id
+
+            main_class, subclass = self.parser.parse_callno(callno)
+            if main_class:
+                self.buckets[(main_class, subclass)].append(book_id)
+
+    def refresh(self, cursor):
+        """从数据库加载 序号 大于已知最大值的新书（首次调用即全量构建）"""
+        with self.lock:
+            cursor.execute("""
+                SELECT 序号, 索书号 FROM books
+                WHERE 序号 > %s
+                ORDER BY 序号
+            """, (self.max_id,))
+            rows = cursor.fetchall()
+            if rows and isinstance(rows[0], dict):
+                rows = [(row['序号'], row['索书号']) for row in rows]
+            self.add_books(rows)
+            self.built = True
+            self.last_refresh = time.time()
+
+    def ids_for_callnos(self, callnos):
+        """把索书号映射为书籍序号（同一索书号可能对应多条记录）"""
+        book_ids = []
+        for callno in callnos:
+            book_ids.extend(self.ids_by_callno.get(callno, ()))
+        return book_ids
+
+    def needs_refresh(self):
+        return not self.built or time.time() - self.last_refresh > self.refresh_interval
+
+    def sample(self, main_class, subclass, n, excluded=()):
+        """从子类桶中随机抽取至多 n 个未被排除的书籍序号"""
+        bucket = self.buckets.get((main_class, subclass))
+        if not bucket:
+            return []
+        return self.draw(bucket, n, excluded)
+
+    def sample_any(self, n, excluded=()):
+        """从全部馆藏中均匀随机抽取至多 n 个未被排除的书籍序号"""
+        return self.draw(self.book_ids, n, excluded)
+
+    def draw(self, pool, n, excluded):
+        if not pool or n <= 0:
+            return []
+
+        # 候选较少时直接过滤后抽样
+        if len(pool) <= n * 4:
+            candidates = [i for i in pool if i not in excluded]
+            return random.sample(candidates, min(n, len(candidates)))
+
+        # 候选较多时随机下标抽取，命中排除项则重抽
+        chosen = []
+        picked = set()
+        attempts = n * 10
+        while len(chosen) < n and attempts > 0:
+            attempts -= 1
+            book_id = pool[random.randrange(len(pool))]
+            if book_id in picked or book_id in excluded:
+                continue
+            picked.add(book_id)
+            chosen.append(book_id)
+        return chosen
+
+
+class ExclusionSet:
+    """
+    读者排除集合：以有序整型数组保存书籍序号，二分查找判断是否排除
+    合并新序号时在锁内生成新数组后整体替换，并发请求的追加不会互相覆盖，查询无需加锁
+    """
+
+    def __init__(self, book_ids=()):
+        self.ids = array('l', sorted(set(book_ids)))
+        self.lock = threading.Lock()
+
+    def __contains__(self, book_id):
+        i = bisect_left(self.ids, book_id)
+        return i < len(self.ids) and self.ids[i] == book_id
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add_many(self, book_ids):
+        book_ids = list(book_ids)
+        with self.lock:
+            new_ids = {i for i in book_ids if i not in self}
+            if new_ids:
+                self.ids = array('l', sorted(self.ids.tolist() + list(new_ids)))
+
 
 class BookRecommender:
     def __init__(self, db_config):
         self.db_config = db_config
-        self.parser = CallNumberParser()
+        self.parser = CallNumberParser(cache_size=int(os.getenv('CALLNO_CACHE_SIZE', 65536)))
         self.history_processor = ReadingHistoryProcessor(self.parser)
+        self.profiles = ReaderProfileStore(self.history_processor)
+        self.loan_history = LoanHistoryStore(
+            self.history_processor,
+            sync_interval=int(os.getenv('LOAN_SYNC_INTERVAL', 600)),
+            page_size=int(os.getenv('LOAN_SYNC_PAGE_SIZE', 20)),
+            max_pages=int(os.getenv('LOAN_SYNC_MAX_PAGES', 20)),
+            limit=int(os.getenv('LOAN_HISTORY_LIMIT', 500))
+        )
+        self.callno_index = CallNumberIndex(
+            self.parser, refresh_interval=int(os.getenv('CALLNO_INDEX_REFRESH', 600))
+        )
         self.recommend_history = {}  # 缓存推荐历史 {reader_id: [推荐记录]}
-
-    def get_recommendations(self, reader_id, history_items, top_n=4):
+        # 读者排除集合缓存 {reader_id: ExclusionSet}：到期后从 recommend_history 重新加载，
+        # 以纳入其他进程的推荐并去掉压缩删除的旧记录
+        self.exclusions = TTLCache(
+            maxsize=int(os.getenv('EXCLUSION_CACHE_SIZE', 10000)),
+            ttl=int(os.getenv('EXCLUSION_CACHE_TTL', 600))
+        )
+        self.local = threading.local()  # 当前线程的数据库会话
+        # 借阅历史后台刷新（接口超时或熔断时先返回本地历史）
+        self.history_refresher = ThreadPoolExecutor(
+            max_workers=int(os.getenv('LOAN_REFRESH_WORKERS', 2)), thread_name_prefix='loan-refresh'
+        )
+        self.refreshing = set()
+        self.refreshing_lock = threading.Lock()
+        # 推荐策略：class=按索书号分类，cooccurrence=优先共同借阅相似书，content=优先内容相似书
+        self.strategy = os.getenv('RECOMMEND_STRATEGY', 'class')
+        self.cooccurrence = CoBorrowIndex.open(os.getenv('COOCCURRENCE_INDEX_PATH', 'cooccurrence_index.pkl'))
+        self.content_index = ContentIndex.open(os.getenv('CONTENT_INDEX_PATH', 'content_index.pkl'))
+
+    def similarity_engine(self):
+        """当前策略使用的相似书索引；每次按属性读取，索引被整体替换后立即生效"""
+        return {'cooccurrence': self.cooccurrence, 'content': self.content_index}.get(self.strategy)
+
+    def get_recommendations(self, reader_id, history_items, top_n=4, profile=None):
         """
         获取推荐书籍
         :param reader_id: 读者ID
         :param history_items: 历史记录项列表
         :param top_n: 推荐数量
+        :param profile: 已刷新的读者画像，为空时按 history_items 刷新
         :return: 推荐书籍列表
         """
-        # 获取已推荐书籍（避免重复推荐）
-        recommended_callnos = self.get_recommended_callnos(reader_id)
+        seen_books = {item.get("callNo", "") for item in history_items}
 
-        # 处理阅读历史
-        _, seen_books, class_freq, subclass_freq = self.history_processor.process_history(history_items)
+        # 整个推荐过程共用一个数据库连接
+        with self.db_session():
+            # 读取画像频次向量，只解析新增的借阅记录
+            if profile is None:
+                profile = self.refresh_profile(reader_id, history_items)
 
-        # 排除已推荐书籍
-        seen_books.update(recommended_callnos)
+            self.ensure_index()
 
-        # 无历史记录时的兜底推荐
-        if not class_freq:
-            app.logger.info(f"读者 {reader_id} 无阅读历史，随机推荐书籍")
-            recommendations = self.get_random_books(top_n, seen_books)
+            # 已借阅及已推荐书籍（避免重复推荐）
+            excluded = self.get_exclusion_set(reader_id, seen_books)
+            book_ids = self.choose_book_ids(reader_id, seen_books, profile, excluded, top_n)
+
+            # 一次取回全部推荐书籍
+            recommendations = self.get_books_by_ids(book_ids)
+
+            # 保存推荐记录
             if recommendations:
+                self.exclude_books(excluded, book_ids)
                 self.save_recommendation(reader_id, recommendations)
-            return recommendations, None
 
-        # 按频率排序分类
-        sorted_subclasses = sorted(subclass_freq.items(), key=lambda x: x[1], reverse=True)
+        return recommendations, None
 
-        # 生成推荐
-        recommendations = []
+    def get_recommendations_bulk(self, readers, top_n=4, profiles=None, strict=False):
+        """
+        批量为多位读者生成推荐
+        按主导子类分组共享候选池，在内存中为每位读者抽样，
+        画像、推荐历史、书籍详情的读取及推荐记录的写入都按块批量完成。
+        :param readers: [(reader_id, 历史记录项列表), ...]
+        :param profiles: 已刷新的画像 {reader_id: 画像}，为空时批量刷新
+        :param strict: 数据库不可用或读写出错时抛出 Error，而不是返回不完整的结果（定时推送使用）
+        :return: {reader_id: 推荐书籍列表}
+        """
+        readers = list(readers)
+        histories = dict(readers)
+        seen_by_reader = {
+            reader_id: {item.get("callNo", "") for item in history_items}
+            for reader_id, history_items in readers
+        }
 
-        # 按子类推荐高频书籍（3本）
-        for (main_class, subclass), _ in sorted_subclasses:
-            if len(recommendations) >= top_n - 1:  # 留1个位置给随机推荐
-                break
+        with self.db_session():
+            if profiles is None:
+                profiles = self.refresh_profiles(histories, strict)
+
+            self.ensure_index()
+            exclusions = self.get_exclusion_sets(seen_by_reader, strict)
+
+            # 按子类统计需求，每个子类只抽取一次共享候选池
+            demand = defaultdict(int)
+            for reader_id in histories:
+                for key in self.top_subclasses(profiles[reader_id], top_n - 1):
+                    demand[key] += 1
+            pools = {
+                key: self.callno_index.sample(key[0], key[1], count * 3 + 10)
+                for key, count in demand.items()
+            }
+            pools['*'] = self.callno_index.sample_any(len(histories) * 2 + 20)
 
-            books = self.get_books_by_class(main_class, subclass, seen_books)
-            if books:
-                n = min(1, top_n - len(recommendations))  # 每个子类推荐1本
-                selected = random.sample(books, n)
-                recommendations.extend(selected)
-                seen_books.update(b['索书号'] for b in selected)
+            chosen = {
+                reader_id: self.choose_book_ids(
+                    reader_id, seen_by_reader[reader_id], profiles[reader_id],
+                    exclusions[reader_id], top_n, pools
+                )
+                for reader_id in histories
+            }
 
-        # 最后一本随机推荐（1本）
-        if len(recommendations) < top_n:
-            fallback = self.get_random_books(top_n - len(recommendations), seen_books)
-            recommendations.extend(fallback)
+            # 全部读者的推荐书籍一次（分块）取回
+            books = {}
+            with self.db_session() as (conn, cursor):
+                if conn:
+                    all_ids = list({book_id for book_ids in chosen.values() for book_id in book_ids})
+                    try:
+                        for book in self.fetch_books_by_ids(cursor, all_ids):
+                            books[book['序号']] = book
+                    except Error as e:
+                        app.logger.error(f"批量查询书籍错误: {e}")
+                        if strict:
+                            raise
+                elif strict:
+                    raise Error(msg="批量查询书籍：数据库连接失败")
+
+            results = {}
+            for reader_id, book_ids in chosen.items():
+                results[reader_id] = [books[i] for i in book_ids if i in books]
+                if results[reader_id]:
+                    self.exclude_books(exclusions[reader_id], book_ids)
+
+            self.save_recommendations([(reader_id, recs) for reader_id, recs in results.items() if recs], strict)
+
+        return results
+
+    def top_subclasses(self, profile, n):
+        """画像中频次最高的 n 个子类"""
+        ranked = sorted(profile['subclass_freq'].items(), key=lambda x: x[1], reverse=True)
+        return [key for key, _ in ranked[:n]]
+
+    def choose_book_ids(self, reader_id, seen_books, profile, excluded, top_n, pools=None):
+        """
+        在内存中为一位读者选出推荐书籍序号（不访问数据库）
+        :param pools: 批量推荐时共享的候选池 {(大类, 子类) 或 '*': [序号, ...]}
+        """
+        book_ids = []
+
+        # 相似书策略：先按共同借阅或内容相似推荐
+        engine = self.similarity_engine()
+        if engine is not None:
+            seed_ids = self.callno_index.ids_for_callnos(seen_books)
+            if engine.ready:
+                selected = engine.recommend(seed_ids, top_n - 1, excluded)
+                book_ids.extend(selected)
+                self.exclude_books(excluded, selected)
+
+        if not profile['class_freq']:
+            # 无历史记录时的兜底推荐
+            app.logger.info(f"读者 {reader_id} 无阅读历史，随机推荐书籍")
+        else:
+            # 按子类推荐高频书籍（3本）
+            for main_class, subclass in self.top_subclasses(profile, len(profile['subclass_freq'])):
+                if len(book_ids) >= top_n - 1:  # 留1个位置给随机推荐
+                    break
+
+                # 每个子类推荐1本，优先从共享候选池中取
+                selected = []
+                if pools is not None:
+                    selected = self.draw_from_pool(pools.get((main_class, subclass)), 1, excluded)
+                if not selected:
+                    selected = self.callno_index.sample(main_class, subclass, 1, excluded)
+                if selected:
+                    book_ids.extend(selected)
+                    self.exclude_books(excluded, selected)
+
+        # 最后一本随机推荐（1本），无历史时全部随机
+        remaining = top_n - len(book_ids)
+        if remaining > 0:
+            selected = []
+            if pools is not None:
+                selected = self.draw_from_pool(pools.get('*'), remaining, excluded)
+            if len(selected) < remaining:
+                selected.extend(self.callno_index.sample_any(remaining - len(selected), excluded))
+            book_ids.extend(selected)
+
+        return book_ids
+
+    def draw_from_pool(self, pool, n, excluded):
+        """从共享候选池的随机位置起顺序取 n 本未被排除的书"""
+        if not pool:
+            return []
 
-        # 保存推荐记录
-        if recommendations:
-            self.save_recommendation(reader_id, recommendations)
+        chosen = []
+        start = random.randrange(len(pool))
+        for k in range(len(pool)):
+            book_id = pool[(start + k) % len(pool)]
+            if book_id not in excluded and book_id not in chosen:
+                chosen.append(book_id)
+                if len(chosen) >= n:
+                    break
+        return chosen
+
+    def reload_content_index(self):
+        """内容相似度索引文件更新后加载新索引并整体替换引用，正在查询的线程继续使用旧索引"""
+        index = self.content_index.load_if_changed()
+        if index is not None:
+            self.content_index = index
+            app.logger.info(f"内容相似度索引已重新加载：{len(index.doc_ids)} 本书")
+
+    def reload_cooccurrence(self):
+        """共同借阅索引文件被 cooccurrence_index.py 更新后加载新索引并整体替换引用"""
+        index = self.cooccurrence.load_if_changed()
+        if index is not None:
+            self.cooccurrence = index
+            app.logger.info(f"共同借阅索引已重新加载：{len(index.matrix[0])} 本书")
+
+    def refresh_profile(self, reader_id, history_items):
+        return self.refresh_profiles({reader_id: history_items})[reader_id]
+
+    def refresh_profiles(self, histories, strict=False):
+        """
+        批量加载读者画像并折入新借阅，有变化的画像一次写回。
+        数据库不可用时退化为按本次历史临时计算的画像（strict=True 时抛出 Error）。
+        :param histories: {reader_id: 历史记录项列表}
+        :return: {reader_id: 画像}
+        """
+        with self.db_session() as (conn, cursor):
+            if not conn and strict:
+                raise Error(msg="更新读者画像：数据库连接失败")
+            if conn:
+                try:
+                    profiles = self.profiles.load_many(cursor, list(histories))
+                    changed = []
+                    for reader_id, history_items in histories.items():
+                        profile = profiles.setdefault(reader_id, self.profiles.empty_profile())
+                        if self.profiles.fold(profile, history_items):
+                            changed.append((reader_id, profile))
+                    if changed:
+                        self.profiles.save_many(cursor, changed)
+                        conn.commit()
+                    return profiles
+                except Error as e:
+                    app.logger.error(f"更新读者画像错误: {e}")
+                    conn.rollback()
+                    if strict:
+                        raise
+
+        profiles = {}
+        for reader_id, history_items in histories.items():
+            profiles[reader_id] = self.profiles.empty_profile()
+            self.profiles.fold(profiles[reader_id], history_items)
+        return profiles
+
+    def get_loan_history(self, reader_id, force=False, budget=None):
+        return self.get_loan_histories([reader_id], force, budget).get(reader_id, [])
+
+    def get_loan_histories(self, reader_ids, force=False, budget=None, executor=None, strict=False):
+        """
+        增量同步并读取本地借阅历史
+        只对超过同步间隔的读者访问汇文接口，且只取到已保存的记录为止。
+        在后台线程（定时推送、异步回复）中，接口调用期间归还数据库连接；
+        在请求中 get_db_connection 返回本请求的连接，该连接在整个请求期间（包括接口调用）都被占用，
+        因此请求路径上由 budget 限制接口耗时。
+        :param budget: 访问汇文接口的时间预算（秒）。超时或接口熔断时直接返回本地（可能过期的）历史，
+                       并在后台补做同步
+        :param executor: 传入线程池时并发访问汇文接口（单个客户端的连接池仍限制总并发）
+        :param strict: 数据库不可用或读写出错时抛出 Error，而不是返回空结果（定时推送使用）
+        :return: {reader_id: 历史记录项列表}，最新在前
+        """
+        reader_ids = list(dict.fromkeys(reader_ids))
+        deadline = time.monotonic() + budget if budget else None
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                if strict:
+                    raise Error(msg="读取借阅历史：数据库连接失败")
+                return {}
+            try:
+                states = self.loan_history.sync_states(cursor, reader_ids)
+            except Error as e:
+                app.logger.error(f"读取借阅同步状态错误: {e}")
+                if strict:
+                    raise
+                states = {}
+
+        due = [
+            (reader_id, states[reader_id][0] if reader_id in states else None)
+            for reader_id in reader_ids
+            if force or self.loan_history.is_due(states.get(reader_id))
+        ]
+        fetch = lambda item: self.loan_history.fetch_new(item[0], item[1], deadline)
+        results = executor.map(fetch, due) if executor else map(fetch, due)
+
+        fetched = {}
+        for (reader_id, newest_key), new_items in zip(due, results):
+            if new_items is not None:
+                fetched[reader_id] = (new_items, newest_key)
+            elif deadline is not None:
+                self.refresh_loan_history_async(reader_id)
+
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                if strict:
+                    raise Error(msg="保存借阅历史：数据库连接失败")
+                return {}
 
-        return recommendations, None
+            try:
+                for reader_id, (new_items, newest_key) in fetched.items():
+                    self.loan_history.save_new(cursor, reader_id, new_items, newest_key)
+                if fetched:
+                    conn.commit()
+            except Error as e:
+                app.logger.error(f"保存借阅历史错误: {e}")
+                conn.rollback()
+                if strict:
+                    raise
 
-    def create_db_connection(self):
-        try:
-            conn = mysql.connector.connect(
-                host=self.db_config['host'],
-                user=self.db_config['user'],
-                password=self.db_config['password'],
-                database=self.db_config['database'],
-                charset='utf8mb4',
-                collation='utf8mb4_unicode_ci'
-            )
-            return conn
-        except Error as e:
-            app.logger.error(f"数据库连接错误: {e}")
-            return None
+            try:
+                return self.loan_history.load_many(cursor, reader_ids)
+            except Error as e:
+                app.logger.error(f"读取借阅历史错误: {e}")
+                if strict:
+                    raise
+                return {}
+
+    def refresh_loan_history_async(self, reader_id):
+        """在后台同步一位读者的借阅历史，同一读者同时只有一个刷新任务"""
+        with self.refreshing_lock:
+            if reader_id in self.refreshing:
+                return
+            self.refreshing.add(reader_id)
+
+        def refresh():
+            try:
+                self.get_loan_histories([reader_id], force=True)
+            except Exception as e:
+                app.logger.error(f"后台同步借阅历史错误: {e}")
+            finally:
+                with self.refreshing_lock:
+                    self.refreshing.discard(reader_id)
+
+        self.history_refresher.submit(refresh)
+
+    def mark_profiles_pushed(self, reader_ids):
+        if not reader_ids:
+            return
+
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                return
+
+            try:
+                self.profiles.mark_pushed(cursor, reader_ids)
+                conn.commit()
+            except Error as e:
+                app.logger.error(f"更新画像推送时间错误: {e}")
+                conn.rollback()
+
+    def get_exclusion_set(self, reader_id, seen_callnos):
+        return self.get_exclusion_sets({reader_id: seen_callnos})[reader_id]
+
+    def get_exclusion_sets(self, seen_by_reader, strict=False):
+        """
+        获取读者的排除集合（已借阅 + 已推荐），跨请求缓存 EXCLUSION_CACHE_TTL 秒。
+        仅对缓存未命中的读者批量查询推荐历史，之后只合并新出现的借阅记录。
+        :param seen_by_reader: {reader_id: 已借阅索书号集合}
+        :param strict: 推荐历史读取失败时抛出 Error（否则按空推荐历史处理）
+        :return: {reader_id: ExclusionSet}
+        """
+        exclusions = {}
+        for reader_id in seen_by_reader:
+            excluded = self.exclusions.get(reader_id)
+            if excluded is not None:
+                exclusions[reader_id] = excluded
+
+        missing = [reader_id for reader_id in seen_by_reader if reader_id not in exclusions]
+        if missing:
+            recommended = self.get_recommended_callnos_many(missing, strict)
+            for reader_id in missing:
+                book_ids = self.callno_index.ids_for_callnos(recommended.get(reader_id, ()))
+                # 同一读者的并发请求共用先放入缓存的集合
+                excluded, created = self.exclusions.get_or_set(reader_id, lambda: ExclusionSet(book_ids))
+                if not created:
+                    excluded.add_many(book_ids)
+                exclusions[reader_id] = excluded
+
+        for reader_id, seen_callnos in seen_by_reader.items():
+            exclusions[reader_id].add_many(self.callno_index.ids_for_callnos(seen_callnos))
+        return exclusions
+
+    def exclude_books(self, excluded, book_ids):
+        """把选中书籍（及同索书号的其他记录）加入排除集合"""
+        callnos = (self.callno_index.callnos.get(i) for i in book_ids)
+        excluded.add_many(self.callno_index.ids_for_callnos(callnos))
+
+    def ensure_index(self):
+        """索书号索引未构建或到期时刷新"""
+        if not self.callno_index.needs_refresh():
+            return
+
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                return
+
+            try:
+                self.callno_index.refresh(cursor)
+            except Error as e:
+                app.logger.error(f"刷新索书号索引错误: {e}")
+
+    def rebuild_index(self):
+        """
+        全量重建索书号索引（由后台任务调用）
+        尚未构建时直接构建当前索引（启动预热）；否则另建新索引，完成后整体替换，
+        以去掉已删除的书和修改前的索书号，重建期间请求仍使用旧索引
+        """
+        if not self.callno_index.built:
+            self.ensure_index()
+            return
+
+        index = CallNumberIndex(self.parser, refresh_interval=self.callno_index.refresh_interval)
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                return
+
+            try:
+                index.refresh(cursor)
+            except Error as e:
+                app.logger.error(f"重建索书号索引错误: {e}")
+                return
+
+        self.callno_index = index
+        app.logger.info(f"索书号索引已重建: {len(index.book_ids)} 本")
+
+    @contextmanager
+    def db_session(self):
+        """
+        请求级数据库会话，返回 (conn, cursor)，连接失败时为 (None, None)。
+        同一线程内嵌套调用时复用外层会话，由最外层负责关闭连接。
+        """
+        active = getattr(self.local, 'session', None)
+        if active:
+            yield active
+            return
 
-    def get_books_by_class(self, main_class, subclass, exclude_callnos):
         conn = self.create_db_connection()
         if not conn:
-            return []
+            yield None, None
+            return
 
+        cursor = conn.cursor(dictionary=True)
+        self.local.session = (conn, cursor)
         try:
-            cursor = conn.cursor(dictionary=True)
-            exclude_list = ', '.join(['%s'] * len(exclude_callnos)) if exclude_callnos else "''"
-            like_pattern = f"{subclass}%"
-
-            cursor.execute(f"""
-                SELECT * FROM books
-                WHERE 索书号 NOT IN ({exclude_list})
-                AND 索书号 LIKE %s
-                ORDER BY RAND()
-                LIMIT 10
-            """, tuple(exclude_callnos) + (like_pattern,))
-
-            return cursor.fetchall()
-        except Error as e:
-            app.logger.error(f"查询书籍错误: {e}")
-            return []
+            yield conn, cursor
         finally:
+            self.local.session = None
             if conn.is_connected():
                 cursor.close()
                 conn.close()
 
-    def get_random_books(self, top_n=4, exclude_callnos=None):
-        if exclude_callnos is None:
-            exclude_callnos = set()
+    def create_db_connection(self):
+        # 与其他数据库操作共用连接池（请求内复用同一连接）
+        return get_db_connection()
 
-        conn = self.create_db_connection()
-        if not conn:
-            return []
+    def get_books_by_class(self, main_class, subclass, excluded, limit=10):
+        self.ensure_index()
 
-        try:
-            cursor = conn.cursor(dictionary=True)
-            exclude_list = ', '.join(['%s'] * len(exclude_callnos)) if exclude_callnos else "''"
+        # 在内存索引中抽样，只按主键取回选中的书
+        book_ids = self.callno_index.sample(main_class, subclass, limit, excluded)
+        return self.get_books_by_ids(book_ids)
 
-            cursor.execute(f"""
-                SELECT * FROM books
-                WHERE 索书号 NOT IN ({exclude_list})
-                ORDER BY RAND()
-                LIMIT %s
-            """, tuple(exclude_callnos) + (top_n,))
+    def get_random_books(self, top_n=4, excluded=None):
+        if excluded is None:
+            excluded = ExclusionSet()
 
-            return cursor.fetchall()
-        except Error as e:
-            app.logger.error(f"随机推荐错误: {e}")
+        self.ensure_index()
+
+        # 从缓存的序号数组中随机抽取，避免 ORDER BY RAND() 全表排序
+        book_ids = self.callno_index.sample_any(top_n, excluded)
+        return self.get_books_by_ids(book_ids)
+
+    def get_books_by_ids(self, book_ids):
+        if not book_ids:
             return []
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                return []
+
+            try:
+                return self.fetch_books_by_ids(cursor, book_ids)
+            except Error as e:
+                app.logger.error(f"查询书籍错误: {e}")
+                return []
+
+    def fetch_books_by_ids(self, cursor, book_ids):
+        """按 序号 批量取回书籍"""
+        if not book_ids:
+            return []
+
+        rows = {}
+        for chunk in chunked(book_ids, BULK_CHUNK_SIZE):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"SELECT * FROM books WHERE 序号 IN ({placeholders})", tuple(chunk))
+            rows.update((row['序号'], row) for row in cursor.fetchall())
+        # 保持抽样顺序
+        return [rows[i] for i in book_ids if i in rows]
 
     def get_recommended_callnos(self, reader_id):
-        conn = self.create_db_connection()
-        if not conn:
-            return set()
+        return self.get_recommended_callnos_many([reader_id]).get(reader_id, set())
 
-        try:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT book_call_no
-                FROM recommend_history
-                WHERE reader_id = %s
-            """, (reader_id,))
+    def get_recommended_callnos_many(self, reader_ids, strict=False):
+        """批量获取推荐历史 {reader_id: {索书号, ...}}，strict=True 时查询失败抛出 Error"""
+        recommended = defaultdict(set)
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                if strict:
+                    raise Error(msg="获取推荐历史：数据库连接失败")
+                return recommended
 
-            return {row[0] for row in cursor.fetchall()}
-        except Error as e:
-            app.logger.error(f"获取推荐历史错误: {e}")
-            return set()
-        finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            try:
+                for chunk in chunked(reader_ids, BULK_CHUNK_SIZE):
+                    placeholders = ', '.join(['%s'] * len(chunk))
+                    cursor.execute(queries.RECOMMENDED_CALLNOS.format(placeholders=placeholders), tuple(chunk))
+                    for row in cursor.fetchall():
+                        recommended[row['reader_id']].add(row['book_call_no'])
+            except Error as e:
+                app.logger.error(f"获取推荐历史错误: {e}")
+                if strict:
+                    raise
+            return recommended
 
     def save_recommendation(self, reader_id, recommendations):
-        if not recommendations:
+        self.save_recommendations([(reader_id, recommendations)])
+
+    def save_recommendations(self, batch, strict=False):
+        """
+        批量保存推荐记录
+        :param batch: [(reader_id, 推荐书籍列表), ...]
+        :param strict: 保存失败时抛出 Error（定时推送据此不发送、不推进进度）
+        """
+        rows = [(
+            reader_id,
+            book.get("索书号", ""),
+            book.get("题名", "未知书名"),
+            book.get("责任者", "未知作者"),
+            book.get("出版社", "未知出版社"),
+            book.get("标准号", "")
+        ) for reader_id, recommendations in batch for book in recommendations]
+        if not rows:
             return
 
-        conn = self.create_db_connection()
-        if not conn:
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                if strict:
+                    raise Error(msg="保存推荐记录：数据库连接失败")
+                return
+
+            try:
+                # 多行插入，按块一次往返写入
+                for chunk in chunked(rows, BULK_CHUNK_SIZE):
+                    cursor.executemany("""
+                        INSERT INTO recommend_history
+                        (reader_id, book_call_no, book_title, book_author, book_publisher, book_isbn, recommend_time)
+                        VALUES (%s, %s, %s, %s, %s, %s, NOW())
+                    """, chunk)
+
+                # 旧记录由 compact_recommend_history 定期清理
+                conn.commit()
+                app.logger.info(f"已为 {len(batch)} 位读者保存 {len(rows)} 条推荐记录")
+
+            except Error as e:
+                app.logger.error(f"保存推荐记录错误: {e}")
+                conn.rollback()
+                if strict:
+                    raise
+
+    def compact_recommend_history(self, keep=20, chunk_size=200):
+        """
+        后台压缩推荐历史：每位读者只保留最近 keep 条记录。
+        分批处理超出上限的读者，每批提交一次，不占用用户请求路径。
+        """
+        with self.db_session() as (conn, cursor):
+            if not conn:
+                app.logger.error("压缩推荐历史：数据库连接失败")
+                return 0
+
+            try:
+                cursor.execute(queries.OVERSIZED_RECOMMEND_READERS, (keep,))
+                reader_ids = [row['reader_id'] for row in cursor.fetchall()]
+
+                deleted = 0
+                for start in range(0, len(reader_ids), chunk_size):
+                    cutoffs = []
+                    for reader_id in reader_ids[start:start + chunk_size]:
+                        # 第 keep 新的记录 id，比它旧的都删除（id 自增，与 recommend_time 同序）
+                        cursor.execute(queries.RECOMMEND_HISTORY_CUTOFF, (reader_id, keep - 1))
+                        row = cursor.fetchone()
+                        if row:
+                            cutoffs.append((reader_id, row['id']))
+
+                    if cutoffs:
+                        cursor.executemany(queries.DELETE_RECOMMEND_HISTORY_BEFORE, cutoffs)
+                        deleted += cursor.rowcount
+                        conn.commit()
+
+                # 本进程的排除集合按压缩后的推荐历史重新加载（其他进程在缓存到期后重新加载）
+                self.exclusions.clear()
+                app.logger.info(f"压缩推荐历史完成：处理 {len(reader_ids)} 位读者，删除 {deleted} 条记录")
+                return deleted
+            except Error as e:
+                app.logger.error(f"压缩推荐历史错误: {e}")
+                conn.rollback()
+                return 0
+
+
+# ====================== 数据库连接池 ======================
+class PooledConnection:
+    """从连接池借出的连接，close() 时归还（只归还一次），其余属性透传给底层连接"""
+
+    def __init__(self, cnx, pool):
+        self.cnx = cnx
+        self.pool = pool
+        self.returned = False
+
+    def __getattr__(self, name):
+        return getattr(self.cnx, name)
+
+    def is_connected(self):
+        # 调用方在 finally 中据此决定是否 close()，借出期间始终为真，保证连接被归还
+        return not self.returned
+
+    def close(self):
+        if self.returned:
             return
+        self.returned = True
+        self.pool.release(self.cnx)
 
-        try:
-            cursor = conn.cursor()
-
-            for book in recommendations:
-                cursor.execute("""
-                    INSERT INTO recommend_history
-                    (reader_id, book_call_no, book_title, book_author, book_publisher, book_isbn, recommend_time)
-                    VALUES (%s, %s, %s, %s, %s, %s, NOW())
-                """, (
-                    reader_id,
-                    book.get("索书号", ""),
-                    book.get("题名", "未知书名"),
-                    book.get("责任者", "未知作者"),
-                    book.get("出版社", "未知出版社"),
-                    book.get("标准号", "")
-                ))
-
-            # 清理旧记录
-            cursor.execute("""
-                DELETE FROM recommend_history
-                WHERE id NOT IN (
-                    SELECT id
-                    FROM (
-                        SELECT id
-                        FROM recommend_history
-                        WHERE reader_id = %s
-                        ORDER BY recommend_time DESC
-                        LIMIT 20
-                    ) AS temp
-                )
-                AND reader_id = %s
-            """, (reader_id, reader_id))
 
-            conn.commit()
-            app.logger.info(f"已为读者 {reader_id} 保存 {len(recommendations)} 条推荐记录")
+class RequestConnection:
+    """绑定在 Flask g 上的请求级连接：请求内各处 close() 不归还，由 teardown 统一归还"""
 
-        except Error as e:
-            app.logger.error(f"保存推荐记录错误: {e}")
-            conn.rollback()
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class ConnectionPool:
+    """
+    MySQL 连接池（基于 MySQLConnectionPool，首次使用时创建）
+    池满时最多等待 timeout 秒，借出时 ping 检查并自动重连，记录等待耗时等指标。
+    """
+
+    def __init__(self, db_config, size=10, timeout=5):
+        self.db_config = db_config
+        self.size = size
+        self.timeout = timeout
+        self.pool = None
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(size)
+        self.wait_stats = LatencyStats()
+        self.in_use = 0
+        self.timeouts = 0
+        self.reconnects = 0
+
+    def connect_args(self):
+        return dict(
+            host=self.db_config['host'],
+            user=self.db_config['user'],
+            password=self.db_config['password'],
+            database=self.db_config['database'],
+            charset='utf8mb4',
+            collation='utf8mb4_unicode_ci'
+        )
+
+    def ensure_pool(self):
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = MySQLConnectionPool(
+                        pool_name='book_system', pool_size=self.size, pool_reset_session=True,
+                        **self.connect_args()
+                    )
+        return self.pool
+
+    def get_connection(self):
+        start = time.monotonic()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.timeouts += 1
+            self.wait_stats.record(time.monotonic() - start, False)
+            raise PoolError(f"等待数据库连接超过 {self.timeout} 秒")
+        self.wait_stats.record(time.monotonic() - start)
+
+        try:
+            cnx = self.ensure_pool().get_connection()
+        except Exception:
+            self.slots.release()
+            raise
+
+        try:
+            cnx.ping(reconnect=False)
+        except Error:
+            # 连接已被服务端关闭（如超过 wait_timeout），重连一次
+            with self.lock:
+                self.reconnects += 1
+            try:
+                cnx.reconnect(attempts=2, delay=0)
+            except Exception:
+                # 重连失败也要把连接放回池中，否则池会逐渐耗尽
+                with self.lock:
+                    self.in_use += 1
+                self.release(cnx)
+                raise
+
+        with self.lock:
+            self.in_use += 1
+        return PooledConnection(cnx, self)
+
+    def release(self, cnx):
+        try:
+            cnx.close()  # 池化连接的 close() 会把连接放回 MySQLConnectionPool
         finally:
-            if conn.is_connected():
-                cursor.close()
-                conn.close()
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    def connect_dedicated(self):
+        """不经过连接池的独立连接，用于需要长期持有会话的场景（如 GET_LOCK）"""
+        return mysql.connector.connect(**self.connect_args())
+
+    def stats(self):
+        with self.lock:
+            counters = {
+                'size': self.size,
+                'in_use': self.in_use,
+                'timeouts': self.timeouts,
+                'reconnects': self.reconnects,
+            }
+        counters['wait'] = self.wait_stats.snapshot()
+        return counters
+
+
+db_pool = ConnectionPool(
+    DB_CONFIG,
+    size=int(os.getenv('DB_POOL_SIZE', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 5))
+)
+
+
+@app.teardown_appcontext
+def return_db_connection(exception):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.close()
 
 
 # ====================== 数据库操作 ======================
 def get_db_connection():
-    """创建并返回数据库连接"""
+    """
+    从连接池获取数据库连接
+    在请求（应用上下文）中，同一请求的多次调用共用一个连接，请求结束时归还；
+    后台线程中每次借出一个连接，close() 时归还
+    """
     try:
-        conn = mysql.connector.connect(
-            host=DB_CONFIG['host'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            database=DB_CONFIG['database'],
-            charset='utf8mb4'
-        )
-        return conn
+        if has_app_context():
+            if 'db_conn' not in g:
+                g.db_conn = db_pool.get_connection()
+            return RequestConnection(g.db_conn)
+        return db_pool.get_connection()
     except Error as e:
         app.logger.error(f"数据库连接错误: {e}")
         return None
 
 
+# 读者身份缓存：网页路由按 openid 取当前读者（readers 整行）、按读者证号取内部 id，
+# 不必每个请求都查 readers 表。缓存在进程内，绑定、解绑和修改昵称时失效，
+# 其他进程中的旧数据最多保留 READER_CACHE_TTL 秒，因此只用于页面展示；
+# 权限判断（管理员）和写操作使用 fresh=True 直接查库。未绑定的 openid 不缓存
+readers_by_openid = TTLCache(
+    maxsize=int(os.getenv('READER_CACHE_SIZE', 10000)),
+    ttl=int(os.getenv('READER_CACHE_TTL', 300))
+)
+reader_ids_by_card = TTLCache(
+    maxsize=int(os.getenv('READER_CACHE_SIZE', 10000)),
+    ttl=int(os.getenv('READER_CACHE_TTL', 300))
+)
+
+
+def get_current_reader(openid, fresh=False):
+    """
+    根据OpenID获取读者记录（readers 整行，带缓存），未绑定或查询失败时返回 None
+    :param fresh: 跳过缓存直接查库（并更新缓存），用于权限判断和写操作
+    """
+    reader = None if fresh else readers_by_openid.get(openid)
+    if reader is not None:
+        return dict(reader)
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(queries.READER_BY_OPENID, (openid,))
+        reader = cursor.fetchone()
+    except Error as e:
+        app.logger.error(f"获取读者信息错误: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+    if not reader:
+        # 已解绑：同时清掉本进程中的旧缓存
+        invalidate_reader(openid)
+        return None
+    readers_by_openid.set(openid, reader)
+    reader_ids_by_card.set(reader['reader_card'], reader['id'])
+    return dict(reader)
+
+
+def get_reader_id(reader_card, fresh=False):
+    """
+    根据读者证号获取读者内部 id（带缓存），不存在或查询失败时返回 None
+    :param fresh: 跳过缓存直接查库（并更新缓存），用于写操作：其他进程解绑/重新绑定后，
+                  本进程缓存中的旧 id 可能已被删除，插入时会违反外键约束
+    """
+    reader_id = None if fresh else reader_ids_by_card.get(reader_card)
+    if reader_id is not None:
+        return reader_id
+
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    try:
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(queries.READER_ID_BY_CARD, (reader_card,))
+        reader = cursor.fetchone()
+    except Error as e:
+        app.logger.error(f"获取读者信息错误: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+    if not reader:
+        reader_ids_by_card.pop(reader_card)
+        return None
+    reader_ids_by_card.set(reader_card, reader['id'])
+    return reader['id']
+
+
+def invalidate_reader(openid, *reader_cards):
+    """读者记录变更后清除缓存：openid 对应的整行，以及其原读者证号和 reader_cards 的 id 映射"""
+    reader = readers_by_openid.pop(openid)
+    if reader:
+        reader_ids_by_card.pop(reader['reader_card'])
+    for reader_card in reader_cards:
+        if reader_card:
+            reader_ids_by_card.pop(reader_card)
+
+
 def create_reader(openid, reader_card, reader_type):
     """创建新的读者记录"""
     conn = get_db_connection()
@@ -339,6 +1542,9 @@ def create_reader(openid, reader_card, reader_type):
 
     try:
         cursor = conn.cursor()
+        # 重新绑定时原读者证号的缓存也要失效
+        cursor.execute("SELECT reader_card FROM readers WHERE openid = %s", (openid,))
+        row = cursor.fetchone()
         cursor.execute("""
             INSERT INTO readers (openid, reader_card, reader_type)
             VALUES (%s, %s, %s)
@@ -347,6 +1553,8 @@ def create_reader(openid, reader_card, reader_type):
             reader_type = VALUES(reader_type)
         """, (openid, reader_card, reader_type))
         conn.commit()
+        recommendation_cache.clear(openid)
+        invalidate_reader(openid, reader_card, row[0] if row else None)
         return True
     except Error as e:
         app.logger.error(f"创建读者记录错误: {e}")
@@ -388,8 +1596,12 @@ def delete_reader(openid):
 
     try:
         cursor = conn.cursor()
+        cursor.execute("SELECT reader_card FROM readers WHERE openid = %s", (openid,))
+        row = cursor.fetchone()
         cursor.execute("DELETE FROM readers WHERE openid = %s", (openid,))
         conn.commit()
+        recommendation_cache.clear(openid)
+        invalidate_reader(openid, row[0] if row else None)
         return cursor.rowcount > 0
     except Error as e:
         app.logger.error(f"删除读者记录错误: {e}")
@@ -404,8 +1616,42 @@ def delete_reader(openid):
 # 初始化推荐器
 recommender = BookRecommender(DB_CONFIG)
 
-# 用户会话状态管理
-user_sessions = {}
+# 读者最近一次推荐结果缓存，连续点击【图书推荐】时直接返回 {openid: 回复文本}
+# 按 openid 存放，命中时不必先查绑定信息；与会话共用 SQLite 文件，
+# 任一 worker 处理绑定/解绑时清除，其他 worker 不会再返回旧读者证的推荐
+recommendation_cache = open_session_store(
+    os.getenv('SESSION_STORE'),
+    ttl=int(os.getenv('RECOMMEND_CACHE_TTL', 60)),
+    maxsize=int(os.getenv('RECOMMEND_CACHE_SIZE', 10000)),
+    table='recommendation_cache',
+    renew=False
+)
+
+# 慢指令后台回复线程池
+reply_workers = ReplyWorkerPool(
+    deliver=lambda openid, content: send_wechat_notification(openid, content),
+    workers=int(os.getenv('ASYNC_REPLY_WORKERS', 4)),
+    maxsize=int(os.getenv('ASYNC_REPLY_QUEUE_SIZE', 1000))
+)
+
+# 微信消息去重：服务器响应慢时微信会重发同一条消息（最多 3 次），重试可能落到任意 worker。
+# 跨进程登记（与会话共用 SQLite 文件）保证只有一个进程处理并保存回复；
+# 同一进程内的重复消息直接等待进程内的处理结果 {消息标识: PendingReply}
+message_replies = TTLCache(
+    maxsize=int(os.getenv('WECHAT_DEDUP_SIZE', 10000)),
+    ttl=int(os.getenv('WECHAT_DEDUP_TTL', 30))
+)
+shared_replies = open_reply_store(os.getenv('SESSION_STORE'), ttl=int(os.getenv('WECHAT_DEDUP_TTL', 30)))
+# 重复消息等待第一次处理结果的最长时间（秒），需小于微信的 5 秒超时
+WECHAT_DEDUP_WAIT = float(os.getenv('WECHAT_DEDUP_WAIT', 4.5))
+
+# 用户会话状态管理：只保存非空闲状态（如等待输入绑定信息），30分钟无活动过期；
+# 默认存放在本机 SQLite 文件中，多个 worker 进程共享
+user_sessions = open_session_store(
+    os.getenv('SESSION_STORE'),
+    ttl=int(os.getenv('SESSION_TTL', 1800)),
+    maxsize=int(os.getenv('SESSION_MAX_SIZE', 10000))
+)
 
 # 定义支持的读者类型
 SUPPORTED_TYPES = ['0', '1']  # 0=证件号, 1=条码号
@@ -462,11 +1708,75 @@ def wechat_handler():
         app.logger.error(f"XML解析错误: {str(e)}")
         return "XML parse error", 400
 
-    # 处理消息并回复
-    reply_content = handle_message(msg)
+    # 处理消息并回复（微信重发的同一条消息复用第一次的回复）
+    reply_content = reply_once(msg, handle_message)
+    if reply_content is None:
+        return "success"  # 第一次处理仍未完成，告知微信不再重发
     return generate_reply_xml(msg, reply_content)
 
 
+class PendingReply:
+    """一条消息的回复，处理完成前为进行中"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.content = None
+
+
+def message_key(msg):
+    """普通消息用 MsgId 去重，事件消息没有 MsgId，用 FromUserName + CreateTime"""
+    if msg.get('MsgId'):
+        return f"msg:{msg['MsgId']}"
+    return f"event:{msg.get('FromUserName')}:{msg.get('CreateTime')}"
+
+
+def wait_shared_reply(key, timeout):
+    """等待其他进程处理同一条消息，返回 (是否拿到回复, 回复)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        done, content = shared_replies.get(key)
+        if done or time.monotonic() >= deadline:
+            return done, content
+        time.sleep(0.05)
+
+
+def reply_once(msg, handler):
+    """
+    同一条消息只处理一次（跨进程）
+    :return: 回复内容；重复消息在等待时限内拿不到结果时返回 None
+    """
+    key = message_key(msg)
+    pending, created = message_replies.get_or_set(key, PendingReply)
+    if not created:
+        app.logger.info(f"收到重复消息 {key}，复用第一次的回复")
+        pending.done.wait(WECHAT_DEDUP_WAIT)
+        return pending.content
+
+    claimed = False
+    try:
+        claimed = shared_replies.claim(key)
+        if not claimed:
+            # 其他进程已在处理（或已处理完）这条消息
+            app.logger.info(f"收到重复消息 {key}，等待其他进程的回复")
+            done, pending.content = wait_shared_reply(key, WECHAT_DEDUP_WAIT)
+            if not done:
+                # 还没处理完：不在本进程缓存空结果，下次重试时重新查询
+                message_replies.pop(key)
+            return pending.content
+
+        pending.content = handler(msg)
+        shared_replies.complete(key, pending.content)
+    except Exception:
+        # 处理失败时允许微信重试的消息重新处理
+        message_replies.pop(key)
+        if claimed:
+            shared_replies.release(key)
+        raise
+    finally:
+        pending.done.set()
+    return pending.content
+
+
 def generate_reply_xml(msg, content):
     """生成回复XML"""
     xml = f"""\
@@ -511,7 +1821,7 @@ def handle_message(msg):
             app.logger.info(f"用户 {openid} 点击了菜单，EventKey: {event_key}")
 
             if event_key == 'RECOMMEND_BOOKS':
-                return process_recommendation(openid)
+                return request_recommendation(openid)
 
             elif event_key == 'BIND_ACCOUNT':
                 return process_bind_request(openid)
@@ -530,20 +1840,13 @@ def handle_message(msg):
     elif msg_type == 'text':
         content = msg.get('Content', '').strip().lower()
 
-        # 检查并更新会话
-        if openid not in user_sessions:
-            user_sessions[openid] = {'state': 'idle', 'last_active': time.time()}
-        session_data = user_sessions[openid]
-        session_data['last_active'] = time.time()
-        clean_expired_sessions()  # 清理过期会话
-
-        # --- 检查是否处于等待绑定信息的状态 ---
-        if session_data.get('state') == 'awaiting_info':
-            return process_binding(openid, session_data, msg.get('Content', '').strip())
+        # --- 检查是否处于等待绑定信息的状态（读取会话同时续期） ---
+        if user_sessions.get_state(openid) == 'awaiting_info':
+            return process_binding(openid, msg.get('Content', '').strip())
 
         # --- 处理关键词指令 ---
         if content in ['推荐', 'tuijian']:
-            return process_recommendation(openid)
+            return request_recommendation(openid)
 
         elif content in ['绑定', 'bangding', 'bd']:
             return process_bind_request(openid)
@@ -563,20 +1866,7 @@ def handle_message(msg):
         return "🤖 暂时只支持文本和菜单点击哦，试试发送【帮助】吧！"
 
 
-def clean_expired_sessions():
-    """清理30分钟无活动的会话"""
-    current_time = time.time()
-    expired_users = []
-
-    for user_id, session in user_sessions.items():
-        if current_time - session['last_active'] > 1800:  # 30分钟
-            expired_users.append(user_id)
-
-    for user_id in expired_users:
-        del user_sessions[user_id]
-
-
-def process_binding(openid, session, input_str):
+def process_binding(openid, input_str):
     """处理绑定信息"""
     # 解析输入
     parts = re.split(r'[，,]', input_str)
@@ -596,7 +1886,7 @@ def process_binding(openid, session, input_str):
 
     # 保存到数据库
     if create_reader(openid, reader_card, reader_type):
-        session['state'] = 'idle'
+        user_sessions.clear(openid)
         reader_type_name = "证件号" if reader_type == '0' else "条码号"
         return f"✅ 绑定成功!\n类型: {reader_type_name}\n证号: {reader_card}\n\n发送【推荐】获取图书推荐"
     else:
@@ -607,43 +1897,74 @@ def process_unbind(openid):
     """处理解绑请求"""
     if delete_reader(openid):
         # 清除会话状态
-        if openid in user_sessions:
-            user_sessions[openid]['state'] = 'idle'
+        user_sessions.clear(openid)
         return "✅ 已解除绑定\n\n您可以发送【绑定】重新绑定"
     return "⚠️ 解绑失败，或您尚未绑定"
 
 
+def request_recommendation(openid):
+    """
+    推荐指令入口
+    异步模式下未命中缓存的推荐交给后台线程计算，先回复确认消息，避免超出微信 5 秒的被动回复时限
+    """
+    if not ASYNC_REPLY:
+        return process_recommendation(openid)
+
+    # 短时间内重复请求直接返回上次的推荐结果（不查数据库）
+    cached = recommendation_cache.get_state(openid)
+    if cached:
+        return cached
+
+    if not get_reader(openid):
+        return "⚠️ 您还未绑定，请先发送【绑定】完成注册"
+
+    if reply_workers.submit(f"recommend:{openid}", openid, lambda: process_recommendation(openid)):
+        return "⏳ 正在为您挑选图书，推荐结果稍后将以消息形式发送给您~"
+
+    # 队列已满说明后台已经积压，不在请求线程中同步计算（会超出被动回复时限并占满 Web 工作线程）
+    return "⏳ 当前请求较多，请稍后再发送【推荐】获取推荐结果"
+
+
 def process_recommendation(openid):
     """处理推荐请求"""
+    # 短时间内重复请求直接返回上次的推荐结果（不查数据库）
+    cached = recommendation_cache.get_state(openid)
+    if cached:
+        return cached
+
     # 获取绑定信息
     reader_info = get_reader(openid)
     if not reader_info:
         return "⚠️ 您还未绑定，请先发送【绑定】完成注册"
 
+    reader_id = reader_info['reader_card']
+
     try:
-        reader_id = reader_info['reader_card']
         reader_type = int(reader_info['reader_type'])  # 0 或 1
 
-        # 调用 get_reading_history.py 中的函数获取历史记录
-        history_items = get_reading_history(reader_id)
+        # 从本地借阅历史读取，只增量同步汇文接口上的新借阅；
+        # 接口慢或熔断时先用本地历史回复，避免超出微信 5 秒的被动回复时限
+        history_items = recommender.get_loan_history(reader_id, budget=HISTORY_FETCH_BUDGET)
 
         if not history_items:
-            fallback_books, _ = recommender.get_recommendations(reader_id, [], top_n=4)
+            recommendations, _ = recommender.get_recommendations(reader_id, [], top_n=4)
             reply = "⚠️ 未找到您的借阅历史记录，请确认读者证号和类型是否正确。\n"
             reply += "📚 为您随机推荐以下图书：\n"
-            reply += format_recommendations(fallback_books)
-            return reply
+            reply += format_recommendations(recommendations)
+        else:
+            # 获取推荐书籍
+            recommendations, error = recommender.get_recommendations(
+                reader_id, history_items, top_n=4
+            )
 
-        # 获取推荐书籍
-        recommendations, error = recommender.get_recommendations(
-            reader_id, history_items, top_n=4
-        )
+            if error:
+                return f"❌ 获取推荐失败：{error}"
 
-        if error:
-            return f"❌ 获取推荐失败：{error}"
+            reply = "📚 为您推荐以下精选书籍：\n"
+            reply += format_recommendations(recommendations)
 
-        reply = "📚 为您推荐以下精选书籍：\n"
-        reply += format_recommendations(recommendations)
+        if recommendations:
+            recommendation_cache.set_state(openid, reply)
         return reply
 
     except Exception as e:
@@ -711,97 +2032,265 @@ def get_welcome_message():
 
 
 # ====================== 定时推荐处理 ======================
-def scheduled_recommendation():
-    """每半个月执行一次的定时推荐任务"""
-    app.logger.info(f"开始执行定时推荐任务: {datetime.now()}")
+class TokenBucket:
+    """令牌桶限速（线程安全）：每秒补充 rate 个令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def shard_rate_limit(shard_count):
+    """
+    单个分片的发送限速：各分片的推送主节点在同一计划时间同时推送，
+    全局配额 PUSH_RATE_LIMIT 由各分片平分，合计不超过微信客服消息的发送配额
+    """
+    return PUSH_RATE_LIMIT / max(1, shard_count)
+
 
-    # 获取所有已绑定的读者
+def load_push_checkpoint(run_id, shard_index):
+    """读取推送进度，返回 (已处理到的 readers.id, 是否已完成)；无记录时为 (0, False)，查询失败为 None"""
     conn = get_db_connection()
     if not conn:
-        app.logger.error("定时推荐任务：数据库连接失败")
-        return
+        return None
 
+    cursor = conn.cursor(dictionary=True)
     try:
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute("SELECT openid, reader_card, reader_type FROM readers")
-        readers = cursor.fetchall()
-        app.logger.info(f"定时推荐任务：共找到{len(readers)}位读者")
+        cursor.execute(queries.PUSH_CHECKPOINT, (run_id, shard_index))
+        row = cursor.fetchone()
+        return (row['last_reader_id'], bool(row['done'])) if row else (0, False)
+    except Error as e:
+        app.logger.error(f"读取推送进度错误: {e}")
+        return None
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
 
-        for reader in readers:
-            try:
-                openid = reader['openid']
-                reader_id = reader['reader_card']
-                reader_type = int(reader['reader_type'])
 
-                # 获取阅读历史
-                history_items = get_reading_history(reader_id, max_pages=1, page_size=20)
+def save_push_checkpoint(run_id, shard_index, last_reader_id, done=False):
+    conn = get_db_connection()
+    if not conn:
+        return False
 
-                # 获取推荐书籍
-                reply = '📚 为您定时推荐以下图书：\n'
-                recommendations, _ = recommender.get_recommendations(
-                    reader_id, history_items if history_items else [], top_n=4
-                )
-                reply += format_recommendations(recommendations)
-                if recommendations:
-                    # 发送微信通知
-                    send_wechat_notification(openid, reply)
-                    app.logger.info(f"已为读者 {reader_id} 发送推荐通知")
-                else:
-                    app.logger.warning(f"读者 {reader_id} 无推荐结果")
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            INSERT INTO push_checkpoints (run_id, shard, last_reader_id, done, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE
+            last_reader_id = VALUES(last_reader_id),
+            done = VALUES(done),
+            updated_at = VALUES(updated_at)
+        """, (run_id, shard_index, last_reader_id, int(done)))
+        conn.commit()
+        return True
+    except Error as e:
+        app.logger.error(f"保存推送进度错误: {e}")
+        return False
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
 
-            except Exception as e:
-                app.logger.error(f"处理读者 {reader.get('reader_card', '')} 时出错: {str(e)}")
 
+def fetch_unfinished_push_runs(shard_index, days):
+    """最近 days 天内本分片未完成的推送批次 [run_id, ...]，查询失败返回 []"""
+    conn = get_db_connection()
+    if not conn:
+        return []
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT run_id FROM push_checkpoints
+            WHERE shard = %s AND done = 0 AND updated_at >= NOW() - INTERVAL %s DAY
+            ORDER BY run_id
+        """, (shard_index, days))
+        return [row[0] for row in cursor.fetchall()]
+    except Error as e:
+        app.logger.error(f"读取推送进度错误: {e}")
+        return []
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+
+def fetch_reader_batch(after_id, limit, shard_index=0, shard_count=1):
+    """
+    按 id 顺序取本分片的下一批读者，查询失败返回 None
+    分片条件在 SQL 中按读者证号的 CRC32 计算，各分片只读取自己的读者
+    """
+    conn = get_db_connection()
+    if not conn:
+        return None
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(queries.READER_BATCH, (after_id, shard_count, shard_index, limit))
+        return cursor.fetchall()
     except Error as e:
         app.logger.error(f"定时推荐任务：数据库错误: {str(e)}")
+        return None
     finally:
         if conn and conn.is_connected():
             cursor.close()
             conn.close()
 
 
-def send_wechat_notification(openid, content):
-    """发送微信客服消息"""
-    access_token = get_wechat_access_token()
-    if not access_token:
+# 同一进程内同时只执行一轮推送（定时任务与断点续推不重叠）
+push_run_lock = threading.Lock()
+
+
+def scheduled_recommendation(run_id=None, shard_index=None, shard_count=None, wait=True):
+    """
+    每半个月执行一次的定时推荐任务
+    按 readers.id 分批处理，每批成功后才在 push_checkpoints 中推进进度；
+    某批出错时停止本轮，同一 run_id（计划执行日期）重新执行时从该批开始继续。
+    :param wait: 已有推送在执行时是否等待，否则直接跳过
+    """
+    if not push_run_lock.acquire(blocking=wait):
+        app.logger.info(f"定时推荐任务：已有推送在执行，跳过 {run_id}")
         return
+    try:
+        run_push(run_id or datetime.now().strftime('%Y-%m-%d'), shard_index, shard_count)
+    finally:
+        push_run_lock.release()
 
-    url = f"https://api.weixin.qq.com/cgi-bin/message/custom/send?access_token={access_token}"
-    payload = {
-        "touser": openid,
-        "msgtype": "text",
-        "text": {
-            "content": content
-        }
-    }
+
+def run_push(run_id, shard_index=None, shard_count=None):
+    """执行（或从断点继续）一轮推送，参数同 scheduled_recommendation"""
+    shard_index = PUSH_SHARD_INDEX if shard_index is None else shard_index
+    shard_count = PUSH_SHARD_COUNT if shard_count is None else shard_count
+    app.logger.info(f"开始执行定时推荐任务: {run_id} 分片 {shard_index}/{shard_count}")
+
+    checkpoint = load_push_checkpoint(run_id, shard_index)
+    if checkpoint is None:
+        app.logger.error("定时推荐任务：读取推送进度失败")
+        return
+    last_id, done = checkpoint
+    if done:
+        app.logger.info(f"定时推荐任务：{run_id} 分片 {shard_index} 已完成，跳过")
+        return
+    if last_id:
+        app.logger.info(f"定时推荐任务：从读者 id {last_id} 之后继续")
+    elif not save_push_checkpoint(run_id, shard_index, 0):
+        # 先登记本轮，进程中途退出后主节点可据此继续
+        return
+
+    pushed = 0
+    limiter = TokenBucket(shard_rate_limit(shard_count))
+    with ThreadPoolExecutor(max_workers=PUSH_WORKERS, thread_name_prefix='push') as executor:
+        while True:
+            rows = fetch_reader_batch(last_id, PUSH_BATCH_SIZE, shard_index, shard_count)
+            if rows is None:
+                return
+            if not rows:
+                break
+
+            # 每批的推荐计算和写库都批量完成，汇文同步和消息发送并发进行
+            try:
+                pushed += push_recommendation_batch(rows, executor, limiter)
+            except Exception as e:
+                app.logger.error(
+                    f"定时推荐任务：处理一批读者时出错，停止本轮（重新执行时从读者 id {last_id} 之后继续）: {str(e)}"
+                )
+                return
+
+            last_id = rows[-1]['id']
+            save_push_checkpoint(run_id, shard_index, last_id)
+
+    save_push_checkpoint(run_id, shard_index, last_id, done=True)
+    app.logger.info(f"定时推荐任务完成：{run_id} 分片 {shard_index}，共推送 {pushed} 位读者")
+
+
+def push_recommendation_batch(readers, executor=None, limiter=None):
+    """
+    为一批读者生成并推送推荐，返回成功推送的读者数；limiter 为发送限速器（TokenBucket）
+    数据库不可用或读写出错时抛出异常，由 run_push 停止本轮且不推进进度，避免把这批读者当作已处理
+    """
+    openids = {reader['reader_card']: reader['openid'] for reader in readers}
+
+    # 获取阅读历史（本地借阅历史，增量同步）
+    histories = recommender.get_loan_histories(list(openids), executor=executor, strict=True)
+    missing = set(openids) - set(histories)
+    if missing:
+        raise RuntimeError(f"{len(missing)} 位读者的借阅历史未能读取")
+
+    # 画像自上次推送后没有变化的读者跳过本轮推送
+    profiles = recommender.refresh_profiles(histories, strict=True)
+    if SKIP_UNCHANGED_PROFILES:
+        for reader_id, profile in profiles.items():
+            if recommender.profiles.is_unchanged_since_push(profile):
+                app.logger.info(f"读者 {reader_id} 画像无变化，跳过本轮推送")
+                histories.pop(reader_id, None)
+
+    # 批量获取推荐书籍
+    results = recommender.get_recommendations_bulk(histories.items(), top_n=4, profiles=profiles, strict=True)
+
+    def push_one(reader_id, recommendations):
+        try:
+            if not recommendations:
+                app.logger.warning(f"读者 {reader_id} 无推荐结果")
+                return False
+
+            # 发送微信通知
+            reply = '📚 为您定时推荐以下图书：\n'
+            reply += format_recommendations(recommendations)
+            if limiter:
+                limiter.acquire()
+            if send_wechat_notification(openids[reader_id], reply):
+                app.logger.info(f"已为读者 {reader_id} 发送推荐通知")
+                return True
+        except Exception as e:
+            app.logger.error(f"处理读者 {reader_id} 时出错: {str(e)}")
+        return False
+
+    if executor:
+        futures = {reader_id: executor.submit(push_one, reader_id, recs) for reader_id, recs in results.items()}
+        outcomes = {reader_id: future.result() for reader_id, future in futures.items()}
+    else:
+        outcomes = {reader_id: push_one(reader_id, recs) for reader_id, recs in results.items()}
+
+    pushed = [reader_id for reader_id, ok in outcomes.items() if ok]
+    recommender.mark_profiles_pushed(pushed)
+    return len(pushed)
+
+
+def send_wechat_notification(openid, content):
+    """发送微信客服消息，返回是否发送成功"""
     try:
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(url, data=json.dumps(payload, ensure_ascii=False), headers=headers)
-        result = response.json()
-        if result.get('errcode') != 0:
+        result = wechat.send_text(openid, content)
+        if result is None:
+            app.logger.error("发送微信通知失败: 无法获取访问令牌")
+        elif result.get('errcode') != 0:
             app.logger.error(f"发送微信通知失败: {result}")
+        else:
+            return True
     except Exception as e:
         app.logger.error(f"发送微信通知异常: {str(e)}")
+    return False
 
 
 def get_wechat_access_token():
-    """获取微信访问令牌"""
-    # 从环境变量获取微信凭证
-    appid = WECHAT_APPID
-    secret = WECHAT_SECRET
-
-    if not appid or not secret:
-        app.logger.error("未配置微信公众号凭证")
-        return None
-
-    url = f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={appid}&secret={secret}"
-    try:
-        response = requests.get(url)
-        data = response.json()
-        return data.get('access_token')
-    except Exception as e:
-        app.logger.error(f"获取微信访问令牌失败: {str(e)}")
-        return None
+    """获取微信访问令牌（缓存至过期前，多进程共享）"""
+    return wechat.access_token()
 
 
 def schedule_next_recommendation():
@@ -819,25 +2308,219 @@ def schedule_next_recommendation():
 
     app.logger.info(f"安排下一次定时推荐: {next_date}")
 
-    # 添加定时任务
-    scheduler.add_job(
+    # 添加定时任务（只在本分片的推送主节点中运行，重复安排时覆盖）
+    push_scheduler.add_job(
         execute_scheduled_recommendation,
         'date',
-        run_date=next_date
+        run_date=next_date,
+        args=[f"{next_date:%Y-%m-%d}"],
+        id=f"scheduled_recommendation_{next_date:%Y%m%d}",
+        replace_existing=True
     )
 
 
-def execute_scheduled_recommendation():
-    """执行定时推荐并安排下一次任务"""
+def execute_scheduled_recommendation(run_id=None):
+    """执行定时推荐并安排下一次任务，run_id 为计划执行日期"""
     try:
-        scheduled_recommendation()
+        scheduled_recommendation(run_id)
     finally:
-        # 无论成功与否，都安排下一次任务
+        # 无论成功与否，都安排下一次任务；推送写入的推荐记录由全局主节点的定期压缩任务清理
         schedule_next_recommendation()
 
 
+class SchedulerLeader:
+    """
+    调度主节点选举
+    用 MySQL 的 GET_LOCK 在一个专用连接上持有命名锁，持有锁的进程为主节点；
+    进程退出或连接断开时 MySQL 自动释放锁，其他进程在下一次检查时接管。
+    主节点每个检查周期确认锁仍由自己的连接持有（同时作为心跳保持连接）。
+    """
+
+    def __init__(self, lock_name, interval=15, on_elected=None, on_demoted=None):
+        self.lock_name = lock_name  # 不同的锁名各自选举，如全局任务与各推送分片
+        self.interval = interval
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.conn = None
+        self.is_leader = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name=f"scheduler-leader-{self.lock_name}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                if self.is_leader:
+                    if not self.still_holding():
+                        self.demote()
+                else:
+                    self.try_acquire()
+            except Exception as e:
+                app.logger.error(f"调度主节点选举出错: {str(e)}")
+                if self.is_leader:
+                    self.demote()
+            self.stopped.wait(self.interval)
+
+    def try_acquire(self):
+        # 锁随连接存在，使用不经过连接池的独立连接
+        try:
+            conn = db_pool.connect_dedicated()
+        except Error as e:
+            app.logger.error(f"数据库连接错误: {e}")
+            return
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.lock_name,))
+            acquired = cursor.fetchone()[0] == 1
+        finally:
+            cursor.close()
+
+        if not acquired:
+            conn.close()
+            return
+
+        self.conn = conn
+        self.is_leader = True
+        app.logger.info(f"进程 {os.getpid()} 成为调度主节点: {self.lock_name}")
+        if self.on_elected:
+            self.on_elected()
+
+    def still_holding(self):
+        try:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute("SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (self.lock_name,))
+                return cursor.fetchone()[0] == 1
+            finally:
+                cursor.close()
+        except Error as e:
+            app.logger.error(f"调度主节点心跳失败: {e}")
+            return False
+
+    def demote(self):
+        self.is_leader = False
+        app.logger.warning(f"进程 {os.getpid()} 不再是调度主节点: {self.lock_name}")
+        try:
+            self.conn.close()
+        except Error:
+            pass
+        self.conn = None
+        if self.on_demoted:
+            self.on_demoted()
+
+
+# 每个进程都要运行的任务（维护进程内的索引）
 scheduler = BackgroundScheduler()
-scheduler.start()
+
+# 启用协同过滤策略时，共同借阅索引由 cooccurrence_index.py 离线构建，文件更新后自动重新加载
+if recommender.strategy == 'cooccurrence':
+    scheduler.add_job(
+        recommender.reload_cooccurrence,
+        'interval',
+        minutes=int(os.getenv('COOCCURRENCE_RELOAD_INTERVAL', 10)),
+        id='reload_cooccurrence',
+        replace_existing=True
+    )
+
+# 启动时预热索书号索引（首个推荐请求不必等待全量构建），之后定期全量重建
+scheduler.add_job(
+    recommender.rebuild_index,
+    'interval',
+    minutes=int(os.getenv('CALLNO_INDEX_REBUILD_INTERVAL', 360)),
+    next_run_time=datetime.now(),
+    id='rebuild_callno_index',
+    replace_existing=True
+)
+
+# 内容相似度索引由 content_index.py 离线构建，文件更新后自动重新加载
+scheduler.add_job(
+    recommender.reload_content_index,
+    'interval',
+    minutes=int(os.getenv('CONTENT_INDEX_RELOAD_INTERVAL', 10)),
+    id='reload_content_index',
+    replace_existing=True
+)
+
+# 全局只需运行一次的任务（压缩推荐历史），只在当选主节点的进程中执行；
+# 其余进程暂停该调度器待命，主节点退出后接管
+SCHEDULER_LOCK_NAME = os.getenv('SCHEDULER_LOCK_NAME', 'book_system_scheduler')
+SCHEDULER_LEADER_INTERVAL = int(os.getenv('SCHEDULER_LEADER_INTERVAL', 15))
+leader_scheduler = BackgroundScheduler()
+
+
+def on_scheduler_elected():
+    leader_scheduler.resume()
+
+
+scheduler_leader = SchedulerLeader(
+    SCHEDULER_LOCK_NAME,
+    interval=SCHEDULER_LEADER_INTERVAL,
+    on_elected=on_scheduler_elected,
+    on_demoted=leader_scheduler.pause
+)
+
+# 定期压缩推荐历史，把清理旧记录移出用户请求路径
+leader_scheduler.add_job(
+    recommender.compact_recommend_history,
+    'interval',
+    minutes=int(os.getenv('RECOMMEND_COMPACT_INTERVAL', 60)),
+    id='compact_recommend_history',
+    replace_existing=True
+)
+
+# 定时推送按分片各自选举推送主节点（锁名带分片号）：每个分片同一时刻只有一个进程推送，
+# 不同分片在各自的主机上同时推送；某分片的主节点退出后，设置相同 PUSH_SHARD_INDEX 的其他进程接管
+push_scheduler = BackgroundScheduler()
+
+
+def resume_unfinished_push():
+    """继续上一个推送主节点中途退出时未完成的推送批次（按原 run_id 从断点继续）"""
+    for run_id in fetch_unfinished_push_runs(PUSH_SHARD_INDEX, PUSH_RESUME_DAYS):
+        app.logger.info(f"继续未完成的定时推荐任务: {run_id}")
+        scheduled_recommendation(run_id, wait=False)
+
+
+def on_push_elected():
+    schedule_next_recommendation()
+    push_scheduler.add_job(
+        resume_unfinished_push,
+        'interval',
+        minutes=PUSH_RESUME_INTERVAL,
+        next_run_time=datetime.now(),
+        id='resume_unfinished_push',
+        replace_existing=True
+    )
+    push_scheduler.resume()
+
+
+push_leader = SchedulerLeader(
+    f"{SCHEDULER_LOCK_NAME}:push:{PUSH_SHARD_INDEX}",
+    interval=SCHEDULER_LEADER_INTERVAL,
+    on_elected=on_push_elected,
+    on_demoted=push_scheduler.pause
+)
+
+
+def start_background_jobs():
+    """启动本进程的调度器，并参加全局和本推送分片的主节点选举（当选前对应的调度器保持暂停）"""
+    scheduler.start()
+    leader_scheduler.start(paused=True)
+    push_scheduler.start(paused=True)
+    scheduler_leader.start()
+    push_leader.start()
+
+
+# 导入时即启动（python app.py 和 gunicorn app:app 都依赖于此）；
+# 基准测试、单元测试等只需导入模块时设置 BACKGROUND_JOBS=0，不连接数据库也不启动后台线程
+if os.getenv('BACKGROUND_JOBS', '1') != '0':
+    start_background_jobs()
 
 
 # ====================== 网页前端路由 ======================
@@ -850,14 +2533,8 @@ def web_index():
     # print(f"首页的 session 内容: {dict(session)}")
     current_reader = None  # 初始化当前读者信息为空
     if openid:
-        # 如果用户已通过微信授权登录，就去数据库查询他的信息
-        conn_temp = get_db_connection()
-        if conn_temp:
-            cursor_temp = conn_temp.cursor(dictionary=True)
-            cursor_temp.execute("SELECT * FROM readers WHERE openid = %s", (openid,))
-            current_reader = cursor_temp.fetchone()
-            cursor_temp.close()
-            conn_temp.close()
+        # 如果用户已通过微信授权登录，就查询他的信息（读者身份缓存）
+        current_reader = get_current_reader(openid)
 
     # 2. 获取分页、搜索等参数（这部分逻辑保持不变）
     page = int(request.args.get('page', 1))
@@ -874,7 +2551,7 @@ def web_index():
 
     # 获取总书籍数量
     if query:
-        cursor.execute("SELECT COUNT(*) AS total FROM books WHERE 题名 LIKE %s", (f"%{query}%",))
+        cursor.execute(queries.COUNT_BOOKS_BY_TITLE, (f"%{query}%",))
     else:
         cursor.execute("SELECT COUNT(*) AS total FROM books")
     total_books = cursor.fetchone()['total']
@@ -912,14 +2589,8 @@ def book_detail(book_id):
     openid = session.get('openid')
     current_reader = None  # 初始化当前读者信息为空
     if openid:
-        # 如果用户已通过微信授权登录，就去数据库查询他的信息
-        conn_temp = get_db_connection()
-        if conn_temp:
-            cursor_temp = conn_temp.cursor(dictionary=True)
-            cursor_temp.execute("SELECT * FROM readers WHERE openid = %s", (openid,))
-            current_reader = cursor_temp.fetchone()
-            cursor_temp.close()
-            conn_temp.close()
+        # 如果用户已通过微信授权登录，就查询他的信息（读者身份缓存）
+        current_reader = get_current_reader(openid)
 
     # 2. 查询书籍、推荐和感悟的核心逻辑（基本保持不变）
     conn = get_db_connection()
@@ -928,27 +2599,19 @@ def book_detail(book_id):
 
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT * FROM books WHERE 序号 = %s", (book_id,))
+    cursor.execute(queries.BOOK_BY_ID, (book_id,))
     book = cursor.fetchone()
     if not book:
         return "书籍不存在", 404
 
-    cursor.execute("SELECT * FROM books WHERE 责任者 = %s AND 序号 != %s LIMIT 5", (book['责任者'], book_id))
+    cursor.execute(queries.BOOKS_BY_AUTHOR, (book['责任者'], book_id))
     recommendations = cursor.fetchall()
 
-    cursor.execute("""
-        SELECT 
-            r.id as reflection_id,
-            r.content, r.timestamp,
-            readers.reader_card, 
-            readers.nickname, 
-            CASE readers.reader_type WHEN '0' THEN '证件号' ELSE '条码号' END as reader_type_text,
-            (SELECT COUNT(*) FROM likes l WHERE l.reflection_id = r.id) AS likes
-        FROM reflections r
-        JOIN readers ON r.reader_id = readers.id
-        WHERE r.book_id = %s AND r.status = 1
-        ORDER BY r.timestamp DESC
-    """, (book_id,))
+    # 内容相似的书（题名 + 简介 TF-IDF 预计算近邻）
+    similar_ids = recommender.content_index.related(book_id, n=5)
+    similar_books = recommender.fetch_books_by_ids(cursor, similar_ids)
+
+    cursor.execute(queries.BOOK_REFLECTIONS, (book_id,))
     reflections = cursor.fetchall()  # 'reflections' 是一个字典列表，每个字典就是一个 'r'
 
     cursor.close()
@@ -960,6 +2623,7 @@ def book_detail(book_id):
         book=book,
         reflections=reflections,
         recommendations=recommendations,
+        similar_books=similar_books,
         current_reader=current_reader  # 将当前读者信息传递给前端
     )
 
@@ -972,18 +2636,14 @@ def post_reflection():
     if not all([book_id, reader_card, content]):
         return "缺少参数", 400
 
-    # 查 reader_id（内部主键）
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT id FROM readers WHERE reader_card = %s", (reader_card,))
-    reader = cursor.fetchone()
-
-    if not reader:
+    # 查 reader_id（内部主键），写操作不使用缓存
+    reader_id = get_reader_id(reader_card, fresh=True)
+    if not reader_id:
         return "读者证号无效", 400
 
-    reader_id = reader['id']
-
     # 插入感悟
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
     cursor.execute(
         "INSERT INTO reflections (content, book_id, reader_id) VALUES (%s, %s, %s)",
         (content, book_id, reader_id)
@@ -1003,16 +2663,14 @@ def like_reflection():
     if not reflection_id or not reader_card:
         return jsonify({'error': '缺少参数'}), 400
 
+    # 查找 reader_id，写操作不使用缓存
+    reader_id = get_reader_id(reader_card, fresh=True)
+    if not reader_id:
+        return jsonify({'error': '读者不存在'}), 400
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
 
-    # 查找 reader_id
-    cursor.execute("SELECT id FROM readers WHERE reader_card = %s", (reader_card,))
-    reader = cursor.fetchone()
-    if not reader:
-        return jsonify({'error': '读者不存在'}), 400
-    reader_id = reader['id']
-
     # 检查是否点过赞
     cursor.execute(
         "SELECT * FROM likes WHERE reflection_id = %s AND reader_id = %s",
@@ -1057,32 +2715,17 @@ def my_page():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # 3. 使用 openid 查询 readers 表，获取读者信息
+        # 3. 使用 openid 获取读者信息（读者身份缓存）
         # 这是核心逻辑的改变：从 openid 找到 reader
-        cursor.execute("SELECT * FROM readers WHERE openid = %s", (openid,))
-        reader = cursor.fetchone()
+        reader = get_current_reader(openid)
 
         if not reader:
             # 如果数据库中没有这个 openid 对应的读者，说明用户还未绑定
-            cursor.close()
-            conn.close()
             # 可以渲染一个提示绑定的页面，或者直接返回文本
             return "您尚未绑定读者证，请在公众号对话框中发送【绑定】进行操作。", 404
 
         # 4. 如果找到了读者，使用读者的 ID (reader['id']) 去查询相关的感悟
-        cursor.execute("""
-                SELECT 
-                    r.id AS reflection_id,
-                    r.content, 
-                    r.timestamp,
-                    COALESCE(b.题名, ub.title) AS book_title,
-                    (SELECT COUNT(*) FROM likes l WHERE l.reflection_id = r.id) AS likes
-                FROM reflections r
-                LEFT JOIN books b ON r.book_id = b.序号
-                LEFT JOIN user_books ub ON r.user_book_id = ub.id
-                WHERE r.reader_id = %s AND r.status = 1
-                ORDER BY r.timestamp DESC
-            """, (reader['id'],))
+        cursor.execute(queries.READER_REFLECTIONS, (reader['id'],))
         reflections = cursor.fetchall()
 
     except Error as e:
@@ -1109,14 +2752,9 @@ def wechat_redirect():
         return "授权失败，请重试", 400
 
     # 使用 code 获取 access_token 和 openid
-    appid = WECHAT_APPID
-    secret = WECHAT_SECRET
-    token_url = f"https://api.weixin.qq.com/sns/oauth2/access_token?appid={appid}&secret={secret}&code={code}&grant_type=authorization_code"
-
     try:
         # print("正在请求 access_token 和 openid...")
-        response = requests.get(token_url)
-        data = response.json()
+        data = wechat.oauth_access_token(code)
         # print(f"微信返回的数据: {data}")  # 打印微信的完整响应
 
         openid = data.get('openid')
@@ -1142,10 +2780,6 @@ def wechat_redirect():
 
 def create_wechat_menu():
     """创建微信公众号自定义菜单"""
-    access_token = get_wechat_access_token()
-    if not access_token:
-        return False
-
     # 菜单配置
     menu_data = {
         "button": [
@@ -1172,11 +2806,10 @@ def create_wechat_menu():
         ]
     }
 
-    url = f"https://api.weixin.qq.com/cgi-bin/menu/create?access_token={access_token}"
     try:
-        headers = {"Content-Type": "application/json"}
-        response = requests.post(url, data=json.dumps(menu_data, ensure_ascii=False), headers=headers)
-        result = response.json()
+        result = wechat.create_menu(menu_data)
+        if result is None:
+            return False
         if result.get('errcode') == 0:
             print("创建成功")
             app.logger.info("微信公众号菜单创建成功")
@@ -1202,8 +2835,8 @@ def reflections_square():
         return "数据库连接失败", 500
     cursor = conn.cursor(dictionary=True)
 
-    cursor.execute("SELECT * FROM readers WHERE openid = %s", (openid,))
-    current_reader = cursor.fetchone()
+    # 发布感悟是写操作，身份直接查库确认
+    current_reader = get_current_reader(openid, fresh=request.method == 'POST')
     if not current_reader:
         if conn and conn.is_connected():
             cursor.close()
@@ -1223,7 +2856,7 @@ def reflections_square():
 
         try:
             # 步骤 2.1: 首先在官方 `books` 表中查找
-            cursor.execute("SELECT 序号 FROM books WHERE 题名 = %s LIMIT 1", (book_title,))
+            cursor.execute(queries.BOOK_ID_BY_TITLE, (book_title,))
             book = cursor.fetchone()
 
             if book:
@@ -1231,7 +2864,7 @@ def reflections_square():
                 book_id = book['序号']
             else:
                 # 步骤 2.2: 在 `user_books` 表中查找是否已存在
-                cursor.execute("SELECT id FROM user_books WHERE title = %s LIMIT 1", (book_title,))
+                cursor.execute(queries.USER_BOOK_ID_BY_TITLE, (book_title,))
                 user_book = cursor.fetchone()
                 if user_book:
                     # 在用户创建的书中找到了
@@ -1268,28 +2901,12 @@ def reflections_square():
         per_page = 10
         offset = (page - 1) * per_page
 
-        cursor.execute("SELECT COUNT(*) AS total FROM reflections WHERE status = 1")
+        cursor.execute(queries.COUNT_REFLECTIONS)
         total_reflections = cursor.fetchone()['total']
         total_pages = (total_reflections + per_page - 1) // per_page
 
         # 使用 COALESCE 和 LEFT JOIN 来合并查询
-        cursor.execute("""
-            SELECT 
-                r.id AS reflection_id,
-                r.content, 
-                r.timestamp,
-                COALESCE(b.题名, ub.title) AS book_title,
-                readers.reader_card,
-                readers.nickname, 
-                (SELECT COUNT(*) FROM likes l WHERE l.reflection_id = r.id) AS likes_count
-            FROM reflections r
-            LEFT JOIN books b ON r.book_id = b.序号
-            LEFT JOIN user_books ub ON r.user_book_id = ub.id
-            JOIN readers ON r.reader_id = readers.id
-            WHERE r.status = 1
-            ORDER BY r.timestamp DESC
-            LIMIT %s OFFSET %s
-        """, (per_page, offset))
+        cursor.execute(queries.REFLECTIONS_PAGE, (per_page, offset))
         reflections = cursor.fetchall()
 
         start_page = max(1, page - 3)
@@ -1323,6 +2940,7 @@ def delete_reflection(reflection_id):
 
     cursor = conn.cursor(dictionary=True)
     try:
+        # 管理员权限直接查库，不使用读者身份缓存
         cursor.execute("SELECT is_admin FROM readers WHERE openid = %s", (openid,))
         reader = cursor.fetchone()
 
@@ -1448,9 +3066,8 @@ def edit_profile():
     cursor = conn.cursor(dictionary=True)
 
     try:
-        # 2. 获取当前用户信息
-        cursor.execute("SELECT * FROM readers WHERE openid = %s", (openid,))
-        current_reader = cursor.fetchone()
+        # 2. 获取当前用户信息（修改昵称是写操作，直接查库确认）
+        current_reader = get_current_reader(openid, fresh=request.method == 'POST')
         if not current_reader:
             return "读者信息不存在", 404
 
@@ -1469,6 +3086,7 @@ def edit_profile():
             cursor.execute("UPDATE readers SET nickname = %s WHERE id = %s",
                            (new_nickname, current_reader['id']))
             conn.commit()
+            invalidate_reader(openid)
 
             # 修改成功后，重定向到个人主页
             return redirect(url_for('my_page'))
@@ -1486,6 +3104,42 @@ def edit_profile():
             conn.close()
 
 
+@app.route('/admin/stats')
+def admin_stats():
+    """运行状态（管理员）：后台回复队列、推荐缓存、数据库连接池、读者身份缓存、汇文接口"""
+    openid = session.get('openid')
+    if not openid:
+        return "请先登录", 403
+
+    # 管理员权限直接查库，不使用读者身份缓存
+    conn = get_db_connection()
+    if not conn:
+        return "数据库连接失败", 500
+
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT is_admin FROM readers WHERE openid = %s", (openid,))
+        reader = cursor.fetchone()
+        if not reader or not reader.get('is_admin'):
+            return "无权限操作", 403
+    except Error as e:
+        app.logger.error(f"查询管理员权限失败: {e}")
+        return "服务器发生错误", 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+    huiwen = get_client()
+    return jsonify({
+        'reply_workers': reply_workers.stats(),
+        'recommendation_cache': recommendation_cache.stats(),
+        'db_pool': db_pool.stats(),
+        'reader_cache': readers_by_openid.stats(),
+        'huiwen': dict(huiwen.stats.snapshot(), breaker=huiwen.breaker.state),
+    })
+
+
 def process_bind_request(openid):
     """
     处理绑定请求的通用函数。
@@ -1496,12 +3150,8 @@ def process_bind_request(openid):
         reader_type_name = "证件号" if reader_info.get('reader_type') == '0' else "条码号"
         return f"⚠️ 您已绑定: {reader_type_name}, 证号 {reader_info.get('reader_card')}\n\n如需重新绑定，请先发送或点击【解绑】。"
 
-    # 初始化或更新用户会话状态
-    if openid not in user_sessions:
-        user_sessions[openid] = {'state': 'idle', 'last_active': time.time()}
-    session_data = user_sessions[openid]
-    session_data['state'] = 'awaiting_info'
-    session_data['last_active'] = time.time()
+    # 记录会话状态，下一条文本消息按绑定信息处理
+    user_sessions.set_state(openid, 'awaiting_info')
 
     return "📝 请按格式输入: [读者证号],[读者类型]\n\n例如: A123,0\n\n类型说明:\n0=证件号(默认)\n1=条码号"
 
@@ -1512,8 +3162,7 @@ def process_unbind_request(openid):
     """
     if delete_reader(openid):
         # 清除可能存在的会话状态
-        if openid in user_sessions:
-            user_sessions[openid]['state'] = 'idle'
+        user_sessions.clear(openid)
         return "✅ 已解除绑定。\n\n您可以再次【绑定】新的读者信息。"
     return "⚠️ 解绑失败，或您尚未绑定。"
 
@@ -1521,8 +3170,7 @@ def process_unbind_request(openid):
 
 # ====================== 主程序入口 ======================
 if __name__ == '__main__':
-    # 首次启动时安排任务
-    schedule_next_recommendation()
+    # 定时推荐任务由各分片当选推送主节点的进程安排（见 push_leader）
 
     # 创建微信公众号菜单
     if os.getenv('CREATE_MENU', 'False') == 'True':
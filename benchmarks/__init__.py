@@ -0,0 +1,7 @@
+"""
+推荐系统基准测试
+
+    python -m benchmarks.bench_recommender --sizes 10000 100000 --output bench.json
+    python -m benchmarks.compare base.json bench.json
+    python -m benchmarks.bench_random_books
+"""
@@ -0,0 +1,80 @@
+"""
+随机推荐抽样基准测试
+
+对比 ORDER BY RAND() 全表排序与 CallNumberIndex 序号抽样 + 主键取回两种方式，
+在 1万 ~ 100万 本书的合成馆藏上的单次耗时。
+
+运行（项目根目录下）:
+    python -m benchmarks.bench_random_books
+    python -m benchmarks.bench_random_books --sizes 10000 100000 --rounds 50
+"""
+import argparse
+import os
+import random
+import time
+
+# 只导入推荐模块：不启动后台调度器和调度主节点选举（不连接 MySQL）
+os.environ.setdefault('BACKGROUND_JOBS', '0')
+
+from app import CallNumberIndex, CallNumberParser, ExclusionSet
+from benchmarks.localdb import LocalDatabase
+from benchmarks.synthetic import generate_catalog
+
+
+def build_catalog(size):
+    """在本地 SQLite 替身中生成合成馆藏，返回 (sqlite 连接, [(序号, 索书号), ...])"""
+    rows = generate_catalog(size)
+    database = LocalDatabase()
+    database.load_books(rows)
+    return database.db, [(r[0], r[3]) for r in rows]
+
+
+def time_per_call(func, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1000
+
+
+def run(sizes, rounds, top_n, exclude_size):
+    print(f"{'size':>10} {'ORDER BY RAND ms':>18} {'index sample ms':>16} {'index build s':>14}")
+    for size in sizes:
+        db, rows = build_catalog(size)
+        excluded_rows = random.sample(rows, exclude_size)
+        exclude = {callno for _, callno in excluded_rows}
+
+        def order_by_rand():
+            placeholders = ', '.join(['?'] * len(exclude))
+            db.execute(f"""
+                SELECT * FROM books
+                WHERE 索书号 NOT IN ({placeholders})
+                ORDER BY RANDOM()
+                LIMIT ?
+            """, tuple(exclude) + (top_n,)).fetchall()
+
+        start = time.perf_counter()
+        index = CallNumberIndex(CallNumberParser())
+        index.add_books(rows)
+        build_seconds = time.perf_counter() - start
+        excluded = ExclusionSet(book_id for book_id, _ in excluded_rows)
+
+        def index_sample():
+            book_ids = index.sample_any(top_n, excluded)
+            placeholders = ', '.join(['?'] * len(book_ids))
+            db.execute(f"SELECT * FROM books WHERE 序号 IN ({placeholders})", book_ids).fetchall()
+
+        # 全表排序在大馆藏上很慢，轮数相应减少
+        slow_rounds = max(1, rounds * 10000 // size)
+        print(f"{size:>10} {time_per_call(order_by_rand, slow_rounds):>18.3f} "
+              f"{time_per_call(index_sample, rounds):>16.3f} {build_seconds:>14.2f}")
+        db.close()
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="随机推荐抽样基准测试")
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    arg_parser.add_argument('--rounds', type=int, default=200)
+    arg_parser.add_argument('--top-n', type=int, default=4)
+    arg_parser.add_argument('--exclude', type=int, default=40, help="排除的已读/已推荐书籍数")
+    args = arg_parser.parse_args()
+    run(args.sizes, args.rounds, args.top_n, args.exclude)
@@ -0,0 +1,214 @@
+"""
+推荐系统分阶段基准测试
+
+在 1万 / 10万 / 100万 本书的合成馆藏（中图法索书号）和合成借阅历史上，
+分别测量 CallNumberParser、ReadingHistoryProcessor、ReaderProfileStore、
+CallNumberIndex 与 BookRecommender 各阶段的耗时，数据库使用本地 SQLite 替身。
+结果写成 JSON，可用 benchmarks.compare 在两次提交之间对比。
+
+运行（项目根目录下）:
+    python -m benchmarks.bench_recommender --output bench.json
+    python -m benchmarks.bench_recommender --sizes 10000 100000 --readers 500 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# 只导入推荐模块：不启动后台调度器和调度主节点选举（不连接 MySQL）
+os.environ.setdefault('BACKGROUND_JOBS', '0')
+
+from app import BookRecommender, CallNumberParser, DB_CONFIG, ExclusionSet
+from benchmarks.localdb import LocalDatabase
+from benchmarks.synthetic import generate_catalog, generate_loan_histories
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(durations, ops, statements=0):
+    """
+    :param durations: 每次调用的耗时（秒）；整批计时时只有一个元素
+    :param ops: 操作次数
+    """
+    total = sum(durations)
+    result = {
+        'ops': ops,
+        'total_ms': round(total * 1000, 3),
+        'mean_us': round(total / ops * 1e6, 3) if ops else 0.0,
+    }
+    if len(durations) > 1:
+        ordered = sorted(durations)
+        result['p50_us'] = round(percentile(ordered, 0.5) * 1e6, 3)
+        result['p95_us'] = round(percentile(ordered, 0.95) * 1e6, 3)
+    if statements:
+        result['statements'] = statements
+        result['statements_per_op'] = round(statements / ops, 3)
+    return result
+
+
+class StageRunner:
+    """按阶段计时并统计数据库语句数"""
+
+    def __init__(self, database):
+        self.database = database
+        self.results = {}
+
+    def each(self, name, func, args_list):
+        """逐次调用计时，给出均值和分位数"""
+        before = self.database.statements
+        durations = []
+        for args in args_list:
+            start = time.perf_counter()
+            func(*args)
+            durations.append(time.perf_counter() - start)
+        self.results[name] = summarize(durations, len(durations), self.database.statements - before)
+        return self.results[name]
+
+    def batch(self, name, func, ops):
+        """整批计时，适合单次耗时只有几微秒的操作"""
+        before = self.database.statements
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+        self.results[name] = summarize([duration], ops, self.database.statements - before)
+        return self.results[name]
+
+
+def make_recommender(database):
+    recommender = BookRecommender(DB_CONFIG)
+    recommender.create_db_connection = database.connect
+    recommender.strategy = 'class'  # 相似书策略依赖离线索引，不在本基准范围内
+    return recommender
+
+
+def run_size(size, readers, top_n, seed):
+    rng = random.Random(seed)
+    setup_start = time.perf_counter()
+    catalog = generate_catalog(size, seed)
+    histories = generate_loan_histories(catalog, readers, seed)
+    database = LocalDatabase()
+    database.load_books(catalog)
+    setup_seconds = time.perf_counter() - setup_start
+
+    catalog_callnos = [row[3] for row in catalog]
+    loan_callnos = [item['callNo'] for items in histories.values() for item in items]
+    history_args = [(items,) for items in histories.values()]
+    stages = StageRunner(database)
+
+    # 索书号解析：冷解析、馆藏预计算、LRU 命中
+    parser = CallNumberParser()
+    stages.batch('parser.classify', lambda: [parser.classify(c) for c in catalog_callnos], size)
+    stages.batch('parser.precompute', lambda: parser.precompute(catalog_callnos), size)
+    lru_parser = CallNumberParser()
+    lru_parser.parse_many(loan_callnos)
+    stages.batch('parser.parse_callno_warm', lambda: [lru_parser.parse_callno(c) for c in loan_callnos],
+                 len(loan_callnos))
+
+    recommender = make_recommender(database)
+    processor = recommender.history_processor
+    profiles = recommender.profiles
+
+    # 索书号索引：从数据库全量构建（含馆藏索书号预计算）
+    def build_index():
+        with recommender.db_session() as (conn, cursor):
+            recommender.callno_index.refresh(cursor)
+
+    stages.batch('index.build', build_index, size)
+
+    # 借阅历史处理与画像折入
+    stages.each('history.process_history', processor.process_history, history_args)
+    stages.each('profile.fold_cold', lambda items: profiles.fold(profiles.empty_profile(), items),
+                history_args)
+
+    # 内存抽样
+    keys = list(recommender.callno_index.buckets)
+    excluded = ExclusionSet(rng.sample(range(1, size + 1), min(size, 40)))
+    sample_args = [rng.choice(keys) for _ in range(readers)]
+    stages.each('index.sample', lambda key: recommender.callno_index.sample(key[0], key[1], top_n, excluded),
+                [(key,) for key in sample_args])
+    stages.each('index.sample_any', lambda: recommender.callno_index.sample_any(top_n, excluded),
+                [()] * readers)
+
+    # 端到端：单个读者（首次推荐，画像从空开始）与批量推送
+    reader_args = list(histories.items())
+    stages.each('recommender.get_recommendations',
+                lambda reader_id, items: recommender.get_recommendations(reader_id, items, top_n),
+                reader_args)
+    stages.each('recommender.get_recommendations_repeat',
+                lambda reader_id, items: recommender.get_recommendations(reader_id, items, top_n),
+                reader_args)
+
+    database.reset_history()
+    bulk_recommender = make_recommender(database)
+    bulk_recommender.ensure_index()
+    stages.batch('recommender.get_recommendations_bulk',
+                 lambda: bulk_recommender.get_recommendations_bulk(reader_args, top_n), readers)
+
+    database.close()
+    return {
+        'setup_s': round(setup_seconds, 2),
+        'loans': len(loan_callnos),
+        'stages': stages.results,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(size, result):
+    print(f"\n== {size} 本书, {result['loans']} 条借阅 (准备 {result['setup_s']}s) ==")
+    print(f"{'stage':<42} {'ops':>8} {'mean us':>12} {'p95 us':>12} {'sql':>8}")
+    for name, stats in result['stages'].items():
+        p95 = f"{stats['p95_us']:.3f}" if 'p95_us' in stats else '-'
+        print(f"{name:<42} {stats['ops']:>8} {stats['mean_us']:>12.3f} {p95:>12} {stats.get('statements', 0):>8}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="推荐系统分阶段基准测试")
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    arg_parser.add_argument('--readers', type=int, default=1000, help="合成读者数")
+    arg_parser.add_argument('--top-n', type=int, default=4)
+    arg_parser.add_argument('--seed', type=int, default=42)
+    arg_parser.add_argument('--output', help="结果 JSON 文件路径")
+    args = arg_parser.parse_args(argv)
+
+    report = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'readers': args.readers,
+            'top_n': args.top_n,
+            'seed': args.seed,
+        },
+        'sizes': {},
+    }
+    for size in args.sizes:
+        result = run_size(size, args.readers, args.top_n, args.seed)
+        report['sizes'][str(size)] = result
+        print_results(size, result)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
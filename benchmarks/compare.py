@@ -0,0 +1,55 @@
+"""
+对比两次基准测试结果
+
+    python -m benchmarks.compare base.json head.json
+    python -m benchmarks.compare base.json head.json --threshold 1.2
+
+按阶段比较 mean_us，慢于 threshold 倍的阶段标记为回退，存在回退时退出码为 1。
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(base, head, threshold):
+    """返回 [(规模, 阶段, 基线 us, 当前 us, 比值, 是否回退), ...]"""
+    rows = []
+    for size, head_result in head['sizes'].items():
+        base_result = base['sizes'].get(size)
+        if not base_result:
+            continue
+        for stage, stats in head_result['stages'].items():
+            base_stats = base_result['stages'].get(stage)
+            if not base_stats or not base_stats['mean_us']:
+                continue
+            ratio = stats['mean_us'] / base_stats['mean_us']
+            rows.append((size, stage, base_stats['mean_us'], stats['mean_us'], ratio, ratio > threshold))
+    return rows
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="对比两次基准测试结果")
+    arg_parser.add_argument('base')
+    arg_parser.add_argument('head')
+    arg_parser.add_argument('--threshold', type=float, default=1.1, help="判定回退的耗时比值")
+    args = arg_parser.parse_args(argv)
+
+    base, head = load(args.base), load(args.head)
+    print(f"base {base['meta'].get('revision')}  ->  head {head['meta'].get('revision')}")
+    print(f"{'size':>8} {'stage':<42} {'base us':>12} {'head us':>12} {'ratio':>7}")
+
+    rows = compare(base, head, args.threshold)
+    for size, stage, base_us, head_us, ratio, regressed in rows:
+        mark = '  <-- 回退' if regressed else ''
+        print(f"{size:>8} {stage:<42} {base_us:>12.3f} {head_us:>12.3f} {ratio:>7.2f}{mark}")
+
+    return 1 if any(row[5] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
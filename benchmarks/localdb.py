@@ -0,0 +1,144 @@
+"""
+本地数据库替身：基于 SQLite，提供与 mysql.connector 连接相同的接口，
+并翻译推荐系统用到的 MySQL 语法（%s 占位符、NOW()、RAND()、INSERT IGNORE、ON DUPLICATE KEY UPDATE）。
+仅供基准测试使用，耗时不代表 MySQL 的绝对性能，用于同一环境下不同提交之间的对比。
+"""
+import re
+import sqlite3
+
+SCHEMA = [
+    """CREATE TABLE books (
+        序号 INTEGER PRIMARY KEY, 题名 TEXT, 责任者 TEXT, 索书号 TEXT,
+        出版社 TEXT, 出版年 TEXT, 标准号 TEXT, 简介 TEXT, 馆藏地 TEXT
+    )""",
+    """CREATE TABLE recommend_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, reader_id TEXT NOT NULL, book_call_no TEXT NOT NULL,
+        book_title TEXT NOT NULL, book_author TEXT, book_publisher TEXT, book_isbn TEXT,
+        recommend_time TEXT NOT NULL
+    )""",
+    "CREATE INDEX idx_reader_id ON recommend_history (reader_id)",
+    """CREATE TABLE reader_profiles (
+        reader_id TEXT PRIMARY KEY, class_freq TEXT NOT NULL, subclass_freq TEXT NOT NULL,
+        last_loan_key TEXT, loan_count INTEGER NOT NULL DEFAULT 0,
+        changed_at TIMESTAMP, pushed_at TIMESTAMP, updated_at TIMESTAMP
+    )""",
+    """CREATE TABLE loan_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, reader_id TEXT NOT NULL, loan_key TEXT NOT NULL,
+        call_no TEXT NOT NULL, loan_date TEXT, UNIQUE (reader_id, loan_key)
+    )""",
+    "CREATE INDEX idx_loan_reader_id ON loan_history (reader_id, id)",
+    """CREATE TABLE loan_history_sync (
+        reader_id TEXT PRIMARY KEY, newest_key TEXT, synced_at TIMESTAMP NOT NULL
+    )""",
+    """CREATE TABLE push_checkpoints (
+        run_id TEXT NOT NULL, shard INTEGER NOT NULL DEFAULT 0, last_reader_id INTEGER NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0, updated_at TIMESTAMP NOT NULL, PRIMARY KEY (run_id, shard)
+    )""",
+]
+
+TRANSLATIONS = [
+    (re.compile(r'%s'), '?'),
+    (re.compile(r'%%'), '%'),
+    (re.compile(r'\bNOW\(\)'), "datetime('now', 'localtime')"),
+    (re.compile(r"datetime\('now', 'localtime'\) - INTERVAL \? DAY"), "datetime('now', 'localtime', '-' || ? || ' days')"),
+    (re.compile(r'\bRAND\(\)'), 'RANDOM()'),
+    (re.compile(r'\bINSERT IGNORE\b'), 'INSERT OR IGNORE'),
+    (re.compile(r'ON DUPLICATE KEY UPDATE'), 'ON CONFLICT DO UPDATE SET'),
+    (re.compile(r'\bVALUES\((\w+)\)'), r'excluded.\1'),
+]
+
+
+def translate(query):
+    for pattern, replacement in TRANSLATIONS:
+        query = pattern.sub(replacement, query)
+    return query
+
+
+class LocalCursor:
+    def __init__(self, database, dictionary=False):
+        self.database = database
+        self.cursor = database.db.cursor()
+        self.dictionary = dictionary
+        self.rowcount = 0
+        self.lastrowid = None
+
+    def execute(self, query, params=()):
+        self.database.statements += 1
+        self.cursor.execute(translate(query), tuple(params))
+        self.rowcount = self.cursor.rowcount
+        self.lastrowid = self.cursor.lastrowid
+
+    def executemany(self, query, seq_params):
+        self.database.statements += 1
+        self.cursor.executemany(translate(query), [tuple(p) for p in seq_params])
+        self.rowcount = self.cursor.rowcount
+
+    def to_row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {d[0]: v for d, v in zip(self.cursor.description, row)}
+
+    def fetchone(self):
+        return self.to_row(self.cursor.fetchone())
+
+    def fetchall(self):
+        return [self.to_row(row) for row in self.cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self.cursor.close()
+
+
+class LocalConnection:
+    def __init__(self, database):
+        self.database = database
+
+    def cursor(self, dictionary=False, **kwargs):
+        return LocalCursor(self.database, dictionary)
+
+    def commit(self):
+        self.database.db.commit()
+
+    def rollback(self):
+        self.database.db.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class LocalDatabase:
+    """
+    内存 SQLite 数据库，所有连接共享同一个库
+    connect() 可直接替换 BookRecommender.create_db_connection
+    """
+
+    def __init__(self, path=':memory:'):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.statements = 0  # 已执行的 SQL 语句数，用于统计各阶段的数据库往返次数
+        for statement in SCHEMA:
+            self.db.execute(statement)
+
+    def load_books(self, rows):
+        """导入 synthetic.generate_catalog 生成的书籍行"""
+        self.db.executemany(
+            "INSERT INTO books (序号, 题名, 责任者, 索书号, 出版社, 出版年, 标准号, 简介) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        self.db.commit()
+
+    def reset_history(self):
+        """清空推荐记录和画像，使每轮测试从相同状态开始"""
+        self.db.execute("DELETE FROM recommend_history")
+        self.db.execute("DELETE FROM reader_profiles")
+        self.db.commit()
+
+    def connect(self):
+        return LocalConnection(self)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,66 @@
+"""合成馆藏与借阅历史：按中图法（CLC）类目分布生成索书号"""
+import random
+from datetime import date, timedelta
+
+# (类目前缀, 权重)：大致参照高校图书馆馆藏结构
+CLC_PREFIXES = [
+    ('A81', 1), ('B0', 2), ('B82', 2), ('B84', 3), ('C91', 2), ('D61', 2), ('D9', 3),
+    ('E0', 1), ('F0', 3), ('F27', 5), ('F32', 4), ('F83', 3), ('G4', 3), ('G64', 3),
+    ('H31', 6), ('H19', 2), ('I206', 2), ('I247', 8), ('I267', 4), ('I561', 3), ('I712', 3),
+    ('J2', 2), ('K2', 3), ('K825', 3), ('N0', 1), ('O1', 4), ('O4', 2), ('O6', 2),
+    ('P5', 1), ('Q5', 3), ('Q7', 2), ('Q94', 3), ('R1', 2), ('S1', 3), ('S3', 3),
+    ('S43', 2), ('S5', 4), ('S6', 3), ('S8', 3), ('TB', 1), ('TH', 1), ('TM', 2),
+    ('TN', 3), ('TP18', 3), ('TP3', 4), ('TP312', 6), ('TP393', 3), ('TQ', 1), ('TS2', 2),
+    ('TU', 2), ('TV', 1), ('U4', 1), ('V2', 1), ('X1', 1), ('X5', 2), ('Z2', 1),
+]
+
+TITLE_WORDS = ['研究', '导论', '原理', '实践', '教程', '概论', '方法', '应用', '史', '文集', '分析', '技术']
+
+
+def random_callno(rng, prefix=None):
+    """生成形如 TP312.8\\1234 的索书号"""
+    if prefix is None:
+        prefix = rng.choices([p for p, _ in CLC_PREFIXES], weights=[w for _, w in CLC_PREFIXES])[0]
+    detail = f".{rng.randrange(1, 99)}" if rng.random() < 0.7 else ''
+    return f"{prefix}{rng.randrange(0, 10)}{detail}\\{rng.randrange(1, 5000)}"
+
+
+def generate_catalog(size, seed=0):
+    """生成 size 本书的行 [(序号, 题名, 责任者, 索书号, 出版社, 出版年, 标准号, 简介), ...]"""
+    rng = random.Random(seed)
+    rows = []
+    for book_id in range(1, size + 1):
+        callno = random_callno(rng)
+        title = f"{callno.split(chr(92))[0]}{rng.choice(TITLE_WORDS)}{book_id}"
+        rows.append((
+            book_id, title, f"作者{rng.randrange(size // 5 + 1)}", callno,
+            f"出版社{rng.randrange(200)}", str(rng.randrange(1980, 2026)),
+            f"978{rng.randrange(10 ** 9):09d}", f"{title}的内容简介"
+        ))
+    return rows
+
+
+def generate_loan_histories(catalog, readers, seed=0, max_loans=60):
+    """
+    生成读者借阅历史 {reader_id: [{"callNo": ..., "readerId": ..., "loanDate": ...}, ...]}
+    每位读者偏好 1~3 个类目，约 80% 的借阅落在偏好类目内；与汇文接口一致按借阅时间倒序。
+    """
+    rng = random.Random(seed)
+    by_prefix = {}
+    for row in catalog:
+        by_prefix.setdefault(row[3][:2], []).append(row[3])
+    prefixes = list(by_prefix)
+    all_callnos = [row[3] for row in catalog]
+
+    histories = {}
+    for i in range(readers):
+        reader_id = f"R{i:08d}"
+        favourites = rng.sample(prefixes, min(len(prefixes), rng.randint(1, 3)))
+        loans = []
+        loan_date = date(2025, 6, 30)
+        for _ in range(rng.randrange(0, max_loans + 1)):
+            pool = by_prefix[rng.choice(favourites)] if rng.random() < 0.8 else all_callnos
+            loan_date -= timedelta(days=rng.randrange(0, 15))
+            loans.append({"callNo": rng.choice(pool), "readerId": reader_id, "loanDate": loan_date.isoformat()})
+        histories[reader_id] = loans
+    return histories
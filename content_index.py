@@ -0,0 +1,312 @@
+import heapq
+import math
+import os
+import pickle
+import sys
+from array import array
+from collections import Counter, defaultdict
+
+import mysql.connector
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+
+def char_ngrams(text, n=2):
+    """按字符切分 n-gram（适合中文），忽略标点和空白"""
+    chars = [c for c in (text or '').lower() if c.isalnum()]
+    if len(chars) < n:
+        return [''.join(chars)] if chars else []
+    return [''.join(chars[i:i + n]) for i in range(len(chars) - n + 1)]
+
+
+def book_terms(title, intro):
+    """书籍的词频：题名权重加倍"""
+    terms = Counter(char_ngrams(title))
+    for term in terms:
+        terms[term] *= 2
+    terms.update(char_ngrams(intro))
+    return terms
+
+
+class ContentIndex:
+    """
+    基于 题名 + 简介 的内容相似度索引
+    字符二元组 TF-IDF，每本书只保留权重最高的 max_terms 个词，
+    离线预计算 top-k 相似书，以定长数组紧凑保存（行号与 doc_ids 对齐）。
+    """
+
+    def __init__(self, top_k=10, max_terms=32, max_df_ratio=0.05):
+        self.top_k = top_k
+        self.max_terms = max_terms
+        self.max_df_ratio = max_df_ratio  # 出现在超过该比例书籍中的词视为停用词，不参与打分
+        self.n_docs = 0
+        self.vocab = {}  # {n-gram: 词编号}
+        self.df = array('l')  # 词编号 -> 文档频率
+        self.doc_ids = array('l')  # 行号 -> 序号
+        self.rows = {}  # 序号 -> 行号
+        self.terms = array('l')  # 每行 max_terms 个词编号，-1 填充
+        self.weights = array('f')
+        self.neighbor_ids = array('l')  # 每行 top_k 个相似书序号，0 填充
+        self.neighbor_scores = array('f')
+        self.postings = None  # 构建/增量更新时使用的倒排表 {词编号: (行号数组, 权重数组)}
+        self.path = None
+        self.mtime = None
+
+    @property
+    def ready(self):
+        return bool(self.rows)
+
+    @property
+    def max_id(self):
+        return max(self.doc_ids) if self.doc_ids else 0
+
+    # ---------------------- 构建 ----------------------
+    def build(self, fetch_rows):
+        """
+        全量构建
+        :param fetch_rows: 可调用对象，每次调用返回新的 (序号, 题名, 简介) 迭代器（需遍历两遍）
+        """
+        path, mtime = self.path, self.mtime
+        self.__init__(self.top_k, self.max_terms, self.max_df_ratio)
+        self.path, self.mtime = path, mtime
+
+        # 第一遍统计文档频率
+        for _, title, intro in fetch_rows():
+            self.n_docs += 1
+            for term in book_terms(title, intro):
+                self.df[self.term_id(term)] += 1
+
+        # 第二遍计算向量
+        self.postings = defaultdict(lambda: (array('l'), array('f')))
+        for book_id, title, intro in fetch_rows():
+            self.append_doc(book_id, book_terms(title, intro))
+
+        for row in range(len(self.doc_ids)):
+            self.set_neighbors(row, self.score_row(row))
+
+    def add(self, rows):
+        """
+        增量加入新书：更新文档频率、计算新书向量和相似书，
+        并把新书插入到已有书籍的相似书列表中（已有书籍的 IDF 权重待下次全量构建时更新）
+        """
+        self.ensure_postings()
+        docs = [(book_id, book_terms(title, intro)) for book_id, title, intro in rows if book_id not in self.rows]
+        self.n_docs += len(docs)
+        for _, terms in docs:
+            for term in terms:
+                self.df[self.term_id(term)] += 1
+
+        new_rows = [self.append_doc(book_id, terms) for book_id, terms in docs]
+        for row in new_rows:
+            scored = self.score_row(row)
+            self.set_neighbors(row, scored)
+            for other, score in scored:
+                self.insert_neighbor(other, self.doc_ids[row], score)
+        return len(new_rows)
+
+    def term_id(self, term):
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = self.vocab[term] = len(self.df)
+            self.df.append(0)
+        return term_id
+
+    def append_doc(self, book_id, terms):
+        """计算 TF-IDF 向量（保留前 max_terms 个词并 L2 归一化），返回行号"""
+        weighted = []
+        for term, tf in terms.items():
+            term_id = self.vocab[term]
+            idf = math.log((self.n_docs + 1) / (self.df[term_id] + 1)) + 1
+            weighted.append(((1 + math.log(tf)) * idf, term_id))
+        top = heapq.nlargest(self.max_terms, weighted)
+        norm = math.sqrt(sum(w * w for w, _ in top)) or 1.0
+
+        row = len(self.doc_ids)
+        self.doc_ids.append(book_id)
+        self.rows[book_id] = row
+        for w, term_id in top:
+            self.terms.append(term_id)
+            self.weights.append(w / norm)
+            posting_rows, posting_weights = self.postings[term_id]
+            posting_rows.append(row)
+            posting_weights.append(w / norm)
+        padding = self.max_terms - len(top)
+        self.terms.extend([-1] * padding)
+        self.weights.extend([0.0] * padding)
+        self.neighbor_ids.extend([0] * self.top_k)
+        self.neighbor_scores.extend([0.0] * self.top_k)
+        return row
+
+    def ensure_postings(self):
+        if self.postings is not None:
+            return
+
+        self.postings = defaultdict(lambda: (array('l'), array('f')))
+        for p, term_id in enumerate(self.terms):
+            if term_id >= 0:
+                posting_rows, posting_weights = self.postings[term_id]
+                posting_rows.append(p // self.max_terms)
+                posting_weights.append(self.weights[p])
+
+    def score_row(self, row):
+        """按倒排表累加余弦相似度，返回 [(行号, 得分), ...]"""
+        max_postings = max(100, int(len(self.doc_ids) * self.max_df_ratio))
+        scores = defaultdict(float)
+        base = row * self.max_terms
+        for p in range(base, base + self.max_terms):
+            term_id = self.terms[p]
+            if term_id < 0:
+                break
+            posting_rows, posting_weights = self.postings.get(term_id, ((), ()))
+            if len(posting_rows) > max_postings:
+                continue
+            w = self.weights[p]
+            for other, w2 in zip(posting_rows, posting_weights):
+                scores[other] += w * w2
+        scores.pop(row, None)
+        return heapq.nlargest(self.top_k, scores.items(), key=lambda x: x[1])
+
+    def set_neighbors(self, row, scored):
+        base = row * self.top_k
+        for i in range(self.top_k):
+            if i < len(scored):
+                other, score = scored[i]
+                self.neighbor_ids[base + i] = self.doc_ids[other]
+                self.neighbor_scores[base + i] = score
+            else:
+                self.neighbor_ids[base + i] = 0
+                self.neighbor_scores[base + i] = 0.0
+
+    def insert_neighbor(self, row, book_id, score):
+        """把新书插入某行按得分降序的相似书列表"""
+        base = row * self.top_k
+        last = base + self.top_k - 1
+        if score <= self.neighbor_scores[last]:
+            return
+        i = last
+        while i > base and self.neighbor_scores[i - 1] < score:
+            self.neighbor_ids[i] = self.neighbor_ids[i - 1]
+            self.neighbor_scores[i] = self.neighbor_scores[i - 1]
+            i -= 1
+        self.neighbor_ids[i] = book_id
+        self.neighbor_scores[i] = score
+
+    # ---------------------- 查询 ----------------------
+    def neighbors(self, book_id):
+        """返回某本书的相似书 [(序号, 相似度), ...]"""
+        row = self.rows.get(book_id)
+        if row is None:
+            return []
+        base = row * self.top_k
+        return [
+            (self.neighbor_ids[p], self.neighbor_scores[p])
+            for p in range(base, base + self.top_k)
+            if self.neighbor_ids[p]
+        ]
+
+    def related(self, book_id, n=5):
+        """与某本书内容最相近的 n 本书的序号"""
+        return [other for other, _ in self.neighbors(book_id)[:n]]
+
+    def recommend(self, seed_ids, n, excluded=()):
+        """累加读者每本借阅书的相似书得分，返回得分最高且未被排除的 n 本"""
+        scores = defaultdict(float)
+        for seed in set(seed_ids):
+            for other, score in self.neighbors(seed):
+                scores[other] += score
+
+        ranked = heapq.nlargest(
+            n, ((score, book_id) for book_id, score in scores.items() if book_id not in excluded)
+        )
+        return [book_id for _, book_id in ranked]
+
+    # ---------------------- 持久化 ----------------------
+    def save(self, path):
+        state = {key: getattr(self, key) for key in (
+            'top_k', 'max_terms', 'max_df_ratio', 'n_docs', 'vocab', 'df', 'doc_ids',
+            'terms', 'weights', 'neighbor_ids', 'neighbor_scores'
+        )}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """加载索引文件，文件不存在时返回空索引"""
+        index = cls()
+        index.path = path
+        return index.load_if_changed() or index
+
+    def load_if_changed(self):
+        """
+        索引文件被离线任务更新后，加载为一个新的索引对象返回；文件不存在或没有变化时返回 None
+        不修改当前对象：调用方整体替换引用，正在查询的线程读到的始终是同一份完整的索引
+        """
+        if not self.path or not os.path.exists(self.path):
+            return None
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return None
+
+        with open(self.path, 'rb') as f:
+            state = pickle.load(f)
+        index = ContentIndex()
+        index.__dict__.update(state)
+        index.rows = {book_id: row for row, book_id in enumerate(index.doc_ids)}
+        index.path = self.path
+        index.mtime = mtime
+        return index
+
+
+# ====================== 离线构建 ======================
+def get_db_connection():
+    return mysql.connector.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        user=os.getenv('DB_USER', ''),
+        password=os.getenv('DB_PASSWORD', ''),
+        database=os.getenv('DB_DATABASE', 'library_db'),
+        charset='utf8mb4'
+    )
+
+
+def fetch_books(conn, min_id=0):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT 序号, 题名, 简介 FROM books
+            WHERE 序号 > %s
+            ORDER BY 序号
+        """, (min_id,))
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def main(argv):
+    """
+    用法:
+    python content_index.py build   全量构建
+    python content_index.py update  导入新书后增量更新
+    """
+    command = argv[1] if len(argv) > 1 else 'update'
+    path = os.getenv('CONTENT_INDEX_PATH', 'content_index.pkl')
+    conn = get_db_connection()
+    try:
+        index = ContentIndex.open(path)
+        if command == 'build' or not index.ready:
+            index.build(lambda: fetch_books(conn))
+            print(f"全量构建完成：{len(index.doc_ids)} 本书")
+        else:
+            added = index.add(list(fetch_books(conn, index.max_id)))
+            print(f"增量更新完成：新增 {added} 本书")
+        index.save(path)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
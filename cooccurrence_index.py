@@ -0,0 +1,243 @@
+import heapq
+import math
+import os
+import pickle
+import sys
+import time
+from array import array
+from collections import defaultdict
+
+import mysql.connector
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+
+class CoBorrowIndex:
+    """
+    基于共同借阅的物品协同过滤索引
+    由读者借阅篮子构建稀疏共现矩阵，按余弦归一化后为每本书预计算 top-k 相似书，
+    以 CSR 布局（indptr / indices / data 三个数组）紧凑保存。
+    由本模块离线构建并保存为文件，应用进程在文件更新后加载（与内容相似度索引相同）。
+    """
+
+    def __init__(self, top_k=20, max_basket=50):
+        self.top_k = top_k
+        self.max_basket = max_basket  # 每位读者参与计算的最近借阅数（共现计算量随其平方增长）
+        # (行号映射 {序号: 行}, indptr, indices, data)，重建后整体替换
+        self.matrix = ({}, array('l', [0]), array('l'), array('f'))
+        self.built_at = 0
+        self.path = None
+        self.mtime = None
+
+    @property
+    def ready(self):
+        return bool(self.matrix[0])
+
+    def build(self, baskets):
+        """
+        重建相似书索引
+        先建 书 -> 篮子 的倒排表，再逐本书累加共现并只保留 top-k：
+        任一时刻只有一行共现计数在内存中，而不是整个 书 x 书 共现字典
+        :param baskets: (序号列表, 权重) 篮子的迭代器，如借阅历史和推荐历史
+        """
+        items_of = []  # 篮子编号 -> 去重后的序号数组
+        weights = array('f')
+        postings = defaultdict(lambda: array('l'))  # 序号 -> 篮子编号数组
+        item_freq = defaultdict(float)
+        for basket, weight in baskets:
+            items = array('l', list(dict.fromkeys(basket))[:self.max_basket])
+            for i in items:
+                item_freq[i] += weight
+                postings[i].append(len(items_of))
+            items_of.append(items)
+            weights.append(weight)
+
+        row_of = {}
+        indptr = array('l', [0])
+        indices = array('l')
+        data = array('f')
+        for i in sorted(postings):
+            row = defaultdict(float)
+            for n in postings[i]:
+                weight = weights[n]
+                for j in items_of[n]:
+                    if j != i:
+                        row[j] += weight
+            if not row:
+                continue
+            scored = heapq.nlargest(
+                self.top_k,
+                ((w / math.sqrt(item_freq[i] * item_freq[j]), j) for j, w in row.items())
+            )
+            row_of[i] = len(indptr) - 1
+            for score, j in scored:
+                indices.append(j)
+                data.append(score)
+            indptr.append(len(indices))
+
+        self.matrix = (row_of, indptr, indices, data)
+        self.built_at = time.time()
+        return len(row_of)
+
+    def neighbors(self, book_id):
+        """返回某本书的相似书 [(序号, 相似度), ...]"""
+        row_of, indptr, indices, data = self.matrix
+        row = row_of.get(book_id)
+        if row is None:
+            return []
+        return [(indices[p], data[p]) for p in range(indptr[row], indptr[row + 1])]
+
+    def recommend(self, seed_ids, n, excluded=()):
+        """累加读者每本借阅书的相似书得分，返回得分最高且未被排除的 n 本"""
+        row_of, indptr, indices, data = self.matrix
+        scores = defaultdict(float)
+        for seed in set(seed_ids):
+            row = row_of.get(seed)
+            if row is None:
+                continue
+            for p in range(indptr[row], indptr[row + 1]):
+                scores[indices[p]] += data[p]
+
+        ranked = heapq.nlargest(
+            n, ((score, book_id) for book_id, score in scores.items() if book_id not in excluded)
+        )
+        return [book_id for _, book_id in ranked]
+
+    # ---------------------- 持久化 ----------------------
+    def save(self, path):
+        """写入临时文件后原子替换，加载方不会读到写了一半的文件"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.top_k, self.matrix, self.built_at), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def open(cls, path):
+        """加载索引文件，文件不存在时返回空索引"""
+        index = cls()
+        index.path = path
+        return index.load_if_changed() or index
+
+    def load_if_changed(self):
+        """索引文件被离线任务更新后，加载为一个新的索引对象返回；文件不存在或没有变化时返回 None"""
+        if not self.path or not os.path.exists(self.path):
+            return None
+
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return None
+
+        with open(self.path, 'rb') as f:
+            top_k, matrix, built_at = pickle.load(f)
+        index = CoBorrowIndex(top_k, self.max_basket)
+        index.matrix = matrix
+        index.built_at = built_at
+        index.path = self.path
+        index.mtime = mtime
+        return index
+
+
+# ====================== 离线构建 ======================
+def get_db_connection():
+    return mysql.connector.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        user=os.getenv('DB_USER', ''),
+        password=os.getenv('DB_PASSWORD', ''),
+        database=os.getenv('DB_DATABASE', 'library_db'),
+        charset='utf8mb4'
+    )
+
+
+def fetch_ids_by_callno(conn):
+    """索书号 -> 书籍序号列表（同一索书号可能对应多条记录）"""
+    ids_by_callno = defaultdict(list)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT 序号, 索书号 FROM books")
+        for book_id, callno in cursor:
+            if callno:
+                ids_by_callno[callno].append(book_id)
+    finally:
+        cursor.close()
+    return ids_by_callno
+
+
+def iter_baskets(conn, table, column, max_basket, max_readers, page_size=500):
+    """按 reader_id 分页读取各读者最近 max_basket 条索书号，最多 max_readers 位读者"""
+    cursor = conn.cursor()
+    try:
+        last_reader_id = ''
+        readers = 0
+        while readers < max_readers:
+            cursor.execute(f"""
+                SELECT DISTINCT reader_id FROM {table}
+                WHERE reader_id > %s
+                ORDER BY reader_id
+                LIMIT %s
+            """, (last_reader_id, min(page_size, max_readers - readers)))
+            reader_ids = [row[0] for row in cursor.fetchall()]
+            if not reader_ids:
+                return
+
+            placeholders = ', '.join(['%s'] * len(reader_ids))
+            cursor.execute(f"""
+                SELECT reader_id, {column} FROM {table}
+                WHERE reader_id IN ({placeholders})
+                ORDER BY reader_id, id DESC
+            """, tuple(reader_ids))
+            baskets = defaultdict(list)
+            for reader_id, callno in cursor.fetchall():
+                basket = baskets[reader_id]
+                if len(basket) < max_basket:
+                    basket.append(callno)
+            yield from baskets.values()
+
+            last_reader_id = reader_ids[-1]
+            readers += len(reader_ids)
+    finally:
+        cursor.close()
+
+
+def fetch_baskets(conn, max_basket, max_readers, recommend_weight=0.5):
+    """借阅历史（权重 1）和推荐历史（权重 recommend_weight）的 (序号数组, 权重) 篮子"""
+    ids_by_callno = fetch_ids_by_callno(conn)
+    for table, column, weight in (
+        ('loan_history', 'call_no', 1.0),
+        ('recommend_history', 'book_call_no', recommend_weight)
+    ):
+        for callnos in iter_baskets(conn, table, column, max_basket, max_readers):
+            book_ids = array('l')
+            for callno in callnos:
+                book_ids.extend(ids_by_callno.get(callno, ()))
+            if book_ids:
+                yield book_ids[:max_basket], weight
+
+
+def main(argv):
+    """
+    用法:
+    python cooccurrence_index.py build   全量构建（建议由 cron 定期执行）
+    """
+    command = argv[1] if len(argv) > 1 else 'build'
+    if command != 'build':
+        print(main.__doc__)
+        sys.exit(1)
+
+    path = os.getenv('COOCCURRENCE_INDEX_PATH', 'cooccurrence_index.pkl')
+    max_basket = int(os.getenv('COOCCURRENCE_MAX_BASKET', 50))
+    max_readers = int(os.getenv('COOCCURRENCE_MAX_READERS', 10000))
+    recommend_weight = float(os.getenv('COOCCURRENCE_RECOMMEND_WEIGHT', 0.5))
+    conn = get_db_connection()
+    try:
+        index = CoBorrowIndex(top_k=int(os.getenv('COOCCURRENCE_TOP_K', 20)), max_basket=max_basket)
+        count = index.build(fetch_baskets(conn, max_basket, max_readers, recommend_weight))
+        index.save(path)
+        print(f"共同借阅索引构建完成：{count} 本书")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
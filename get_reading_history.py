@@ -4,7 +4,13 @@ import time
 import uuid
 import hashlib
 import os
+import math
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # 加载环境变量
 load_dotenv()
@@ -25,95 +31,339 @@ def generate_hw_apiheader(app_id, app_key):
     }, separators=(',', ':'))
 
 
-def get_reading_history(reader_id, id_type=0, max_pages=1, page_size=10):
+class LatencyStats:
+    """接口调用耗时统计：累计次数/失败数，以及最近 window 次调用的分位数"""
+
+    def __init__(self, window=1000):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def record(self, seconds, ok=True):
+        with self.lock:
+            self.calls += 1
+            self.errors += 0 if ok else 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.recent.append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            recent = sorted(self.recent)
+            calls, errors, total, slowest = self.calls, self.errors, self.total, self.max
+
+        def pick(q):
+            return round(recent[min(len(recent) - 1, int(len(recent) * q))] * 1000, 1) if recent else 0.0
+
+        return {
+            'calls': calls,
+            'errors': errors,
+            'avg_ms': round(total / calls * 1000, 1) if calls else 0.0,
+            'p50_ms': pick(0.5),
+            'p95_ms': pick(0.95),
+            'max_ms': round(slowest * 1000, 1),
+        }
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后断开，reset_timeout 秒内直接拒绝请求；
+    到期后放行一次试探请求，成功则恢复，失败则重新计时
     """
-    获取读者借阅历史记录
 
-    参数:
-    reader_id: 读者证件号或条码号
-    id_type: 读者ID类型 (0=证件号, 1=条码号)，默认0
-    max_pages: 最大获取页数，默认1
-    page_size: 每页记录数，默认10
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
 
-    返回:
-    借阅历史记录列表，格式: [{"callNo": "索书号1"}, {"callNo": "索书号2"}, ...]
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HuiwenClient:
+    """
+    汇文 OPAC 接口客户端
+    配置在创建时读取一次；共用一个带连接池的 requests.Session（keep-alive），
+    5xx 和超时按指数退避重试，并统计每次调用的耗时。
+    调用方可传入截止时间（time.monotonic() 时刻），此时不重试、超时不超过剩余时间；
+    接口连续失败时熔断，断开期间直接返回失败。
+    多页历史可并发获取：全局并发受线程池（与连接池同大小）限制，单个读者受 reader_concurrency 限制。
     """
-    # 从环境变量获取配置
-    BASE_URL = os.getenv('HW_BASE_URL', "https://libopac.nwafu.edu.cn/meta-local/api")
-    APP_ID = os.getenv('HW_APP_ID', "")
-    APP_KEY = os.getenv('HW_APP_KEY', "")
 
-    all_loans = []
-    current_page = 1
+    def __init__(self, base_url=None, app_id=None, app_key=None, pool_size=None,
+                 max_retries=None, backoff=None, timeout=None, reader_concurrency=None):
+        self.base_url = base_url or os.getenv('HW_BASE_URL', "https://libopac.nwafu.edu.cn/meta-local/api")
+        self.app_id = app_id if app_id is not None else os.getenv('HW_APP_ID', "")
+        self.app_key = app_key if app_key is not None else os.getenv('HW_APP_KEY', "")
+        self.timeout = timeout or float(os.getenv('HW_TIMEOUT', 10))
+        pool_size = pool_size or int(os.getenv('HW_POOL_SIZE', 10))
+        max_retries = max_retries if max_retries is not None else int(os.getenv('HW_MAX_RETRIES', 2))
+        backoff = backoff if backoff is not None else float(os.getenv('HW_RETRY_BACKOFF', 0.3))
+        self.reader_concurrency = reader_concurrency or int(os.getenv('HW_READER_CONCURRENCY', 4))
 
-    while current_page <= max_pages:
-        # 生成认证头
-        auth_header = generate_hw_apiheader(APP_ID, APP_KEY)
+        # 查询接口是只读的，POST 也可以安全重试
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(['POST']),
+            raise_on_status=False
+        )
+        self.session = self.create_session(pool_size, retry)
+        # 有截止时间的调用不重试，以免退避等待超出预算
+        self.deadline_session = self.create_session(pool_size, 0)
+        self.breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('HW_BREAKER_FAILURES', 5)),
+            reset_timeout=float(os.getenv('HW_BREAKER_RESET', 30))
+        )
+        self.stats = LatencyStats()
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='huiwen')
 
-        # 构造请求
+    def create_session(self, pool_size, retry):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def fetch_loan_page(self, reader_id, id_type=0, page=1, page_size=10, deadline=None):
+        """
+        获取一页借阅历史
+        返回接口的 data 字段 {"items": [...], "total": n}，失败、超出截止时间或熔断时返回 None
+        """
+        session, timeout = self.session, self.timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            session, timeout = self.deadline_session, min(timeout, remaining)
+
+        if not self.breaker.allow():
+            return None
+
+        # 每次请求重新生成认证头（含时间戳和随机串）
         headers = {
-            "X-Hw-ApiAuth": auth_header,
+            "X-Hw-ApiAuth": generate_hw_apiheader(self.app_id, self.app_key),
             "Content-Type": "application/x-www-form-urlencoded"
         }
         data = {
             "id": reader_id,
             "type": id_type,
-            "currentPage": current_page,
+            "currentPage": page,
             "pageSize": page_size
         }
 
+        start = time.perf_counter()
+        ok = False
+        healthy = False  # 接口是否正常响应（业务错误不计入熔断）
         try:
-            # 发送请求
-            response = requests.post(
-                url=f"{BASE_URL}/v1/patron/loan_histories",
+            response = session.post(
+                url=f"{self.base_url}/v1/patron/loan_histories",
                 headers=headers,
                 data=data,
-                timeout=10  # 10秒超时
+                timeout=timeout
             )
 
             # 检查响应状态
             if response.status_code != 200:
                 print(f"API请求失败，状态码: {response.status_code}")
-                break
+                healthy = response.status_code < 500
+                return None
 
             # 解析JSON响应
             response_data = response.json()
+            healthy = True
 
             # 检查API返回码
             if response_data.get('code') != 0:
                 print(f"API返回错误: {response_data.get('message', '未知错误')}")
+                return None
+
+            ok = True
+            return response_data.get('data') or {}
+
+        except requests.exceptions.RequestException as e:
+            print(f"网络请求异常: {str(e)}")
+            return None
+        except json.JSONDecodeError:
+            print("响应解析错误: 无效的JSON格式")
+            return None
+        finally:
+            self.stats.record(time.perf_counter() - start, ok)
+            if healthy:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+    def get_reading_history(self, reader_id, id_type=0, max_pages=1, page_size=10, concurrent=False,
+                            deadline=None):
+        """
+        获取读者借阅历史记录，参数和返回值同模块级 get_reading_history
+        concurrent=True 时先取第一页读出 total，其余页并发获取，结果仍按页序排列
+        """
+        if concurrent and max_pages > 1:
+            return self.get_reading_history_concurrent(reader_id, id_type, max_pages, page_size, deadline)
+
+        all_loans = []
+        current_page = 1
+
+        while current_page <= max_pages:
+            page = self.fetch_loan_page(reader_id, id_type, current_page, page_size, deadline)
+            if page is None:
                 break
 
             # 提取借阅记录
-            loans = response_data.get('data', {}).get('items', [])
+            loans = page.get('items', [])
             if not loans:
                 break
 
-            # 转换为所需格式
-            for loan in loans:
-                # 确保callNo字段存在
-                call_no = loan.get('callNo', '')
-                if call_no:
-                    all_loans.append({"callNo": call_no, "readerId": reader_id})
+            all_loans.extend(self.to_loans(reader_id, loans))
 
             # 检查是否还有更多页面
-            total = response_data.get('data', {}).get('total', 0)
+            total = page.get('total', 0)
             if current_page * page_size >= total:
                 break
 
             current_page += 1
 
-        except requests.exceptions.RequestException as e:
-            print(f"网络请求异常: {str(e)}")
-            break
-        except json.JSONDecodeError:
-            print("响应解析错误: 无效的JSON格式")
-            break
-    # print(all_loans)
-    return all_loans
+        return all_loans
+
+    def get_reading_history_concurrent(self, reader_id, id_type, max_pages, page_size, deadline=None):
+        first = self.fetch_loan_page(reader_id, id_type, 1, page_size, deadline)
+        if not first or not first.get('items'):
+            return []
+
+        last_page = min(max_pages, math.ceil(first.get('total', 0) / page_size))
+        pages = self.fetch_loan_pages(reader_id, id_type, range(2, last_page + 1), page_size, deadline)
+        pages[1] = first
+
+        all_loans = []
+        for page_no in sorted(pages):
+            page = pages[page_no]
+            if not page or not page.get('items'):
+                break
+            all_loans.extend(self.to_loans(reader_id, page['items']))
+        return all_loans
+
+    def fetch_loan_pages(self, reader_id, id_type, page_nos, page_size, deadline=None):
+        """
+        并发获取多页借阅历史，同一读者同时在途的请求不超过 reader_concurrency
+        返回 {页码: data}，失败的页为 None；某页失败或为空后不再提交其后的页，
+        已在途的请求照常收尾，调用方按页序读到第一个失败或空页为止
+        """
+        pages = {}
+        remaining = iter(page_nos)
+        pending = {}
+
+        def submit_next():
+            page_no = next(remaining, None)
+            if page_no is not None:
+                future = self.executor.submit(
+                    self.fetch_loan_page, reader_id, id_type, page_no, page_size, deadline
+                )
+                pending[future] = page_no
+
+        # 同一读者同时在途的请求不超过 reader_concurrency
+        for _ in range(self.reader_concurrency):
+            submit_next()
+
+        stopped = False
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_no = pending.pop(future)
+                page = future.result()
+                pages[page_no] = page
+                if page is None or not page.get('items'):
+                    # 与顺序获取一致：某页失败或为空时不再继续
+                    stopped = True
+                elif not stopped:
+                    submit_next()
+        return pages
+
+    def to_loans(self, reader_id, loans):
+        """转换为所需格式，跳过没有索书号的记录"""
+        return [
+            {"callNo": loan.get('callNo', ''), "readerId": reader_id, "loanDate": loan.get('loanDate', '')}
+            for loan in loans
+            if loan.get('callNo', '')
+        ]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+        self.deadline_session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """进程内共享的汇文客户端（首次使用时创建）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = HuiwenClient()
+    return _client
+
+
+def get_reading_history(reader_id, id_type=0, max_pages=1, page_size=10, concurrent=False, timeout_budget=None):
+    """
+    获取读者借阅历史记录
+
+    参数:
+    reader_id: 读者证件号或条码号
+    id_type: 读者ID类型 (0=证件号, 1=条码号)，默认0
+    max_pages: 最大获取页数，默认1
+    page_size: 每页记录数，默认10
+    concurrent: 是否并发获取第一页之后的各页，默认False
+    timeout_budget: 整次获取的时间预算（秒），超出后返回已获取的部分，默认不限
+
+    返回:
+    借阅历史记录列表，格式: [{"callNo": "索书号1"}, {"callNo": "索书号2"}, ...]
+    """
+    deadline = time.monotonic() + timeout_budget if timeout_budget else None
+    return get_client().get_reading_history(reader_id, id_type, max_pages, page_size, concurrent, deadline)
 
 
 # if __name__ == '__main__':
 
 #     get_reading_history("")
-
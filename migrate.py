@@ -0,0 +1,208 @@
+import os
+import re
+import sys
+
+import mysql.connector
+from dotenv import load_dotenv
+from mysql.connector import Error, errorcode
+
+import queries
+
+# 加载环境变量
+load_dotenv()
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+# 迁移脚本文件名：四位版本号_说明.sql
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+LOCK_NAME = 'book_system_schema_migrations'
+
+# 热点查询（名称, SQL, 示例参数），SQL 与 app.py 共用 queries.py，verify 对每条执行 EXPLAIN
+IN_ONE = '%s'  # IN 列表查询按单个读者展开
+HOT_QUERIES = [
+    ('book_detail: 书籍', queries.BOOK_BY_ID, (1,)),
+    ('book_detail: 同作者的书', queries.BOOKS_BY_AUTHOR, ('x', 1)),
+    ('book_detail: 感悟列表', queries.BOOK_REFLECTIONS, (1,)),
+    ('web_index: 搜索计数', queries.COUNT_BOOKS_BY_TITLE, ('%x%',)),
+    ('reflections_square: 按题名查书', queries.BOOK_ID_BY_TITLE, ('x',)),
+    ('reflections_square: 按书名查自建书目', queries.USER_BOOK_ID_BY_TITLE, ('x',)),
+    ('reflections_square: 感悟计数', queries.COUNT_REFLECTIONS, ()),
+    ('reflections_square: 感悟分页', queries.REFLECTIONS_PAGE, (10, 0)),
+    ('my_page: 我的感悟', queries.READER_REFLECTIONS, (1,)),
+    ('get_current_reader: 按 openid', queries.READER_BY_OPENID, ('x',)),
+    ('get_reader_id: 按读者证号', queries.READER_ID_BY_CARD, ('x',)),
+    ('定时推送: 下一批读者', queries.READER_BATCH, (0, 1, 0, 100)),
+    ('排除集合: 已推荐索书号', queries.RECOMMENDED_CALLNOS.format(placeholders=IN_ONE), ('x',)),
+    ('压缩推荐历史: 超出上限的读者', queries.OVERSIZED_RECOMMEND_READERS, (20,)),
+    ('压缩推荐历史: 截断位置', queries.RECOMMEND_HISTORY_CUTOFF, ('x', 19)),
+    ('压缩推荐历史: 删除旧记录', queries.DELETE_RECOMMEND_HISTORY_BEFORE, ('x', 1)),
+    ('借阅历史: 按读者读取', queries.LOAN_HISTORY_BY_READERS.format(placeholders=IN_ONE), ('x',)),
+    ('借阅历史: 同步状态', queries.LOAN_SYNC_STATES.format(placeholders=IN_ONE), ('x',)),
+    ('读者画像: 批量加载', queries.READER_PROFILES_BY_READERS.format(placeholders=IN_ONE), ('x',)),
+    ('定时推送: 读取进度', queries.PUSH_CHECKPOINT, ('x', 0)),
+]
+# 预估扫描行数低于此值的全表扫描不计：小表（如推送进度）或测试库上优化器直接扫表更快
+VERIFY_MIN_ROWS = int(os.getenv('MIGRATE_VERIFY_MIN_ROWS', 1000))
+
+
+def get_db_connection():
+    return mysql.connector.connect(
+        host=os.getenv('DB_HOST', 'localhost'),
+        user=os.getenv('DB_USER', ''),
+        password=os.getenv('DB_PASSWORD', ''),
+        database=os.getenv('DB_DATABASE', 'library_db'),
+        charset='utf8mb4'
+    )
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    """按版本号返回 [(版本号, 名称, 路径), ...]，版本号重复时报错"""
+    migrations = {}
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise ValueError(f"迁移版本号重复: {filename}")
+        migrations[version] = (version, match.group(2), os.path.join(directory, filename))
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def split_statements(sql):
+    """去掉 -- 注释后按分号拆分为单条语句"""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in '\n'.join(lines).split(';') if statement.strip()]
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def apply_migration(conn, cursor, version, name, path):
+    """
+    逐条执行迁移脚本，全部成功后记录版本
+    DDL 会隐式提交，中途失败时已执行的语句不会回滚；重新运行时已存在的索引/列会被跳过
+    """
+    with open(path, encoding='utf-8') as f:
+        statements = split_statements(f.read())
+
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+        except Error as e:
+            if e.errno not in (errorcode.ER_DUP_KEYNAME, errorcode.ER_DUP_FIELDNAME):
+                raise
+            print(f"  跳过（已存在）: {e.msg}")
+
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, NOW())",
+        (version, name)
+    )
+    conn.commit()
+
+
+def migrate(conn):
+    """执行所有未应用的迁移，返回本次执行的数量"""
+    cursor = conn.cursor()
+    try:
+        # 多个实例同时部署时只有一个执行迁移
+        cursor.execute("SELECT GET_LOCK(%s, 60)", (LOCK_NAME,))
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError("等待迁移锁超时，可能有其他进程正在执行迁移")
+        try:
+            ensure_migrations_table(cursor)
+            done = applied_versions(cursor)
+            count = 0
+            for version, name, path in load_migrations():
+                if version in done:
+                    continue
+                print(f"执行迁移 {version:04d}_{name} ...")
+                apply_migration(conn, cursor, version, name, path)
+                count += 1
+            return count
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+            cursor.fetchone()
+    finally:
+        cursor.close()
+
+
+def status(conn):
+    cursor = conn.cursor()
+    try:
+        ensure_migrations_table(cursor)
+        done = applied_versions(cursor)
+    finally:
+        cursor.close()
+    for version, name, _ in load_migrations():
+        print(f"{version:04d}_{name:<40} {'已应用' if version in done else '未应用'}")
+
+
+def explain(conn, sql, params):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute(f"EXPLAIN {sql}", params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def verify(conn, min_rows=VERIFY_MIN_ROWS):
+    """
+    对热点查询执行 EXPLAIN，返回全表扫描（type=ALL）的 [(查询名称, 表名), ...]
+    :param min_rows: 预估扫描行数低于此值的全表扫描不计（空库或小表上优化器可能直接扫表）
+    """
+    full_scans = []
+    for name, sql, params in HOT_QUERIES:
+        print(f"\n== {name}")
+        for row in explain(conn, sql, params):
+            scan = row.get('type') == 'ALL' and (row.get('rows') or 0) >= min_rows
+            if scan:
+                full_scans.append((name, row.get('table')))
+            print(f"  {str(row.get('table')):<16} type={str(row.get('type')):<8} key={str(row.get('key')):<24} "
+                  f"rows={row.get('rows')}{'  <-- 全表扫描' if scan else ''}")
+    return full_scans
+
+
+def main(argv):
+    """
+    用法:
+    python migrate.py                    执行未应用的迁移（migrations/NNNN_说明.sql）
+    python migrate.py status             查看各迁移是否已应用
+    python migrate.py verify [最少行数]   EXPLAIN 热点查询，存在全表扫描时退出码为 1（最少行数默认 1000）
+    """
+    command = argv[1] if len(argv) > 1 else 'up'
+    conn = get_db_connection()
+    try:
+        if command == 'up':
+            count = migrate(conn)
+            print(f"迁移完成：本次执行 {count} 个")
+        elif command == 'status':
+            status(conn)
+        elif command == 'verify':
+            full_scans = verify(conn, int(argv[2]) if len(argv) > 2 else VERIFY_MIN_ROWS)
+            if full_scans:
+                print(f"\n{len(full_scans)} 处全表扫描: " + ', '.join(f"{name}({table})" for name, table in full_scans))
+                return 1
+            print("\n所有热点查询均使用索引")
+        else:
+            print(main.__doc__)
+            return 2
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
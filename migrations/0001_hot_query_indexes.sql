@@ -0,0 +1,21 @@
+-- 热点查询索引
+-- 均为在线 DDL（ALGORITHM=INPLACE, LOCK=NONE），建索引期间表仍可读写。
+-- 每条语句只加一个索引，索引已存在时迁移工具会跳过该条继续执行。
+
+-- 书籍：按题名精确查找（发布感悟时解析书名）和搜索计数（覆盖索引扫描）
+ALTER TABLE books ADD INDEX idx_title (题名), ALGORITHM=INPLACE, LOCK=NONE;
+-- 书籍：详情页“同作者的书”
+ALTER TABLE books ADD INDEX idx_author (责任者), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 读者：/like、/post_reflection 按读者证号解析内部 id
+ALTER TABLE readers ADD INDEX idx_reader_card (reader_card), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 感悟：广场列表（status = 1 按时间倒序分页）
+ALTER TABLE reflections ADD INDEX idx_status_time (status, timestamp), ALGORITHM=INPLACE, LOCK=NONE;
+-- 感悟：书籍详情页，可替代外键 book_id 上自动创建的索引
+ALTER TABLE reflections ADD INDEX idx_book_status_time (book_id, status, timestamp), ALGORITHM=INPLACE, LOCK=NONE;
+-- 感悟：我的主页，可替代外键 reader_id 上自动创建的索引
+ALTER TABLE reflections ADD INDEX idx_reader_status_time (reader_id, status, timestamp), ALGORITHM=INPLACE, LOCK=NONE;
+
+-- 用户自建书目：发布感悟时按书名查找
+ALTER TABLE user_books ADD INDEX idx_title (title), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,43 @@
+-- 推荐相关的基线表：读者画像、本地借阅历史、借阅同步状态、定时推送进度
+-- 使用 CREATE TABLE IF NOT EXISTS，已按 DB.txt 手动建过表的数据库上执行不会改动已有表。
+-- books、readers、reflections 等原有表仍见 DB.txt。
+
+-- 读者画像表
+CREATE TABLE IF NOT EXISTS reader_profiles (
+    reader_id VARCHAR(50) PRIMARY KEY COMMENT '读者证号',
+    class_freq TEXT NOT NULL COMMENT '大类频次 JSON',
+    subclass_freq TEXT NOT NULL COMMENT '子类频次 JSON [[大类, 子类, 次数], ...]',
+    last_loan_key VARCHAR(255) COMMENT '最后折入的借阅记录水位',
+    loan_count INT NOT NULL DEFAULT 0 COMMENT '已折入借阅数',
+    changed_at DATETIME COMMENT '画像最近变化时间',
+    pushed_at DATETIME COMMENT '最近定时推送时间',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 本地借阅历史表
+CREATE TABLE IF NOT EXISTS loan_history (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    reader_id VARCHAR(50) NOT NULL COMMENT '读者证号',
+    loan_key VARCHAR(255) NOT NULL COMMENT '借阅记录标识（索书号|借阅日期）',
+    call_no VARCHAR(100) NOT NULL,
+    loan_date VARCHAR(50),
+    UNIQUE KEY uk_reader_loan (reader_id, loan_key),
+    INDEX idx_reader_id (reader_id, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 借阅历史同步状态表
+CREATE TABLE IF NOT EXISTS loan_history_sync (
+    reader_id VARCHAR(50) PRIMARY KEY COMMENT '读者证号',
+    newest_key VARCHAR(255) COMMENT '已保存的最新借阅记录标识',
+    synced_at DATETIME NOT NULL COMMENT '最近同步时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 定时推送进度表
+CREATE TABLE IF NOT EXISTS push_checkpoints (
+    run_id VARCHAR(32) NOT NULL COMMENT '推送批次（默认为执行日期）',
+    shard INT NOT NULL DEFAULT 0 COMMENT '读者分片编号',
+    last_reader_id INT NOT NULL DEFAULT 0 COMMENT '已处理到的 readers.id',
+    done TINYINT NOT NULL DEFAULT 0,
+    updated_at DATETIME NOT NULL,
+    PRIMARY KEY (run_id, shard)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,132 @@
+# 热点查询 SQL：app.py 执行这些语句，migrate.py verify 对同样的语句执行 EXPLAIN。
+# 带 {placeholders} 的语句按 IN 列表长度填入占位符后使用，如 SQL.format(placeholders='%s, %s')。
+
+# ---------------------- 书籍 ----------------------
+BOOK_BY_ID = "SELECT * FROM books WHERE 序号 = %s"
+
+BOOKS_BY_AUTHOR = "SELECT * FROM books WHERE 责任者 = %s AND 序号 != %s LIMIT 5"
+
+# 首页搜索计数；分页查询 `题名 LIKE '%词%'` 前导通配符无法使用 B-tree 索引，不在 verify 之列
+COUNT_BOOKS_BY_TITLE = "SELECT COUNT(*) AS total FROM books WHERE 题名 LIKE %s"
+
+BOOK_ID_BY_TITLE = "SELECT 序号 FROM books WHERE 题名 = %s LIMIT 1"
+
+USER_BOOK_ID_BY_TITLE = "SELECT id FROM user_books WHERE title = %s LIMIT 1"
+
+# ---------------------- 读者 ----------------------
+READER_BY_OPENID = "SELECT * FROM readers WHERE openid = %s"
+
+READER_ID_BY_CARD = "SELECT id FROM readers WHERE reader_card = %s"
+
+# 定时推送：按 id 顺序取本分片的下一批读者
+READER_BATCH = """
+    SELECT id, openid, reader_card, reader_type FROM readers
+    WHERE id > %s AND CRC32(reader_card) %% %s = %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+# ---------------------- 感悟 ----------------------
+BOOK_REFLECTIONS = """
+    SELECT
+        r.id as reflection_id,
+        r.content, r.timestamp,
+        readers.reader_card,
+        readers.nickname,
+        CASE readers.reader_type WHEN '0' THEN '证件号' ELSE '条码号' END as reader_type_text,
+        (SELECT COUNT(*) FROM likes l WHERE l.reflection_id = r.id) AS likes
+    FROM reflections r
+    JOIN readers ON r.reader_id = readers.id
+    WHERE r.book_id = %s AND r.status = 1
+    ORDER BY r.timestamp DESC
+"""
+
+COUNT_REFLECTIONS = "SELECT COUNT(*) AS total FROM reflections WHERE status = 1"
+
+REFLECTIONS_PAGE = """
+    SELECT
+        r.id AS reflection_id,
+        r.content,
+        r.timestamp,
+        COALESCE(b.题名, ub.title) AS book_title,
+        readers.reader_card,
+        readers.nickname,
+        (SELECT COUNT(*) FROM likes l WHERE l.reflection_id = r.id) AS likes_count
+    FROM reflections r
+    LEFT JOIN books b ON r.book_id = b.序号
+    LEFT JOIN user_books ub ON r.user_book_id = ub.id
+    JOIN readers ON r.reader_id = readers.id
+    WHERE r.status = 1
+    ORDER BY r.timestamp DESC
+    LIMIT %s OFFSET %s
+"""
+
+READER_REFLECTIONS = """
+    SELECT
+        r.id AS reflection_id,
+        r.content,
+        r.timestamp,
+        COALESCE(b.题名, ub.title) AS book_title,
+        (SELECT COUNT(*) FROM likes l WHERE l.reflection_id = r.id) AS likes
+    FROM reflections r
+    LEFT JOIN books b ON r.book_id = b.序号
+    LEFT JOIN user_books ub ON r.user_book_id = ub.id
+    WHERE r.reader_id = %s AND r.status = 1
+    ORDER BY r.timestamp DESC
+"""
+
+# ---------------------- 推荐历史 ----------------------
+# 排除集合：批量读取读者已推荐过的索书号
+RECOMMENDED_CALLNOS = """
+    SELECT reader_id, book_call_no
+    FROM recommend_history
+    WHERE reader_id IN ({placeholders})
+"""
+
+# 压缩：推荐记录超出上限的读者
+OVERSIZED_RECOMMEND_READERS = """
+    SELECT reader_id
+    FROM recommend_history
+    GROUP BY reader_id
+    HAVING COUNT(*) > %s
+"""
+
+# 压缩：第 keep 新的记录 id
+RECOMMEND_HISTORY_CUTOFF = """
+    SELECT id
+    FROM recommend_history
+    WHERE reader_id = %s
+    ORDER BY id DESC
+    LIMIT 1 OFFSET %s
+"""
+
+DELETE_RECOMMEND_HISTORY_BEFORE = """
+    DELETE FROM recommend_history
+    WHERE reader_id = %s AND id < %s
+"""
+
+# ---------------------- 借阅历史与画像 ----------------------
+LOAN_HISTORY_BY_READERS = """
+    SELECT reader_id, call_no, loan_date
+    FROM loan_history
+    WHERE reader_id IN ({placeholders})
+    ORDER BY reader_id, id DESC
+"""
+
+LOAN_SYNC_STATES = """
+    SELECT reader_id, newest_key, synced_at
+    FROM loan_history_sync
+    WHERE reader_id IN ({placeholders})
+"""
+
+READER_PROFILES_BY_READERS = """
+    SELECT reader_id, class_freq, subclass_freq, last_loan_key, loan_count, changed_at, pushed_at
+    FROM reader_profiles
+    WHERE reader_id IN ({placeholders})
+"""
+
+# ---------------------- 推送进度 ----------------------
+PUSH_CHECKPOINT = """
+    SELECT last_reader_id, done FROM push_checkpoints
+    WHERE run_id = %s AND shard = %s
+"""
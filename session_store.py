@@ -0,0 +1,310 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemorySessionStore:
+    """
+    进程内会话状态存储（单进程部署或开发环境）
+    每次读写都会续期，且所有会话的有效期相同，按访问顺序排列的 OrderedDict 同时也是按过期时间排列的，
+    过期清理只需从队头弹出，均摊 O(1)；超过 maxsize 时淘汰最久未活动的会话。
+    renew=False 时读取不续期（用作缓存），但仍移到队尾，超量时按最近使用顺序淘汰；
+    此时队头不一定最早过期，读取时另行检查过期时间。记录本进程的命中/未命中次数。
+    """
+
+    def __init__(self, ttl=1800, maxsize=10000, renew=True):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.renew = renew
+        self.data = OrderedDict()  # {openid: (过期时间, state)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def expire(self, now):
+        while self.data:
+            openid, (expires_at, _) = next(iter(self.data.items()))
+            if expires_at > now:
+                break
+            self.data.popitem(last=False)
+
+    def get_state(self, openid):
+        """返回会话状态并续期，没有或已过期时返回 None"""
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            entry = self.data.get(openid)
+            if entry is not None and entry[0] <= now:
+                del self.data[openid]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.renew:
+                self.data[openid] = (now + self.ttl, entry[1])
+            self.data.move_to_end(openid)
+            return entry[1]
+
+    def set_state(self, openid, state):
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            self.data[openid] = (now + self.ttl, state)
+            self.data.move_to_end(openid)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self, openid):
+        with self.lock:
+            self.data.pop(openid, None)
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.data), 'hits': self.hits, 'misses': self.misses}
+
+
+class SQLiteSessionStore:
+    """
+    基于 SQLite 文件的会话状态存储，同一台机器上的多个 gunicorn worker 共享
+    按主键读写，过期时间和最近使用时间列带索引；过期和超量清理按 purge_interval 间隔执行，只触及需要删除的行，
+    超量时按最近使用时间淘汰（LRU）。同一文件中可按 table 存放多组数据；
+    renew=False 时读取不续期（用作跨进程缓存），但仍更新最近使用时间。
+    命中/未命中次数只统计本进程的读取。
+    """
+
+    def __init__(self, path, ttl=1800, maxsize=10000, purge_interval=60, table='wechat_sessions', renew=True):
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.purge_interval = purge_interval
+        self.table = table
+        self.renew = renew
+        self.next_purge = 0
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with self.connect() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    openid TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL DEFAULT 0
+                )
+            """)
+            # 旧版本创建的表没有 last_used 列
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if 'last_used' not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_expires_at ON {table} (expires_at)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)")
+
+    def connect(self):
+        # 每个线程一个连接；fork 出的子进程（如 gunicorn --preload）不沿用父进程的连接
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def purge(self, now):
+        if now < self.next_purge:
+            return
+        self.next_purge = now + self.purge_interval
+        with self.connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+            conn.execute(f"""
+                DELETE FROM {self.table} WHERE openid IN (
+                    SELECT openid FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.maxsize,))
+
+    def get_state(self, openid):
+        """返回会话状态并续期，没有或已过期时返回 None"""
+        now = time.time()
+        self.purge(now)
+        with self.connect() as conn:
+            row = conn.execute(
+                f"SELECT state FROM {self.table} WHERE openid = ? AND expires_at > ?", (openid, now)
+            ).fetchone()
+            self.count(row is not None)
+            if row is None:
+                return None
+            if self.renew:
+                conn.execute(
+                    f"UPDATE {self.table} SET expires_at = ?, last_used = ? WHERE openid = ?",
+                    (now + self.ttl, now, openid)
+                )
+            else:
+                conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE openid = ?", (now, openid))
+            return row[0]
+
+    def set_state(self, openid, state):
+        now = time.time()
+        self.purge(now)
+        with self.connect() as conn:
+            conn.execute(f"""
+                INSERT INTO {self.table} (openid, state, expires_at, last_used) VALUES (?, ?, ?, ?)
+                ON CONFLICT(openid) DO UPDATE SET
+                    state = excluded.state, expires_at = excluded.expires_at, last_used = excluded.last_used
+            """, (openid, state, now + self.ttl, now))
+
+    def clear(self, openid):
+        with self.connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE openid = ?", (openid,))
+
+    def count(self, hit):
+        with self.stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """size 为共享表中的记录数（含尚未清理的过期记录），hits/misses 为本进程的计数"""
+        size = self.connect().execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        with self.stats_lock:
+            return {'size': size, 'hits': self.hits, 'misses': self.misses}
+
+
+class MemoryReplyStore:
+    """
+    进程内的消息回复登记（单进程部署或开发环境），接口同 SQLiteReplyStore
+    {消息标识: (过期时间, 是否已完成, 回复)}
+    """
+
+    def __init__(self, ttl=30):
+        self.ttl = ttl
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def claim(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is not None and entry[0] > now:
+                return False
+            self.data[key] = (now + self.ttl, False, None)
+            if len(self.data) > 10000:
+                self.data = {k: v for k, v in self.data.items() if v[0] > now}
+            return True
+
+    def complete(self, key, reply):
+        with self.lock:
+            self.data[key] = (time.monotonic() + self.ttl, True, reply)
+
+    def release(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        return entry[1], entry[2]
+
+
+class SQLiteReplyStore:
+    """
+    微信消息回复的跨进程登记，与会话存储共用同一个 SQLite 文件
+    微信重试的消息可能落到任意 worker：claim 原子地登记消息，只有登记成功的进程处理，
+    处理完成后 complete 保存回复，其他进程通过 get 取得同一回复；记录 ttl 秒后过期。
+    """
+
+    def __init__(self, path, ttl=30, purge_interval=10):
+        self.path = path
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.next_purge = 0
+        self.local = threading.local()
+        with self.connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS wechat_replies (
+                    msg_key TEXT PRIMARY KEY,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    reply TEXT,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_reply_expires_at ON wechat_replies (expires_at)")
+
+    def connect(self):
+        # 每个线程一个连接；fork 出的子进程（如 gunicorn --preload）不沿用父进程的连接
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def purge(self, conn, now):
+        if now < self.next_purge:
+            return
+        self.next_purge = now + self.purge_interval
+        conn.execute("DELETE FROM wechat_replies WHERE expires_at <= ?", (now,))
+
+    def claim(self, key):
+        """登记一条消息，返回是否由本进程处理（已有未过期的登记时为 False）"""
+        now = time.time()
+        with self.connect() as conn:
+            self.purge(conn, now)
+            conn.execute("DELETE FROM wechat_replies WHERE msg_key = ? AND expires_at <= ?", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO wechat_replies (msg_key, expires_at) VALUES (?, ?)", (key, now + self.ttl)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, key, reply):
+        with self.connect() as conn:
+            conn.execute(
+                "UPDATE wechat_replies SET done = 1, reply = ?, expires_at = ? WHERE msg_key = ?",
+                (reply, time.time() + self.ttl, key)
+            )
+
+    def release(self, key):
+        """处理失败时撤销登记，允许重试的消息重新处理"""
+        with self.connect() as conn:
+            conn.execute("DELETE FROM wechat_replies WHERE msg_key = ?", (key,))
+
+    def get(self, key):
+        """返回 (是否已完成, 回复)，没有登记或已过期时为 (False, None)"""
+        row = self.connect().execute(
+            "SELECT done, reply FROM wechat_replies WHERE msg_key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return (bool(row[0]), row[1]) if row else (False, None)
+
+
+def session_store_path(spec):
+    return spec[len('sqlite:'):] or os.path.join(tempfile.gettempdir(), 'wechat_sessions.db')
+
+
+def open_reply_store(spec=None, ttl=30):
+    """按配置创建消息回复登记，spec 同 open_session_store（与会话共用同一个 SQLite 文件）"""
+    spec = spec or 'sqlite'
+    if spec == 'memory':
+        return MemoryReplyStore(ttl)
+    if spec == 'sqlite' or spec.startswith('sqlite:'):
+        return SQLiteReplyStore(session_store_path(spec), ttl)
+    raise ValueError(f"不支持的会话存储: {spec}")
+
+
+def open_session_store(spec=None, ttl=1800, maxsize=10000, table='wechat_sessions', renew=True):
+    """
+    按配置创建会话存储
+    :param spec: 'memory' 或 'sqlite'（可写成 'sqlite:路径'），默认使用临时目录下的 SQLite 文件
+    :param table: SQLite 中的表名，同一文件可存放多组数据
+    :param renew: 读取时是否续期
+    """
+    spec = spec or 'sqlite'
+    if spec == 'memory':
+        return MemorySessionStore(ttl, maxsize, renew)
+    if spec == 'sqlite' or spec.startswith('sqlite:'):
+        return SQLiteSessionStore(session_store_path(spec), ttl, maxsize, table=table, renew=renew)
+    raise ValueError(f"不支持的会话存储: {spec}")
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 只导入 app 模块：不启动后台调度器和调度主节点选举，会话和消息登记使用进程内存储
+os.environ.setdefault('BACKGROUND_JOBS', '0')
+os.environ.setdefault('SESSION_STORE', 'memory')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+import time
+
+from app import TTLCache
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    time.sleep(0.06)
+    assert cache.get('a') is None
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('a') == 1
+    assert cache.get('b') is None
+
+
+def test_get_or_set_rebuilds_after_expiry():
+    cache = TTLCache(maxsize=10, ttl=0.05)
+    first, created = cache.get_or_set('k', lambda: 'old')
+    assert (first, created) == ('old', True)
+    time.sleep(0.06)
+    assert cache.get_or_set('k', lambda: 'new') == ('new', True)
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('a', 1)
+    cache.get('a')
+    cache.get('b')
+    cache.get_or_set('a', lambda: 2)
+    cache.get_or_set('c', lambda: 3)
+    assert cache.stats() == {'size': 2, 'hits': 2, 'misses': 2}
+    assert cache.pop('a') == 1
+    cache.clear()
+    assert cache.stats()['size'] == 0
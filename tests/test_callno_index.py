@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+from app import CallNumberIndex, CallNumberParser
+from benchmarks.localdb import LocalDatabase
+
+BOOKS = [
+    (1, 'I247.5/123'),
+    (2, 'I247.5/124'),
+    (3, 'TP312/45'),
+    (4, 'TP311.1/2'),
+    (5, 'O13/4'),
+    (6, ''),
+    (7, 'TP312/45'),
+]
+
+
+@pytest.fixture
+def index():
+    index = CallNumberIndex(CallNumberParser())
+    index.add_books(BOOKS)
+    return index
+
+
+def test_books_are_bucketed_by_class_and_subclass(index):
+    assert sorted(index.buckets[('I', 'I2')]) == [1, 2]
+    assert sorted(index.buckets[('T', 'TP')]) == [3, 4, 7]
+    assert sorted(index.buckets[('O', 'O1')]) == [5]
+    # 无法解析的索书号只参与随机抽样，不进任何分类桶
+    assert sorted(index.book_ids) == [1, 2, 3, 4, 5, 6, 7]
+    assert 6 not in {i for bucket in index.buckets.values() for i in bucket}
+
+
+def test_add_books_ignores_known_ids(index):
+    index.add_books([(3, 'I247.5/999'), (8, 'O13/5')])
+    assert sorted(index.buckets[('I', 'I2')]) == [1, 2]
+    assert sorted(index.buckets[('O', 'O1')]) == [5, 8]
+    assert index.max_id == 8
+
+
+def test_ids_for_callnos_maps_duplicate_call_numbers(index):
+    assert sorted(index.ids_for_callnos(['TP312/45', 'O13/4', 'missing'])) == [3, 5, 7]
+
+
+def test_sample_draws_only_from_the_subclass_bucket(index):
+    for _ in range(20):
+        assert set(index.sample('T', 'TP', 2)) <= {3, 4, 7}
+    assert sorted(index.sample('T', 'TP', 10)) == [3, 4, 7]
+    assert index.sample('Z', 'Z1', 3) == []
+
+
+def test_sample_skips_excluded_books(index):
+    assert sorted(index.sample('T', 'TP', 3, excluded={3})) == [4, 7]
+    assert index.sample('O', 'O1', 1, excluded={5}) == []
+
+
+def test_refresh_loads_only_new_books():
+    database = LocalDatabase()
+    database.db.executemany("INSERT INTO books (序号, 索书号) VALUES (?, ?)", BOOKS[:3])
+    database.db.commit()
+    index = CallNumberIndex(CallNumberParser())
+    conn = database.connect()
+    cursor = conn.cursor(dictionary=True)
+
+    index.refresh(cursor)
+    assert index.built and sorted(index.book_ids) == [1, 2, 3]
+
+    database.db.executemany("INSERT INTO books (序号, 索书号) VALUES (?, ?)", BOOKS[3:])
+    database.db.commit()
+    index.refresh(cursor)
+    assert sorted(index.book_ids) == [1, 2, 3, 4, 5, 6, 7]
+    assert sorted(index.buckets[('T', 'TP')]) == [3, 4, 7]
+
+    cursor.close()
+    conn.close()
+    database.close()
+
+
+def test_draw_filters_small_pools():
+    index = CallNumberIndex(CallNumberParser())
+    # 候选不超过 4n 时直接过滤后抽样：排除后剩余的全部返回
+    assert sorted(index.draw([1, 2, 3, 4], 2, excluded={1, 2})) == [3, 4]
+    assert index.draw([1, 2], 3, excluded={1, 2}) == []
+    assert index.draw([], 3, ()) == []
+    assert index.draw([1, 2], 0, ()) == []
+
+
+def test_draw_from_large_pool_returns_distinct_unexcluded_ids():
+    random.seed(0)
+    index = CallNumberIndex(CallNumberParser())
+    pool = list(range(1, 1001))
+    excluded = set(range(1, 501))
+    for _ in range(50):
+        chosen = index.draw(pool, 5, excluded)
+        assert len(chosen) == 5
+        assert len(set(chosen)) == 5
+        assert not excluded & set(chosen)
+
+
+def test_draw_gives_up_when_almost_everything_is_excluded():
+    index = CallNumberIndex(CallNumberParser())
+    pool = list(range(1, 1001))
+    # 随机下标重抽次数有上限，不会因排除项过多而长时间循环
+    assert len(index.draw(pool, 5, set(range(1, 1000)))) <= 1
+
+
+def test_sample_any_draws_from_the_whole_catalog(index):
+    assert sorted(index.sample_any(10)) == [1, 2, 3, 4, 5, 6, 7]
+    assert sorted(index.sample_any(10, excluded={1, 6})) == [2, 3, 4, 5, 7]
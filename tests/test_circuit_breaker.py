@@ -0,0 +1,52 @@
+import threading
+import time
+
+from get_reading_history import CircuitBreaker
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == 'closed' and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+
+    allowed = []
+    threads = [threading.Thread(target=lambda: allowed.append(breaker.allow())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert allowed.count(True) == 1
+
+
+def test_probe_success_closes_and_failure_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.allow()
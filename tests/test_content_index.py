@@ -0,0 +1,71 @@
+import pytest
+
+from content_index import ContentIndex, char_ngrams
+
+BOOKS = [
+    (1, '机器学习实战', '介绍常用的机器学习算法'),
+    (2, '机器学习导论', '机器学习的基础理论'),
+    (3, '红楼梦', '中国古典小说'),
+    (4, '红楼梦研究', '古典小说红楼梦的评论'),
+]
+
+
+def build(rows):
+    index = ContentIndex(top_k=3)
+    index.build(lambda: iter(rows))
+    return index
+
+
+def test_char_ngrams_skip_punctuation():
+    assert char_ngrams('红楼·梦！') == ['红楼', '楼梦']
+    assert char_ngrams('书') == ['书']
+    assert char_ngrams(None) == []
+
+
+def test_build_finds_the_most_similar_books():
+    index = build(BOOKS)
+    assert index.ready
+    assert index.related(1, 1) == [2]
+    assert index.related(3, 1) == [4]
+    assert 1 not in index.related(1)
+    assert index.related(99) == []
+
+
+def test_neighbor_scores_are_sorted_cosines():
+    index = build(BOOKS)
+    scores = [score for _, score in index.neighbors(1)]
+    assert scores == sorted(scores, reverse=True)
+    assert all(0 < score <= 1.0 + 1e-6 for score in scores)
+
+
+def test_add_indexes_new_books_in_both_directions():
+    index = build([BOOKS[0], BOOKS[2]])
+    assert index.add([BOOKS[1], BOOKS[3], BOOKS[0]]) == 2
+
+    assert index.related(2, 1) == [1]
+    assert index.related(4, 1) == [3]
+    # 新书也插入到已有书籍的相似书列表中
+    assert index.related(1, 1) == [2]
+    assert index.related(3, 1) == [4]
+    assert index.max_id == 4
+
+
+def test_recommend_excludes_seen_books():
+    index = build(BOOKS)
+    assert sorted(index.recommend([1, 3], 2, excluded={1, 3})) == [2, 4]
+    assert 2 not in index.recommend([1], 3, excluded={2})
+
+
+def test_save_and_open(tmp_path):
+    path = str(tmp_path / 'content_index.pkl')
+    assert not ContentIndex.open(path).ready
+
+    index = build(BOOKS)
+    index.save(path)
+    loaded = ContentIndex.open(path)
+    assert loaded.related(1) == index.related(1)
+    assert loaded.load_if_changed() is None
+
+    # 加载后的索引可以继续增量更新
+    assert loaded.add([(5, '机器学习实践', '机器学习算法')]) == 1
+    assert 5 in loaded.related(1)
@@ -0,0 +1,74 @@
+import math
+
+import pytest
+
+from benchmarks.localdb import LocalDatabase
+from cooccurrence_index import CoBorrowIndex, fetch_baskets
+
+
+@pytest.fixture
+def index():
+    index = CoBorrowIndex(top_k=2)
+    index.build([
+        ([1, 2, 3], 1.0),
+        ([1, 2], 1.0),
+        ([2, 4], 1.0),
+        ([5], 1.0),
+    ])
+    return index
+
+
+def test_neighbors_are_cosine_normalised_co_counts(index):
+    neighbors = dict(index.neighbors(1))
+    # 1 和 2 共同出现 2 次，freq(1)=2、freq(2)=3
+    assert neighbors[2] == pytest.approx(2 / math.sqrt(2 * 3))
+    assert neighbors[3] == pytest.approx(1 / math.sqrt(2 * 1))
+    # 只在单本篮子里出现的书没有相似书
+    assert index.neighbors(5) == []
+    assert index.neighbors(99) == []
+
+
+def test_neighbors_keep_only_top_k(index):
+    assert len(index.neighbors(2)) == 2
+
+
+def test_recommend_sums_neighbor_scores_and_skips_excluded(index):
+    assert index.recommend([1], 2) == [2, 3]
+    assert index.recommend([1, 4], 1) == [2]
+    assert index.recommend([1], 2, excluded={3}) == [2]
+    assert index.recommend([99], 2) == []
+
+
+def test_duplicates_and_long_baskets_are_trimmed():
+    index = CoBorrowIndex(max_basket=2)
+    index.build([([1, 1, 2, 3], 1.0)])
+    assert [j for j, _ in index.neighbors(1)] == [2]
+    assert index.neighbors(3) == []
+
+
+def test_save_and_reload(index, tmp_path):
+    path = str(tmp_path / 'cooccurrence_index.pkl')
+    assert not CoBorrowIndex.open(path).ready
+
+    index.save(path)
+    loaded = CoBorrowIndex.open(path)
+    assert loaded.ready
+    assert loaded.recommend([1], 2) == index.recommend([1], 2)
+    assert loaded.load_if_changed() is None
+
+
+def test_fetch_baskets_maps_call_numbers_and_weights_recommendations():
+    database = LocalDatabase()
+    database.db.executemany("INSERT INTO books (序号, 索书号) VALUES (?, ?)", [(1, 'A1'), (2, 'B2'), (3, 'B2')])
+    database.db.executemany(
+        "INSERT INTO loan_history (reader_id, loan_key, call_no) VALUES (?, ?, ?)",
+        [('r1', 'k1', 'A1'), ('r1', 'k2', 'B2'), ('r2', 'k3', 'missing')]
+    )
+    database.db.execute(
+        "INSERT INTO recommend_history (reader_id, book_call_no, book_title, recommend_time) VALUES ('r1', 'A1', 't', 'now')"
+    )
+    database.db.commit()
+
+    baskets = [(sorted(ids), weight) for ids, weight in fetch_baskets(database.connect(), max_basket=50, max_readers=10)]
+    assert baskets == [([1, 2, 3], 1.0), ([1], 0.5)]
+    database.close()
@@ -0,0 +1,58 @@
+import threading
+import time
+
+from app import ExclusionSet, TTLCache
+
+
+def run_threads(target, count):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_exclusion_set_membership():
+    excluded = ExclusionSet([5, 3, 3, 9])
+    assert len(excluded) == 3
+    assert 3 in excluded and 9 in excluded
+    assert 4 not in excluded
+
+
+def test_exclusion_set_concurrent_add_many_keeps_every_id():
+    excluded = ExclusionSet()
+
+    def worker(i):
+        for start in range(i * 1000, (i + 1) * 1000, 50):
+            excluded.add_many(range(start, start + 50))
+
+    run_threads(worker, 8)
+
+    assert len(excluded) == 8000
+    assert list(excluded.ids) == list(range(8000))
+
+
+def test_exclusion_set_add_many_accepts_generators():
+    excluded = ExclusionSet([1])
+    excluded.add_many(i for i in (1, 2, 3))
+    assert list(excluded.ids) == [1, 2, 3]
+
+
+def test_get_or_set_builds_value_once_under_concurrency():
+    cache = TTLCache(maxsize=10, ttl=60)
+    built = []
+    results = []
+
+    def factory():
+        built.append(1)
+        time.sleep(0.01)
+        return ExclusionSet([1, 2])
+
+    def worker(_):
+        results.append(cache.get_or_set('reader', factory))
+
+    run_threads(worker, 8)
+
+    assert len(built) == 1
+    assert len({id(value) for value, _ in results}) == 1
+    assert sum(1 for _, created in results if created) == 1
@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import app
+from app import CallNumberParser, LoanHistoryStore, ReadingHistoryProcessor
+from benchmarks.localdb import LocalDatabase
+from get_reading_history import HuiwenClient
+
+
+class FakeHuiwen:
+    """按时间倒序分页返回 loans 的汇文接口替身，记录请求过的页码"""
+
+    to_loans = HuiwenClient.to_loans
+
+    def __init__(self, loans, failing=()):
+        self.loans = loans
+        self.failing = set(failing)
+        self.requested = []
+
+    def fetch_loan_page(self, reader_id, id_type=0, page=1, page_size=10, deadline=None):
+        self.requested.append(page)
+        if page in self.failing:
+            return None
+        start = (page - 1) * page_size
+        return {'items': self.loans[start:start + page_size], 'total': len(self.loans)}
+
+    def fetch_loan_pages(self, reader_id, id_type, page_nos, page_size, deadline=None):
+        return {page_no: self.fetch_loan_page(reader_id, id_type, page_no, page_size, deadline) for page_no in page_nos}
+
+
+def make_loans(count):
+    """最新在前：C{count} ... C1"""
+    return [{'callNo': f"C{i}", 'loanDate': f"2026-01-01 {i:05d}"} for i in range(count, 0, -1)]
+
+
+def key(i):
+    return f"C{i}|2026-01-01 {i:05d}"
+
+
+@pytest.fixture
+def store():
+    return LoanHistoryStore(ReadingHistoryProcessor(CallNumberParser()), page_size=10, max_pages=20)
+
+
+@pytest.fixture
+def huiwen(monkeypatch):
+    def install(loans, failing=()):
+        client = FakeHuiwen(loans, failing)
+        monkeypatch.setattr(app, 'get_client', lambda: client)
+        return client
+    return install
+
+
+def test_first_sync_fetches_every_page(store, huiwen):
+    client = huiwen(make_loans(25))
+    items = store.fetch_new('r1', None)
+    assert [item['callNo'] for item in items] == [f"C{i}" for i in range(25, 0, -1)]
+    assert sorted(client.requested) == [1, 2, 3]
+
+
+def test_incremental_sync_stops_at_the_watermark_on_the_first_page(store, huiwen):
+    client = huiwen(make_loans(25))
+    items = store.fetch_new('r1', key(22))
+    assert [item['callNo'] for item in items] == ['C25', 'C24', 'C23']
+    assert client.requested == [1]
+
+
+def test_first_page_failure_returns_none(store, huiwen):
+    huiwen(make_loans(25), failing={1})
+    assert store.fetch_new('r1', None) is None
+
+
+def test_first_sync_is_capped_at_max_pages(huiwen):
+    store = LoanHistoryStore(ReadingHistoryProcessor(CallNumberParser()), page_size=10, max_pages=2)
+    client = huiwen(make_loans(45))
+    assert len(store.fetch_new('r1', None)) == 20
+    assert sorted(client.requested) == [1, 2]
+
+
+def test_watermark_on_a_later_page_stops_collection_there(store, huiwen):
+    huiwen(make_loans(25))
+    items = store.fetch_new('r1', key(12))
+    assert [item['callNo'] for item in items] == [f"C{i}" for i in range(25, 12, -1)]
+
+
+def test_failed_later_page_returns_none_instead_of_a_gap(store, huiwen):
+    huiwen(make_loans(25), failing={2})
+    assert store.fetch_new('r1', None) is None
+    # 水位在失败页之前时不受影响
+    assert len(store.fetch_new('r1', key(20))) == 5
+
+
+def test_collect_new_stops_at_watermark_or_empty_page(store):
+    client = FakeHuiwen([])
+    new_items = []
+    page = {'items': make_loans(5)}
+    assert store.collect_new(client, 'r1', page, key(3), new_items)
+    assert [item['callNo'] for item in new_items] == ['C5', 'C4']
+
+    new_items = []
+    assert not store.collect_new(client, 'r1', page, None, new_items)
+    assert len(new_items) == 5
+    assert store.collect_new(client, 'r1', {'items': []}, None, new_items)
+
+    # 没有索书号的记录被跳过，但整页不算空页
+    assert not store.collect_new(client, 'r1', {'items': [{'callNo': '', 'loanDate': 'x'}]}, None, [])
+
+
+def test_is_due_after_sync_interval(store):
+    assert store.is_due(None)
+    assert store.is_due(('k', None))
+    assert not store.is_due(('k', datetime.now()))
+    assert store.is_due(('k', datetime.now() - timedelta(seconds=store.sync_interval + 1)))
+
+
+def test_saved_history_loads_newest_first_without_duplicates(store, huiwen):
+    database = LocalDatabase()
+    conn = database.connect()
+    cursor = conn.cursor(dictionary=True)
+
+    huiwen(make_loans(3))
+    store.save_new(cursor, 'r1', store.fetch_new('r1', None), None)
+    states = store.sync_states(cursor, ['r1', 'r2'])
+    assert list(states) == ['r1'] and states['r1'][0] == key(3)
+
+    # 增量同步：只有新借阅，水位前移
+    huiwen(make_loans(5))
+    new_items = store.fetch_new('r1', states['r1'][0])
+    assert [item['callNo'] for item in new_items] == ['C5', 'C4']
+    store.save_new(cursor, 'r1', new_items, states['r1'][0])
+    store.save_new(cursor, 'r1', new_items, states['r1'][0])
+
+    histories = store.load_many(cursor, ['r1', 'r2'])
+    assert [item['callNo'] for item in histories['r1']] == ['C5', 'C4', 'C3', 'C2', 'C1']
+    assert histories['r2'] == []
+    assert store.sync_states(cursor, ['r1'])['r1'][0] == key(5)
+
+    cursor.close()
+    conn.close()
+    database.close()
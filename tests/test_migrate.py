@@ -0,0 +1,45 @@
+import pytest
+
+import migrate
+
+
+def test_split_statements_drops_comments_and_blank_statements():
+    sql = """
+        -- 索引
+        CREATE INDEX idx_a ON t (a);
+          -- 缩进的注释
+        ALTER TABLE t
+            ADD COLUMN b INT;
+
+        ;
+    """
+    assert migrate.split_statements(sql) == [
+        'CREATE INDEX idx_a ON t (a)',
+        'ALTER TABLE t\n            ADD COLUMN b INT',
+    ]
+    assert migrate.split_statements('-- 只有注释\n') == []
+
+
+def test_load_migrations_orders_by_version_and_ignores_other_files(tmp_path):
+    for name in ('0002_second.sql', '0001_first.sql', 'README.md', '12_bad.sql'):
+        (tmp_path / name).write_text('SELECT 1;', encoding='utf-8')
+
+    migrations = migrate.load_migrations(str(tmp_path))
+    assert [(version, name) for version, name, _ in migrations] == [(1, 'first'), (2, 'second')]
+
+
+def test_load_migrations_rejects_duplicate_versions(tmp_path):
+    (tmp_path / '0001_a.sql').write_text('', encoding='utf-8')
+    (tmp_path / '0001_b.sql').write_text('', encoding='utf-8')
+    with pytest.raises(ValueError):
+        migrate.load_migrations(str(tmp_path))
+
+
+def test_shipped_migrations_split_into_statements():
+    migrations = migrate.load_migrations()
+    assert [version for version, _, _ in migrations] == list(range(1, len(migrations) + 1))
+    for _, _, path in migrations:
+        with open(path, encoding='utf-8') as f:
+            statements = migrate.split_statements(f.read())
+        assert statements
+        assert all(not statement.startswith('--') for statement in statements)
@@ -0,0 +1,87 @@
+import pytest
+
+from app import CallNumberParser, ReaderProfileStore, ReadingHistoryProcessor
+from benchmarks.localdb import LocalDatabase
+
+
+def loan(callno, date):
+    return {'callNo': callno, 'loanDate': date, 'readerId': 'r1'}
+
+
+@pytest.fixture
+def store():
+    return ReaderProfileStore(ReadingHistoryProcessor(CallNumberParser()))
+
+
+def test_fold_into_empty_profile_counts_every_loan(store):
+    profile = store.empty_profile()
+    history = [loan('TP312/45', '2026-03-01'), loan('I247.5/1', '2026-02-01'), loan('TP311.1/2', '2026-01-01')]
+
+    assert store.fold(profile, history)
+    assert profile['class_freq'] == {'T': 2, 'I': 1}
+    assert profile['subclass_freq'] == {('T', 'TP'): 2, ('I', 'I2'): 1}
+    assert profile['loan_count'] == 3
+    assert profile['last_loan_key'] == 'TP312/45|2026-03-01'
+
+
+def test_fold_only_adds_loans_newer_than_the_watermark(store):
+    profile = store.empty_profile()
+    old = [loan('TP312/45', '2026-02-01'), loan('I247.5/1', '2026-01-01')]
+    store.fold(profile, old)
+
+    # 借阅历史最新在前：同一本书再次借阅（借阅日期不同）也算新记录
+    new = [loan('TP312/45', '2026-04-01'), loan('O13/4', '2026-03-01')] + old
+    assert store.fold(profile, new)
+    assert profile['class_freq'] == {'T': 2, 'I': 1, 'O': 1}
+    assert profile['loan_count'] == 4
+    assert profile['last_loan_key'] == 'TP312/45|2026-04-01'
+
+
+def test_fold_without_new_loans_reports_no_change(store):
+    profile = store.empty_profile()
+    history = [loan('TP312/45', '2026-02-01')]
+    store.fold(profile, history)
+    before = dict(profile)
+
+    assert not store.fold(profile, history)
+    assert not store.fold(profile, [])
+    assert profile == before
+
+
+def test_unparseable_call_numbers_advance_the_watermark(store):
+    profile = store.empty_profile()
+    assert store.fold(profile, [loan('', '2026-02-01')])
+    assert profile['class_freq'] == {}
+    assert profile['loan_count'] == 1
+    assert not store.fold(profile, [loan('', '2026-02-01')])
+
+
+def test_is_unchanged_since_push(store):
+    profile = dict(store.empty_profile(), loan_count=3)
+    assert not store.is_unchanged_since_push(profile)
+    profile.update(changed_at='2026-01-01 10:00:00', pushed_at='2026-01-02 10:00:00')
+    assert store.is_unchanged_since_push(profile)
+    profile['changed_at'] = '2026-01-03 10:00:00'
+    assert not store.is_unchanged_since_push(profile)
+
+
+def test_profiles_round_trip_through_the_database(store):
+    database = LocalDatabase()
+    conn = database.connect()
+    cursor = conn.cursor(dictionary=True)
+    profile = store.empty_profile()
+    store.fold(profile, [loan('TP312/45', '2026-02-01'), loan('I247.5/1', '2026-01-01')])
+
+    store.save_many(cursor, [('r1', profile)])
+    loaded = store.load_many(cursor, ['r1', 'r2'])
+
+    assert list(loaded) == ['r1']
+    assert loaded['r1']['class_freq'] == profile['class_freq']
+    assert loaded['r1']['subclass_freq'] == profile['subclass_freq']
+    assert loaded['r1']['last_loan_key'] == profile['last_loan_key']
+    assert loaded['r1']['loan_count'] == 2
+    assert loaded['r1']['changed_at'] is not None
+
+    cursor.close()
+    conn.close()
+    database.close()
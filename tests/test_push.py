@@ -0,0 +1,171 @@
+import threading
+import time
+import zlib
+
+import pytest
+
+import app
+from app import TokenBucket, shard_rate_limit
+from benchmarks.localdb import LocalDatabase
+
+
+@pytest.fixture
+def push_db(monkeypatch):
+    """带 readers 表的 SQLite 替身，推送相关函数的数据库连接都指向它"""
+    database = LocalDatabase()
+    database.db.create_function('CRC32', 1, lambda value: zlib.crc32(str(value).encode()))
+    database.db.execute("""
+        CREATE TABLE readers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, openid TEXT NOT NULL,
+            reader_card TEXT NOT NULL, reader_type TEXT NOT NULL
+        )
+    """)
+    database.db.executemany(
+        "INSERT INTO readers (openid, reader_card, reader_type) VALUES (?, ?, '0')",
+        [(f"openid-{i}", f"card-{i}") for i in range(45)]
+    )
+    database.db.commit()
+    monkeypatch.setattr(app, 'get_db_connection', database.connect)
+    monkeypatch.setattr(app, 'PUSH_BATCH_SIZE', 10)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def pushed(monkeypatch):
+    """记录推送过的读者证号；fail_on 中的批次序号（从 1 开始）抛出异常"""
+    state = {'cards': [], 'batches': 0, 'fail_on': set()}
+
+    def push_batch(readers, executor=None, limiter=None):
+        state['batches'] += 1
+        if state['batches'] in state['fail_on']:
+            raise RuntimeError('推送失败')
+        state['cards'].extend(reader['reader_card'] for reader in readers)
+        return len(readers)
+
+    monkeypatch.setattr(app, 'push_recommendation_batch', push_batch)
+    return state
+
+
+def checkpoint(database, run_id, shard=0):
+    return database.db.execute(
+        "SELECT last_reader_id, done FROM push_checkpoints WHERE run_id = ? AND shard = ?", (run_id, shard)
+    ).fetchone()
+
+
+def test_push_run_records_completion(push_db, pushed):
+    app.scheduled_recommendation('2026-01-01', shard_index=0, shard_count=1)
+
+    assert len(pushed['cards']) == 45
+    assert checkpoint(push_db, '2026-01-01') == (45, 1)
+
+
+def test_failed_batch_keeps_checkpoint_and_resume_sends_each_reader_once(push_db, pushed):
+    pushed['fail_on'] = {3}
+    app.scheduled_recommendation('2026-01-01', shard_index=0, shard_count=1)
+
+    # 前两批成功，第三批失败：进度停在第二批末尾，未标记完成
+    assert len(pushed['cards']) == 20
+    assert checkpoint(push_db, '2026-01-01') == (20, 0)
+
+    app.scheduled_recommendation('2026-01-01', shard_index=0, shard_count=1)
+
+    assert len(pushed['cards']) == 45
+    assert len(set(pushed['cards'])) == 45
+    assert checkpoint(push_db, '2026-01-01') == (45, 1)
+
+
+def test_database_failure_during_batch_keeps_checkpoint(push_db, monkeypatch):
+    sent = []
+    monkeypatch.setattr(app.recommender, 'create_db_connection', lambda: None)
+    monkeypatch.setattr(app, 'send_wechat_notification', lambda openid, content: sent.append(openid) or True)
+
+    app.scheduled_recommendation('2026-02-01', shard_index=0, shard_count=1)
+
+    # 推荐所需的数据库不可用：不发送、不推进进度、不标记完成，重新执行时从头开始
+    assert sent == []
+    assert checkpoint(push_db, '2026-02-01') == (0, 0)
+
+
+def test_resume_continues_unfinished_runs_of_this_shard(push_db, pushed, monkeypatch):
+    monkeypatch.setattr(app, 'PUSH_SHARD_INDEX', 0)
+    monkeypatch.setattr(app, 'PUSH_SHARD_COUNT', 1)
+    pushed['fail_on'] = {2}
+    app.scheduled_recommendation('2026-01-01')
+    app.scheduled_recommendation('2026-01-16')
+    assert app.fetch_unfinished_push_runs(0, 3) == ['2026-01-01']
+    assert app.fetch_unfinished_push_runs(1, 3) == []
+
+    app.resume_unfinished_push()
+
+    # 两轮各推送全部读者一次，中断的一轮从断点继续
+    assert sorted(pushed['cards']) == sorted([f"card-{i}" for i in range(45)] * 2)
+    assert app.fetch_unfinished_push_runs(0, 3) == []
+
+
+def test_finished_run_is_skipped(push_db, pushed):
+    app.scheduled_recommendation('2026-01-01', shard_index=0, shard_count=1)
+    app.scheduled_recommendation('2026-01-01', shard_index=0, shard_count=1)
+
+    assert len(pushed['cards']) == 45
+
+
+def test_new_run_id_starts_from_the_beginning(push_db, pushed):
+    app.scheduled_recommendation('2026-01-01', shard_index=0, shard_count=1)
+    app.scheduled_recommendation('2026-01-16', shard_index=0, shard_count=1)
+
+    assert len(pushed['cards']) == 90
+
+
+def test_shards_cover_every_reader_exactly_once(push_db, pushed):
+    for shard_index in range(3):
+        app.scheduled_recommendation('2026-01-01', shard_index=shard_index, shard_count=3)
+
+    assert sorted(pushed['cards']) == sorted(f"card-{i}" for i in range(45))
+    for shard_index in range(3):
+        assert checkpoint(push_db, '2026-01-01', shard_index)[1] == 1
+
+
+def test_concurrent_run_is_skipped_when_not_waiting(push_db, pushed):
+    with app.push_run_lock:
+        app.scheduled_recommendation('2026-01-01', wait=False)
+    assert pushed['cards'] == []
+    assert checkpoint(push_db, '2026-01-01') is None
+
+
+def test_shard_rate_limit_splits_the_global_quota(monkeypatch):
+    monkeypatch.setattr(app, 'PUSH_RATE_LIMIT', 30.0)
+    assert shard_rate_limit(1) == 30.0
+    assert shard_rate_limit(3) == 10.0
+    assert shard_rate_limit(0) == 30.0
+
+
+def test_token_bucket_limits_rate_across_threads():
+    bucket = TokenBucket(rate=50, capacity=1)
+    acquired = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            bucket.acquire()
+            with lock:
+                acquired.append(time.monotonic())
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 20 个令牌，初始 1 个，其余按每秒 50 个补充：至少约 0.38 秒
+    assert len(acquired) == 20
+    assert time.monotonic() - start >= 19 / 50 * 0.9
+
+
+def test_token_bucket_allows_initial_burst():
+    bucket = TokenBucket(rate=1, capacity=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.5
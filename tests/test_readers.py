@@ -0,0 +1,36 @@
+import pytest
+
+import app
+from benchmarks.localdb import LocalDatabase
+
+
+@pytest.fixture
+def readers_db(monkeypatch):
+    database = LocalDatabase()
+    database.db.execute("""
+        CREATE TABLE readers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, openid TEXT NOT NULL,
+            reader_card TEXT NOT NULL, reader_type TEXT NOT NULL
+        )
+    """)
+    database.db.execute("INSERT INTO readers (id, openid, reader_card, reader_type) VALUES (7, 'o1', 'card-1', '0')")
+    database.db.commit()
+    monkeypatch.setattr(app, 'get_db_connection', database.connect)
+    app.reader_ids_by_card.clear()
+    yield database
+    app.reader_ids_by_card.clear()
+    database.close()
+
+
+def test_fresh_reader_id_ignores_stale_cache(readers_db):
+    # 其他进程重新绑定后，本进程缓存中仍是已删除的旧 id
+    app.reader_ids_by_card.set('card-1', 3)
+    assert app.get_reader_id('card-1') == 3
+    assert app.get_reader_id('card-1', fresh=True) == 7
+    assert app.get_reader_id('card-1') == 7
+
+
+def test_fresh_lookup_of_unbound_card_drops_cache_entry(readers_db):
+    app.reader_ids_by_card.set('card-2', 9)
+    assert app.get_reader_id('card-2', fresh=True) is None
+    assert app.reader_ids_by_card.get('card-2') is None
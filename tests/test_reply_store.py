@@ -0,0 +1,64 @@
+import multiprocessing
+import time
+
+import pytest
+
+from session_store import MemoryReplyStore, SQLiteReplyStore, open_reply_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def reply_store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryReplyStore(ttl=30)
+    return SQLiteReplyStore(str(tmp_path / 'sessions.db'), ttl=30)
+
+
+def test_reply_store_claims_each_message_once(reply_store):
+    assert reply_store.claim('m1')
+    assert not reply_store.claim('m1')
+    assert reply_store.get('m1') == (False, None)
+
+    reply_store.complete('m1', 'hello')
+    assert reply_store.get('m1') == (True, 'hello')
+    assert not reply_store.claim('m1')
+
+
+def test_reply_store_release_allows_retry(reply_store):
+    assert reply_store.claim('m1')
+    reply_store.release('m1')
+    assert reply_store.get('m1') == (False, None)
+    assert reply_store.claim('m1')
+
+
+def test_reply_claim_expires(tmp_path):
+    for store in (MemoryReplyStore(ttl=0.05), SQLiteReplyStore(str(tmp_path / 'r.db'), ttl=0.05)):
+        assert store.claim('m1')
+        time.sleep(0.06)
+        assert store.get('m1') == (False, None)
+        assert store.claim('m1')
+
+
+def claim_in_child(path, results):
+    results.put(SQLiteReplyStore(path, ttl=30).claim('msg'))
+
+
+def test_sqlite_reply_store_claim_is_exclusive_across_processes(tmp_path):
+    path = str(tmp_path / 'replies.db')
+    SQLiteReplyStore(path)  # 先建表
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=claim_in_child, args=(path, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+
+    claims = [results.get(timeout=5) for _ in processes]
+    assert claims.count(True) == 1
+
+
+def test_open_reply_store_by_spec(tmp_path):
+    assert isinstance(open_reply_store('memory'), MemoryReplyStore)
+    assert isinstance(open_reply_store(f"sqlite:{tmp_path / 'sessions.db'}"), SQLiteReplyStore)
+    with pytest.raises(ValueError):
+        open_reply_store('redis')
@@ -0,0 +1,131 @@
+import multiprocessing
+import sqlite3
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore, open_session_store
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def session_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == 'memory':
+            return MemorySessionStore(**kwargs)
+        return SQLiteSessionStore(str(tmp_path / 'sessions.db'), purge_interval=0, **kwargs)
+    return make
+
+
+def test_session_state_round_trip(session_store):
+    store = session_store(ttl=60)
+    assert store.get_state('o1') is None
+    store.set_state('o1', 'bind')
+    assert store.get_state('o1') == 'bind'
+    store.clear('o1')
+    assert store.get_state('o1') is None
+
+
+def test_session_state_expires(session_store):
+    store = session_store(ttl=0.05)
+    store.set_state('o1', 'bind')
+    time.sleep(0.06)
+    assert store.get_state('o1') is None
+
+
+def test_reads_renew_sessions_but_not_caches(session_store):
+    sessions = session_store(ttl=0.3)
+    sessions.set_state('o1', 'bind')
+    time.sleep(0.2)
+    assert sessions.get_state('o1') == 'bind'
+    time.sleep(0.2)
+    assert sessions.get_state('o1') == 'bind'
+
+    cache = session_store(ttl=0.3, renew=False)
+    cache.set_state('o2', 'reply')
+    time.sleep(0.2)
+    assert cache.get_state('o2') == 'reply'
+    time.sleep(0.2)
+    assert cache.get_state('o2') is None
+
+
+def test_session_store_evicts_beyond_maxsize(session_store):
+    store = session_store(ttl=60, maxsize=2)
+    for openid in ('o1', 'o2', 'o3'):
+        store.set_state(openid, 'x')
+        time.sleep(0.01)
+    # 写入时触发清理
+    store.set_state('o3', 'x')
+    assert store.get_state('o1') is None
+    assert store.get_state('o3') == 'x'
+
+
+def test_cache_evicts_least_recently_used_without_renewing(session_store):
+    cache = session_store(ttl=60, maxsize=2, renew=False)
+    cache.set_state('o1', 'x')
+    time.sleep(0.01)
+    cache.set_state('o2', 'x')
+    time.sleep(0.01)
+    # 读取不续期，但 o1 成为最近使用的记录，超量时淘汰 o2
+    assert cache.get_state('o1') == 'x'
+    time.sleep(0.01)
+    cache.set_state('o3', 'x')
+    cache.set_state('o3', 'x')
+    assert cache.get_state('o2') is None
+    assert cache.get_state('o1') == 'x'
+    assert cache.get_state('o3') == 'x'
+
+
+def test_session_store_counts_hits_and_misses(session_store):
+    cache = session_store(ttl=60, renew=False)
+    cache.set_state('o1', 'x')
+    cache.get_state('o1')
+    cache.get_state('o1')
+    cache.get_state('o2')
+    assert cache.stats() == {'size': 1, 'hits': 2, 'misses': 1}
+
+
+def test_sqlite_session_store_upgrades_table_without_last_used(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE recommendation_cache (openid TEXT PRIMARY KEY, state TEXT NOT NULL, expires_at REAL NOT NULL)")
+    conn.execute("INSERT INTO recommendation_cache VALUES ('o1', 'old', ?)", (time.time() + 60,))
+    conn.commit()
+    conn.close()
+
+    cache = SQLiteSessionStore(path, ttl=60, table='recommendation_cache', renew=False)
+    assert cache.get_state('o1') == 'old'
+    cache.set_state('o2', 'new')
+    assert cache.get_state('o2') == 'new'
+
+
+def set_state_in_child(path, openid, state):
+    SQLiteSessionStore(path, ttl=60).set_state(openid, state)
+
+
+def test_sqlite_sessions_are_shared_across_processes(tmp_path):
+    # 绑定流程的两条消息可能落到不同的 worker
+    path = str(tmp_path / 'sessions.db')
+    store = SQLiteSessionStore(path, ttl=60)
+    process = multiprocessing.get_context('spawn').Process(target=set_state_in_child, args=(path, 'o1', 'bind'))
+    process.start()
+    process.join(30)
+
+    assert store.get_state('o1') == 'bind'
+    SQLiteSessionStore(path, ttl=60).clear('o1')
+    assert store.get_state('o1') is None
+
+
+def test_sqlite_tables_are_independent(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+    sessions = SQLiteSessionStore(path, ttl=60)
+    cache = SQLiteSessionStore(path, ttl=60, table='recommendation_cache', renew=False)
+    sessions.set_state('o1', 'bind')
+    assert cache.get_state('o1') is None
+
+
+def test_open_store_by_spec(tmp_path):
+    assert isinstance(open_session_store('memory'), MemorySessionStore)
+    spec = f"sqlite:{tmp_path / 'sessions.db'}"
+    assert isinstance(open_session_store(spec), SQLiteSessionStore)
+    with pytest.raises(ValueError):
+        open_session_store('redis')
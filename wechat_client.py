@@ -0,0 +1,188 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，令牌文件只在进程内加锁
+    fcntl = None
+
+# 加载环境变量
+load_dotenv()
+
+API_BASE = "https://api.weixin.qq.com"
+# access_token 失效的错误码
+TOKEN_ERRCODES = (40001, 40014, 42001)
+
+
+class TokenStore:
+    """
+    access_token 的文件存储，多个 gunicorn worker 共享同一个令牌
+    读写和刷新都在文件锁内进行，保证同一时刻只有一个进程向微信申请新令牌
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @contextmanager
+    def locked(self):
+        with open(f"{self.path}.lock", 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self):
+        """返回 (token, 过期时间戳)，没有或损坏时返回 (None, 0)"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            return data['access_token'], data['expires_at']
+        except (OSError, ValueError, KeyError):
+            return None, 0
+
+    def write(self, token, expires_at):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'access_token': token, 'expires_at': expires_at}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self, token):
+        """令牌被微信判定失效时删除（仅当文件中仍是该令牌）"""
+        if self.read()[0] == token:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class WeChatClient:
+    """
+    微信公众号接口客户端
+    access_token 缓存到 expires_in 之前 margin 秒，进程内和进程间都只有一个请求负责刷新；
+    客服消息、菜单创建和网页授权共用一个带连接池的 requests.Session。
+    """
+
+    def __init__(self, appid, secret, token_path=None, pool_size=None, timeout=None, margin=None):
+        self.appid = appid
+        self.secret = secret
+        self.timeout = timeout or float(os.getenv('WECHAT_TIMEOUT', 5))
+        self.margin = margin if margin is not None else int(os.getenv('WECHAT_TOKEN_MARGIN', 300))
+        self.store = TokenStore(token_path or os.getenv(
+            'WECHAT_TOKEN_FILE', os.path.join(tempfile.gettempdir(), 'wechat_access_token.json')
+        ))
+        self.token = None
+        self.expires_at = 0
+        self.lock = threading.Lock()
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or int(os.getenv('WECHAT_POOL_SIZE', 10)))
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+
+    # ---------------------- access_token ----------------------
+    def access_token(self):
+        """获取有效的 access_token，失败时返回 None"""
+        if self.token and time.time() < self.expires_at:
+            return self.token
+
+        with self.lock:
+            # 等锁期间其他线程可能已经刷新
+            if self.token and time.time() < self.expires_at:
+                return self.token
+
+            with self.store.locked():
+                token, expires_at = self.store.read()
+                if not token or time.time() >= expires_at:
+                    token, expires_at = self.fetch_token()
+                    if not token:
+                        return None
+                    self.store.write(token, expires_at)
+
+            self.token, self.expires_at = token, expires_at
+            return token
+
+    def fetch_token(self):
+        if not self.appid or not self.secret:
+            print("未配置微信公众号凭证")
+            return None, 0
+
+        try:
+            response = self.session.get(f"{API_BASE}/cgi-bin/token", params={
+                'grant_type': 'client_credential',
+                'appid': self.appid,
+                'secret': self.secret
+            }, timeout=self.timeout)
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"获取微信访问令牌失败: {str(e)}")
+            return None, 0
+
+        if not data.get('access_token'):
+            print(f"获取微信访问令牌失败: {data}")
+            return None, 0
+        return data['access_token'], time.time() + int(data.get('expires_in', 7200)) - self.margin
+
+    def invalidate(self, token):
+        with self.lock:
+            if self.token == token:
+                self.token, self.expires_at = None, 0
+            with self.store.locked():
+                self.store.clear(token)
+
+    # ---------------------- 接口调用 ----------------------
+    def post_json(self, path, payload):
+        """
+        带 access_token 调用接口，令牌失效时刷新后重试一次
+        返回微信的响应 JSON；拿不到令牌时返回 None，网络异常向上抛出
+        """
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        for attempt in range(2):
+            token = self.access_token()
+            if not token:
+                return None
+
+            response = self.session.post(
+                f"{API_BASE}{path}",
+                params={'access_token': token},
+                data=body,
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+            result = response.json()
+            if result.get('errcode') in TOKEN_ERRCODES and attempt == 0:
+                self.invalidate(token)
+                continue
+            return result
+
+    def send_text(self, openid, content):
+        """发送文本客服消息，返回微信的响应 JSON"""
+        return self.post_json('/cgi-bin/message/custom/send', {
+            "touser": openid,
+            "msgtype": "text",
+            "text": {
+                "content": content
+            }
+        })
+
+    def create_menu(self, menu_data):
+        return self.post_json('/cgi-bin/menu/create', menu_data)
+
+    def oauth_access_token(self, code):
+        """网页授权：用 code 换取 openid 和网页 access_token"""
+        response = self.session.get(f"{API_BASE}/sns/oauth2/access_token", params={
+            'appid': self.appid,
+            'secret': self.secret,
+            'code': code,
+            'grant_type': 'authorization_code'
+        }, timeout=self.timeout)
+        return response.json()